@@ -0,0 +1,283 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+from timeit import default_timer
+import numpy as np
+import cache
+import cashflow
+import renter
+import store
+import sweep
+from data import renterData
+
+BENCHMARK_REPEAT = 5 # timed passes per benchmark, the fastest one is reported
+BENCHMARK_BASELINE_FILE = 'benchmark_baseline.json'
+BENCHMARK_REGRESSION_THRESHOLD = 0.10 # a latency more than 10% above the baseline is a regression
+
+# Realistic parameter grids, the ranges the competition model is evaluated on
+BENCHMARK_RENTER_EXIT_YEARS = range(2, 11)
+BENCHMARK_SELL_YEARS = range(1, 13)
+BENCHMARK_CAP_RATES = (0.05, 0.055, 0.06, 0.08)
+BENCHMARK_TERMS = range(1, 21) # lease terms (in year) Renter.recompute is timed on
+BENCHMARK_IMPORT_MODULES = ('numpy', 'cashflow', 'sweep') # modules whose import is timed, numpy is the floor
+
+"""
+    function: getDataTenants
+    ========================
+    Build a fresh Renter for each of the three tenants of data.renterData.
+"""
+def getDataTenants():
+    return [renter.getRecordRenter(name, record, cashflow.CAP_RATE) for name, record in sorted(renterData.items())]
+
+"""
+    function: getValidCalls
+    =======================
+    Keep the calls of the grid that do not raise (e.g. Lender B needs a yearExit of at least 4).
+"""
+def getValidCalls(calls):
+    valid = []
+    for call in calls:
+        try:
+            call()
+        except Exception:
+            continue
+        valid.append(call)
+    return valid
+
+def xirrCalls():
+    calls = []
+    for buildCashFlows in sorted(set(cashflow.OUTCOME_CASH_FLOWS.values()), key=lambda f: f.__name__):
+        if buildCashFlows.__name__.startswith('topshop'):
+            grid = [(r, s, cashflow.CAP_RATE) for r in BENCHMARK_RENTER_EXIT_YEARS for s in BENCHMARK_SELL_YEARS]
+        else:
+            grid = [(s, cashflow.CAP_RATE) for s in BENCHMARK_SELL_YEARS]
+        for args in grid:
+            try:
+                rows = buildCashFlows(*args)
+            except Exception:
+                continue
+            for _, cashFlow, transactionDate in rows:
+                if transactionDate is None:
+                    transactionDate = renter.getTransactionDates(renter.FIRST_TRANSACTION_DATE, len(cashFlow))
+                transactions = zip(transactionDate, cashFlow)
+                calls.append(lambda transactions=transactions: renter.xirr(transactions))
+    return calls
+
+def recomputeCalls():
+    calls = []
+    for tenant in getDataTenants():
+        for term in BENCHMARK_TERMS:
+            copy = renter.Renter(*tenant.getInputs())
+            copy.setTerm(term)
+            calls.append(copy.recompute)
+    return calls
+
+def lenderCalls(getNetCashFlow, getLeveragedCashFlow):
+    calls = []
+    for tenant in getDataTenants():
+        cashFlowBeforeDebtService = tenant.getCashFlowBeforeDebtService()
+        netOperatingIncome = tenant.getNetOperatingIncome()
+        for yearExit in xrange(1, tenant.getTerm() + 1):
+            for capRate in BENCHMARK_CAP_RATES:
+                def call(term=tenant.getTerm(), cf=cashFlowBeforeDebtService, noi=netOperatingIncome, yearExit=yearExit, capRate=capRate):
+                    netCashFlow, DCSR = getNetCashFlow(term, cf, noi, yearExit=yearExit)
+                    return getLeveragedCashFlow(netCashFlow, noi, capRate, yearExit)
+                calls.append(call)
+    return calls
+
+def outcomeCalls(outcome):
+    if outcome.__name__.startswith('topshop'):
+        grid = [(r, s, c) for r in BENCHMARK_RENTER_EXIT_YEARS for s in BENCHMARK_SELL_YEARS for c in BENCHMARK_CAP_RATES]
+    else:
+        grid = [(s, c) for s in BENCHMARK_SELL_YEARS for c in BENCHMARK_CAP_RATES[:3]]
+    return [lambda args=args: outcome(*args) for args in grid]
+
+"""
+    function: importCalls
+    =====================
+    A single call starting a fresh interpreter that imports module, i.e. the startup cost of a
+    worker process. The interpreter startup itself is included.
+"""
+def importCalls(module):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    return [lambda: subprocess.check_call([sys.executable, '-c', 'import ' + module], cwd=directory)]
+
+# Name and grid builder of every benchmark, in the order they run
+BENCHMARKS = [
+    ('renter.xirr', xirrCalls),
+    ('Renter.recompute', recomputeCalls),
+    ('renter.lenderA', lambda: lenderCalls(renter.getNetCashFlowLenderA, renter.getLeveragedCashFlowLenderA)),
+    ('renter.lenderB', lambda: lenderCalls(renter.getNetCashFlowLenderB, renter.getLeveragedCashFlowLenderB)),
+] + [('cashflow.' + outcome.__name__, lambda outcome=outcome: outcomeCalls(outcome))
+     for outcome in sorted(cashflow.OUTCOME_CASH_FLOWS, key=lambda f: f.__name__)] + [
+    ('import.' + module, lambda module=module: importCalls(module)) for module in BENCHMARK_IMPORT_MODULES]
+
+"""
+    function: timeBenchmark
+    =======================
+    Run one benchmark of BENCHMARKS. Every pass starts from empty caches (cache.clearAll), so
+    the figures are those of a cold call and not of a cache lookup.
+
+    Return a dict with
+
+    calls = number of calls per pass
+    latency = seconds per call of the fastest pass
+    medianLatency = seconds per call of the median pass
+    throughput = calls per second of the fastest pass
+    peakMemoryKb = growth of the peak resident memory while running, in kilobytes
+"""
+def timeBenchmark(makeCalls, repeat=BENCHMARK_REPEAT):
+    startMemory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    calls = getValidCalls(makeCalls())
+    passes = []
+    for _ in xrange(repeat):
+        cache.clearAll()
+        start = default_timer()
+        for call in calls: call()
+        passes.append(default_timer() - start)
+    peakMemory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    n = max(len(calls), 1)
+    return {'calls': len(calls),
+            'latency': min(passes)/n,
+            'medianLatency': float(np.median(passes))/n,
+            'throughput': n/min(passes) if min(passes) > 0 else float('inf'),
+            'peakMemoryKb': peakMemory - startMemory}
+
+def runInChild(index, repeat, connection):
+    connection.send(timeBenchmark(BENCHMARKS[index][1], repeat))
+    connection.close()
+
+"""
+    function: runBenchmarks
+    =======================
+    Run the benchmarks whose name contains pattern (all of them by default), each in its own
+    process so that its peak memory is not hidden by the benchmarks before it.
+    Return a dict with the environment and the timings by benchmark name.
+"""
+def runBenchmarks(pattern='', repeat=BENCHMARK_REPEAT):
+    results = {}
+    for index, (name, _) in enumerate(BENCHMARKS):
+        if pattern not in name: continue
+        parentConnection, childConnection = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=runInChild, args=(index, repeat, childConnection))
+        process.start()
+        results[name] = parentConnection.recv()
+        process.join()
+        print "%-40s %8d calls %12.1f us/call %12.0f calls/s %8d kB" % (
+            name, results[name]['calls'], results[name]['latency']*1e6, results[name]['throughput'], results[name]['peakMemoryKb'])
+    return {'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                            'machine': platform.machine(), 'system': platform.system(), 'repeat': repeat},
+            'benchmarks': results}
+
+"""
+    function: checkStoreRerun
+    =========================
+    Sweep every outcome function over the benchmark grid twice into a fresh store.ResultStore,
+    reopened and with another Topshop term and other cap rates of the module renters set by
+    the outcome functions in between, and assert that the second sweep reads every cell from
+    the store.
+"""
+def checkStoreRerun():
+    directory = tempfile.mkdtemp()
+    try:
+        for outcome in sorted(cashflow.OUTCOME_CASH_FLOWS, key=lambda f: f.__name__):
+            renterExitYears = BENCHMARK_RENTER_EXIT_YEARS if sweep.getParameterCount(cashflow.OUTCOME_CASH_FLOWS[outcome]) == 3 else None
+            resultStore = store.ResultStore(os.path.join(directory, outcome.__name__))
+            cashflow.topshopLenderAOutcome(3, 9, 0.05)
+            cashflow.zaraUnleveragedOutcome(5, 0.05)
+            cashflow.decathlonUnleveragedOutcome(5, 0.05)
+            first = sweep.sweep(outcome, BENCHMARK_SELL_YEARS, BENCHMARK_CAP_RATES, renterExitYears, store=resultStore)
+            size = resultStore.getStats()['size']
+            resultStore.close()
+            resultStore = store.ResultStore(os.path.join(directory, outcome.__name__))
+            cashflow.topshopLenderAOutcome(5, 9, 0.07)
+            cashflow.zaraUnleveragedOutcome(5, 0.07)
+            cashflow.decathlonUnleveragedOutcome(5, 0.07)
+            second = sweep.sweep(outcome, BENCHMARK_SELL_YEARS, BENCHMARK_CAP_RATES, renterExitYears, store=resultStore)
+            assert resultStore.getStats()['misses'] == 0, "%s re-run missed the store" % outcome.__name__
+            assert resultStore.getStats()['size'] == size, "%s re-run grew the store" % outcome.__name__
+            unchanged = (first.getValues() == second.getValues()) | (np.isnan(first.getValues()) & np.isnan(second.getValues()))
+            assert unchanged.all(), "%s re-run changed" % outcome.__name__
+            resultStore.close()
+            print "%-40s %8d cells re-read" % (outcome.__name__, size)
+    finally:
+        shutil.rmtree(directory)
+
+"""
+    function: compareBenchmarks
+    ===========================
+    Print the latency ratio current/baseline of every benchmark in current.
+    Return the names of the benchmarks slower than the baseline by more than threshold.
+"""
+def compareBenchmarks(baseline, current, threshold=BENCHMARK_REGRESSION_THRESHOLD):
+    regressions = []
+    print "%-40s %14s %14s %8s" % ('benchmark', 'baseline us', 'current us', 'ratio')
+    for name in sorted(current['benchmarks']):
+        if name not in baseline['benchmarks']:
+            print "%-40s %s" % (name, 'not in baseline')
+            continue
+        before = baseline['benchmarks'][name]['latency']
+        after = current['benchmarks'][name]['latency']
+        ratio = after/before if before > 0 else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = 'faster'
+        print "%-40s %14.1f %14.1f %8.2f %s" % (name, before*1e6, after*1e6, ratio, flag)
+    return regressions
+
+def loadResults(path):
+    with open(path) as f:
+        return json.load(f)
+
+def saveResults(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+"""
+    Usage:
+
+        python benchmark.py run [-o benchmark_baseline.json] [-k lenderA]
+        python benchmark.py compare benchmark_baseline.json [current.json]
+        python benchmark.py check
+
+    compare runs the benchmarks when no current file is given, and exits with status 1 when a
+    benchmark regressed.
+"""
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the cash flow model')
+    subparsers = parser.add_subparsers(dest='command')
+    runParser = subparsers.add_parser('run', help='run the benchmarks and save the results')
+    runParser.add_argument('-o', '--output', default=BENCHMARK_BASELINE_FILE)
+    runParser.add_argument('-k', '--pattern', default='')
+    runParser.add_argument('-r', '--repeat', type=int, default=BENCHMARK_REPEAT)
+    compareParser = subparsers.add_parser('compare', help='compare results against a baseline')
+    compareParser.add_argument('baseline')
+    compareParser.add_argument('current', nargs='?')
+    compareParser.add_argument('-k', '--pattern', default='')
+    compareParser.add_argument('-r', '--repeat', type=int, default=BENCHMARK_REPEAT)
+    compareParser.add_argument('-t', '--threshold', type=float, default=BENCHMARK_REGRESSION_THRESHOLD)
+    subparsers.add_parser('check', help='check that a re-run sweep reads every cell from the store')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        saveResults(runBenchmarks(args.pattern, args.repeat), args.output)
+        return 0
+    if args.command == 'check':
+        checkStoreRerun()
+        return 0
+    baseline = loadResults(args.baseline)
+    current = loadResults(args.current) if args.current else runBenchmarks(args.pattern, args.repeat)
+    return 1 if compareBenchmarks(baseline, current, args.threshold) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
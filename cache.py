@@ -0,0 +1,121 @@
+from collections import OrderedDict
+from functools import wraps
+
+# Every LRUCache by name, for getStats and clearAll
+CACHES = OrderedDict()
+
+# Marker for a key that is not in the cache, since None can be a cached value
+CACHE_MISS = object()
+
+"""
+    class: LRUCache
+    ===============
+    class LRUCache is a bounded memoization table that evicts the least recently used entry
+    once it holds more than maxSize entries, and counts its hits, misses and evictions.
+    This class requires 2 inputs
+
+    1. name                        Name the cache is registered under in CACHES
+    2. maxSize                     Maximum number of entries
+"""
+class LRUCache(object):
+
+    def __init__(self, name, maxSize):
+        self.name = name
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        CACHES[name] = self
+
+    """ GET FUNCTIONS """
+    def getName(self): return self.name
+    def getMaxSize(self): return self.maxSize
+    def getStats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self.entries), 'maxSize': self.maxSize}
+
+    """ SET FUNCTIONS """
+    def setMaxSize(self, maxSize):
+        self.maxSize = maxSize
+        self.evict()
+
+    """
+        class function: get
+        ===================
+        Return the value stored under key, or default if there is none. A hit makes the entry
+        the most recently used one.
+    """
+    def get(self, key, default=None):
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        self.evict()
+
+    def evict(self):
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+"""
+    function: freeze
+    ================
+    Turn a value into a hashable cache key: lists and tuples become tuples of frozen values.
+"""
+def freeze(value):
+    if isinstance(value, (list, tuple)): return tuple(freeze(v) for v in value)
+    return value
+
+"""
+    function: thaw
+    ==============
+    Copy a cached value so that callers can mutate it: lists are copied, tuples are rebuilt
+    around copies of their items.
+"""
+def thaw(value):
+    if isinstance(value, list): return [thaw(v) for v in value]
+    if isinstance(value, tuple): return tuple(thaw(v) for v in value)
+    return value
+
+"""
+    function: memoize
+    =================
+    Decorator caching a pure function in the given LRUCache. The key is built from the
+    function name, the positional and keyword arguments (lists are frozen into tuples) and,
+    when given, the value of extraKey() at call time for state the arguments do not carry.
+    Every call returns a fresh copy of the lists in the cached result.
+"""
+def memoize(lruCache, extraKey=None):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            key = (function.__name__, freeze(args), freeze(sorted(kwargs.items())),
+                   extraKey() if extraKey is not None else None)
+            result = lruCache.get(key, CACHE_MISS)
+            if result is CACHE_MISS:
+                result = function(*args, **kwargs)
+                lruCache.put(key, thaw(result))
+            return thaw(result)
+        return wrapper
+    return decorator
+
+def getStats():
+    return dict((name, lruCache.getStats()) for name, lruCache in CACHES.items())
+
+def clearAll():
+    for lruCache in CACHES.values(): lruCache.clear()
@@ -1,8 +1,9 @@
-from scipy.stats import poisson
 from datetime import date
 from copy import deepcopy
-from math import ceil
-from numpy import pv
+from math import ceil, exp, factorial
+import numpy as np
+import cache
+import loan
 import renter
 
 # Assumption on future tenant
@@ -19,17 +20,162 @@ POISSON_EMPTY_MEAN = 4
 POISSON_EMPTY_LOWER_TRUNCATE = 2
 POISSON_EMPTY_UPPER_TRUNCATE = 8
 
+"""
+    function: truncated_poisson
+    ===========================
+    Return the vacancy distribution, in quarters, from the closed form of the Poisson pmf
+    exp(-mean)*mean**i/i!, so importing this module does not load scipy.stats.
+"""
 def truncated_poisson():
-    poisson_dist = poisson(POISSON_EMPTY_MEAN)
-    probs = [poisson_dist.pmf(i) for i in xrange(POISSON_EMPTY_UPPER_TRUNCATE)]
+    probs = [exp(-POISSON_EMPTY_MEAN)*POISSON_EMPTY_MEAN**i/float(factorial(i)) for i in xrange(POISSON_EMPTY_UPPER_TRUNCATE)]
     return {0: sum(probs[0:3]), 1: probs[3], 2: probs[4], 3: probs[5], 4: probs[6], 5: probs[7], 6: 1 - sum(probs)}
 
 POISSON_EMPTY_DIST = truncated_poisson()
 
+# Cache Sizes
+OUTCOME_CACHE_SIZE = 100000
+FUTURE_TENANT_CASH_FLOW_CACHE_SIZE = 1024
+
+OUTCOME_CACHE = cache.LRUCache('outcome', OUTCOME_CACHE_SIZE)
+FUTURE_TENANT_CASH_FLOW_CACHE = cache.LRUCache('futureTenantCashFlow', FUTURE_TENANT_CASH_FLOW_CACHE_SIZE)
+
+"""
+    function: getAssumptions
+    ========================
+    Return the module assumptions of this file and renter.py as a tuple, part of every
+    cache key so that changing a constant at runtime never serves a stale result.
+"""
+def getAssumptions():
+    return (INITIAL_RENT_PER_SQM_AT_2015, ANNUAL_INCREASE, IS_GUARANTEE, ABATEMENT, TI, CAP_RATE, FUTURE_TERM,
+            tuple(sorted(POISSON_EMPTY_DIST.items()))) + renter.getAssumptions()
+
 topshop = renter.topshop
 zara = renter.zara
 decathlon = renter.decathlon
 
+"""
+    class: FutureTermError
+    ======================
+    Raised when a Topshop scenario is sold more than FUTURE_TERM years after Topshop leaves:
+    the future tenant has no cash flow past its lease, so the scenario cannot be built. Callers
+    evaluating a grid catch it to leave such scenarios out.
+"""
+class FutureTermError(ValueError):
+    pass
+
+"""
+    function: checkFutureTerm
+    =========================
+    Raise FutureTermError, naming the scenario, when sell_year is more than FUTURE_TERM years
+    after renter_exit_year.
+"""
+def checkFutureTerm(renter_exit_year, sell_year):
+    if sell_year - renter_exit_year > FUTURE_TERM:
+        raise FutureTermError("(renter_exit_year, sell_year) = (%d, %d): sell_year must be at most FUTURE_TERM = %d years after renter_exit_year"
+                              % (renter_exit_year, sell_year, FUTURE_TERM))
+
+"""
+    function: getFutureTenantInputs
+    ===============================
+    Return the renter.RenterSpec of the hypothetical tenant moving in yearsFrom2015 years after
+    July 2015, at the market rent of that date.
+"""
+def getFutureTenantInputs(yearsFrom2015):
+    return renter.RenterSpec('unknown', INITIAL_RENT_PER_SQM_AT_2015 * (1 + ANNUAL_INCREASE)**yearsFrom2015,
+                             FUTURE_TERM, ANNUAL_INCREASE, IS_GUARANTEE, ABATEMENT, TI, CAP_RATE)
+
+"""
+    function: getFutureTenantCashFlow
+    =================================
+    Compute the unleveraged cash flow of a future tenant built from renterInputs and sold
+    at yearExit. Results are memoized in FUTURE_TENANT_CASH_FLOW_CACHE, and the schedules of
+    the tenant are shared by every yearExit through renter.internRenter.
+"""
+@cache.memoize(FUTURE_TENANT_CASH_FLOW_CACHE, renter.getAssumptions)
+def getFutureTenantCashFlow(renterInputs, yearExit):
+    randomRenter = renter.internRenter(renterInputs)
+    return renter.getCashFlowFutureUnleveraged(cashFlowBeforeDebtService=randomRenter.getCashFlowBeforeDebtService(),
+                                               netOperatingIncome=randomRenter.getNetOperatingIncome(),
+                                               capRate=randomRenter.getCapRate(),
+                                               yearExit=yearExit)
+
+"""
+    function: computeOutcome
+    ========================
+    Compute the probability-weighted IRR and equity multiple of a scenario.
+    This function requires the rows returned by one of the *CashFlows functions below
+
+        [(probability1, cashFlow1, transactionDate1), (probability2, cashFlow2, transactionDate2), ...]
+
+    where transactionDate is None for the default yearly dates starting in July 2015.
+    All rows go through renter.computeMetricsBatch at once. An IRR that does not converge is nan.
+"""
+def computeOutcome(rows):
+    probs = [prob for prob, _, _ in rows]
+    metrics = renter.computeMetricsBatch([cashFlow for _, cashFlow, _ in rows], [transactionDate for _, _, transactionDate in rows])
+    return tuple(float(value) for value in np.dot(probs, metrics))
+
+"""
+    function: computeCachedOutcome
+    ==============================
+    Compute computeOutcome(buildCashFlows(*args)) through OUTCOME_CACHE. The key holds the
+    current inputs of tenant, so mutating it through its setters never serves a stale result.
+"""
+def computeCachedOutcome(tenant, buildCashFlows, args):
+    key = (buildCashFlows.__name__, args, tenant.getInputs(), getAssumptions())
+    outcome = OUTCOME_CACHE.get(key)
+    if outcome is None:
+        outcome = computeOutcome(buildCashFlows(*args))
+        OUTCOME_CACHE.put(key, outcome)
+    return outcome
+
+"""
+    function: topshopUnleveragedCashFlows
+    =====================================
+    Build the weighted cash flow rows for Topshop in the unleveraged case. When the building
+    is sold after Topshop leaves, one row is built per vacancy length in POISSON_EMPTY_DIST.
+"""
+def topshopUnleveragedCashFlows(renter_exit_year, sell_year, capRate, tenant=None):
+    if tenant is None: tenant = topshop
+    if tenant.getTerm() != renter_exit_year: tenant.setTerm(renter_exit_year)
+
+    if sell_year <= renter_exit_year:
+        topshopCashFlow = renter.getCashFlowUnleveraged(cashFlowBeforeDebtService=tenant.getCashFlowBeforeDebtService(),
+                                                        netOperatingIncome=tenant.getNetOperatingIncome(),
+                                                        capRate=capRate, yearExit=sell_year)
+        return [(1, topshopCashFlow, None)]
+    checkFutureTerm(renter_exit_year, sell_year)
+
+    topshopCashFlow = renter.getCashFlowUnleveraged(cashFlowBeforeDebtService=tenant.getCashFlowBeforeDebtService(),
+                                                    netOperatingIncome=tenant.getNetOperatingIncome(),
+                                                    capRate=capRate)
+
+    topshop_transaction_date = renter.getTransactionDates(renter.FIRST_TRANSACTION_DATE, renter_exit_year)
+
+    rows = []
+    for q in POISSON_EMPTY_DIST:
+        prob = POISSON_EMPTY_DIST[q]
+        topshopCashFlowCopy = deepcopy(topshopCashFlow)
+        maintentanceCost = 3*q/12.0*tenant.getOperatingExpense()[-1]*tenant.getAnnualIncrease()
+        topshopCashFlowCopy.append(maintentanceCost)
+        nextTransactionYear = 2015 + renter_exit_year + (3*q + 7)/12
+        nextTransactionMonth = (7 + 3*q) % 12
+        futureTerm = max(1, sell_year - renter_exit_year - int(ceil(3*q/12)))
+        nextTransactionDate = date(nextTransactionYear, nextTransactionMonth, 1)
+
+        randomCashFlow = getFutureTenantCashFlow(getFutureTenantInputs(renter_exit_year + 3*q/12.0), futureTerm)
+
+        if q == 0:
+            topshopCashFlowCopy[-1] += randomCashFlow[0]
+            mergeCashFlow = topshopCashFlowCopy + randomCashFlow[1:]
+            mergeTransactionDate = renter.getTransactionDates(nextTransactionDate, futureTerm + 1, prefix=topshop_transaction_date)
+        else:
+            mergeCashFlow = topshopCashFlowCopy + randomCashFlow
+            mergeTransactionDate = renter.getTransactionDates(nextTransactionDate, futureTerm + 1,
+                                                              prefix=renter.getTransactionDates(renter.FIRST_TRANSACTION_DATE, renter_exit_year + 1))
+        rows.append((prob, mergeCashFlow, mergeTransactionDate))
+    return rows
+
 '''
     function: topshopOutcome
     ========================
@@ -39,67 +185,45 @@ decathlon = renter.decathlon
 def topshopUnleveragedOutcome(renter_exit_year, sell_year, capRate):
     topshop.setTerm(renter_exit_year)
     topshop.setCapRate(capRate)
+    return computeCachedOutcome(topshop, topshopUnleveragedCashFlows, (renter_exit_year, sell_year, capRate))
+
+"""
+    function: topshopLenderACashFlows
+    =================================
+    Build the weighted cash flow rows for Topshop in case of lending option A
+"""
+def topshopLenderACashFlows(renter_exit_year, sell_year, capRate, tenant=None):
+    if tenant is None: tenant = topshop
+    if tenant.getTerm() != renter_exit_year: tenant.setTerm(renter_exit_year)
 
     if sell_year <= renter_exit_year:
-        topshopCashFlow = renter.getCashFlowUnleveraged(cashFlowBeforeDebtService=topshop.getCashFlowBeforeDebtService(),
-                                                        netOperatingIncome=topshop.getNetOperatingIncome(),
-                                                        capRate=topshop.getCapRate(), yearExit=sell_year)
-
-        irr = renter.computeIRR(topshopCashFlow)
-        irrWithNoSunkCost = renter.computeIRRWithNoSunkCost(topshopCashFlow)
-        equityMultiple = renter.computeEquityMultiple(topshopCashFlow)
-        equityMultipleWithNoSunkCost = renter.computeEquityMultipleWithNoSunkCost(topshopCashFlow)
-    else:
-        topshopCashFlow = renter.getCashFlowUnleveraged(cashFlowBeforeDebtService=topshop.getCashFlowBeforeDebtService(),
-                                                        netOperatingIncome=topshop.getNetOperatingIncome(),
-                                                        capRate=topshop.getCapRate())
-
-        topshop_transaction_date = [date(i, 7, 1) for i in xrange(2015, 2015 + renter_exit_year)]
-
-        irr = 0
-        irrWithNoSunkCost = 0
-        equityMultiple = 0
-        equityMultipleWithNoSunkCost = 0
-
-        for q in POISSON_EMPTY_DIST:
-            prob = POISSON_EMPTY_DIST[q]
-            topshopCashFlowCopy = deepcopy(topshopCashFlow)
-            maintentanceCost = 3*q/12.0*topshop.getOperatingExpense()[-1]*topshop.getAnnualIncrease()
-            topshopCashFlowCopy.append(maintentanceCost)
-            nextTransactionYear = 2015 + renter_exit_year + (3*q + 7)/12
-            nextTransactionMonth = (7 + 3*q) % 12
-            futureTerm = max(1, sell_year - renter_exit_year - int(ceil(3*q/12)))
-            transaction_date = [date(nextTransactionYear + i, nextTransactionMonth, 1) for i in xrange(futureTerm + 1)]
-
-            randomRenter = renter.Renter('unknown',
-                                         INITIAL_RENT_PER_SQM_AT_2015 * (1 + ANNUAL_INCREASE)**(renter_exit_year + 3*q/12.0) ,
-                                         FUTURE_TERM, ANNUAL_INCREASE, IS_GUARANTEE, ABATEMENT, TI, CAP_RATE)
-
-            randomCashFlow = renter.getCashFlowFutureUnleveraged(cashFlowBeforeDebtService=randomRenter.getCashFlowBeforeDebtService(),
-                                                               netOperatingIncome=randomRenter.getNetOperatingIncome(),
-                                                               capRate=randomRenter.getCapRate(),
-                                                               yearExit=futureTerm)
-
-
-            if q == 0:
-                topshopCashFlowCopy[-1] += randomCashFlow[0]
-                mergeCashFlow = topshopCashFlowCopy + randomCashFlow[1:]
-                mergeTransactionDate = topshop_transaction_date + transaction_date
-                randomRenterIRR = renter.computeIRR(mergeCashFlow, mergeTransactionDate)
-                randomRenterIRRWithNoSunkCost = renter.computeIRRWithNoSunkCost(mergeCashFlow, mergeTransactionDate)
-            else:
-                mergeCashFlow = topshopCashFlowCopy + randomCashFlow
-                mergeTransactionDate = topshop_transaction_date + [date(2015 + renter_exit_year, 7, 1)] + transaction_date
-                randomRenterIRR = renter.computeIRR(mergeCashFlow, mergeTransactionDate)
-                randomRenterIRRWithNoSunkCost = renter.computeIRRWithNoSunkCost(mergeCashFlow, mergeTransactionDate)
-
-
-            irr += prob * randomRenterIRR
-            irrWithNoSunkCost += prob * randomRenterIRRWithNoSunkCost
-            equityMultiple += prob * renter.computeEquityMultiple(mergeCashFlow)
-            equityMultipleWithNoSunkCost += prob * renter.computeEquityMultipleWithNoSunkCost(mergeCashFlow)
-
-    return irr, irrWithNoSunkCost, equityMultiple, equityMultipleWithNoSunkCost
+        topshopCashFlow, DCSR = renter.getNetCashFlowLenderA(tenant.getTerm(), tenant.getCashFlowBeforeDebtService(), tenant.getNetOperatingIncome(), yearExit=sell_year)
+        topshopCashFlow = renter.getLeveragedCashFlowLenderA(topshopCashFlow, tenant.getNetOperatingIncome(), capRate, yearExit=sell_year)
+        return [(1, topshopCashFlow, None)]
+    checkFutureTerm(renter_exit_year, sell_year)
+
+    topshopCashFlow, DCSR = renter.getNetCashFlowLenderA(tenant.getTerm(), tenant.getCashFlowBeforeDebtService(), tenant.getNetOperatingIncome(), yearExit=sell_year)
+
+    topshopCashFlow = renter.getLeveragedCashFlowLenderA(topshopCashFlow, tenant.getNetOperatingIncome(), capRate, yearExit=sell_year, isEnd=False)
+    topshop_transaction_date = renter.getTransactionDates(renter.FIRST_TRANSACTION_DATE, len(topshopCashFlow) + 1)
+
+    q = 0
+    prob = 1
+    topshopCashFlowCopy = deepcopy(topshopCashFlow)
+    maintentanceCost = 3*q/12.0*tenant.getOperatingExpense()[-1]*tenant.getAnnualIncrease()
+    topshopCashFlowCopy.append(maintentanceCost)
+    nextTransactionYear = 2015 + renter_exit_year + (3*q + 7)/12
+    nextTransactionMonth = (7 + 3*q) % 12
+    futureTerm = max(1, sell_year - renter_exit_year - int(ceil(3*q/12)))
+    nextTransactionDate = date(nextTransactionYear, nextTransactionMonth, 1)
+
+    randomCashFlow = getFutureTenantCashFlow(getFutureTenantInputs(renter_exit_year + 3*q/12.0), futureTerm)
+
+    mergeCashFlow = topshopCashFlowCopy + randomCashFlow
+    mergeCashFlow[-1] -= loan.getBalance(renter.getLenderSpec('A'), sell_year)
+
+    mergeTransactionDate = renter.getTransactionDates(nextTransactionDate, futureTerm + 1, prefix=topshop_transaction_date)
+    return [(prob, mergeCashFlow, mergeTransactionDate)]
 
 """
     function: topshopLenderAOutcome
@@ -109,65 +233,44 @@ def topshopUnleveragedOutcome(renter_exit_year, sell_year, capRate):
 def topshopLenderAOutcome(renter_exit_year, sell_year, capRate):
     topshop.setTerm(renter_exit_year)
     topshop.setCapRate(capRate)
+    return computeCachedOutcome(topshop, topshopLenderACashFlows, (renter_exit_year, sell_year, capRate))
 
-    if sell_year <= renter_exit_year:
-        topshopCashFlow, DCSR = renter.getNetCashFlowLenderA(topshop.getTerm(), topshop.getCashFlowBeforeDebtService(), topshop.getNetOperatingIncome(), yearExit=sell_year)
-        topshopCashFlow = renter.getLeveragedCashFlowLenderA(topshopCashFlow, topshop.getNetOperatingIncome(), topshop.getCapRate(), yearExit=sell_year)
-
-        print topshopCashFlow
-
-        irr = renter.computeIRR(topshopCashFlow)
-        irrWithNoSunkCost = renter.computeIRRWithNoSunkCost(topshopCashFlow)
-        equityMultiple = renter.computeEquityMultiple(topshopCashFlow)
-        equityMultipleWithNoSunkCost = renter.computeEquityMultipleWithNoSunkCost(topshopCashFlow)
-    else:
-        topshopCashFlow, DCSR = renter.getNetCashFlowLenderA(topshop.getTerm(), topshop.getCashFlowBeforeDebtService(), topshop.getNetOperatingIncome(), yearExit=sell_year)
-
-        topshopCashFlow = renter.getLeveragedCashFlowLenderA(topshopCashFlow, topshop.getNetOperatingIncome(), topshop.getCapRate(), yearExit=sell_year, isEnd=False)
-        topshop_transaction_date = [date(i, 7, 1) for i in xrange(2015, 2015 + len(topshopCashFlow) + 1)]
-
-        irr = 0
-        irrWithNoSunkCost = 0
-        equityMultiple = 0
-        equityMultipleWithNoSunkCost = 0
+"""
+    function: topshopLenderBCashFlows
+    =================================
+    Build the weighted cash flow rows for Topshop in case of lending option B
+"""
+def topshopLenderBCashFlows(renter_exit_year, sell_year, capRate, tenant=None):
+    if tenant is None: tenant = topshop
+    if tenant.getTerm() != renter_exit_year: tenant.setTerm(renter_exit_year)
 
-        q = 0
-        prob = 1
+    if sell_year <= renter_exit_year:
+        topshopCashFlow, DCSR = renter.getNetCashFlowLenderB(tenant.getTerm(), tenant.getCashFlowBeforeDebtService(), tenant.getNetOperatingIncome(), yearExit=sell_year)
+        topshopCashFlow = renter.getLeveragedCashFlowLenderB(topshopCashFlow, tenant.getNetOperatingIncome(), capRate, yearExit=sell_year)
+        return [(1, topshopCashFlow, None)]
+    checkFutureTerm(renter_exit_year, sell_year)
+
+    topshopCashFlow, DCSR = renter.getNetCashFlowLenderA(tenant.getTerm(), tenant.getCashFlowBeforeDebtService(), tenant.getNetOperatingIncome(), yearExit=sell_year)
+    topshopCashFlow = renter.getLeveragedCashFlowLenderA(topshopCashFlow, tenant.getNetOperatingIncome(), capRate, yearExit=sell_year, isEnd=False)
+    topshop_transaction_date = renter.getTransactionDates(renter.FIRST_TRANSACTION_DATE, len(topshopCashFlow) + 1)
+
+    rows = []
+    for q in POISSON_EMPTY_DIST:
+        prob = POISSON_EMPTY_DIST[q]
         topshopCashFlowCopy = deepcopy(topshopCashFlow)
-        maintentanceCost = 3*q/12.0*topshop.getOperatingExpense()[-1]*topshop.getAnnualIncrease()
+        maintentanceCost = 3*q/12.0*tenant.getOperatingExpense()[-1]*tenant.getAnnualIncrease()
         topshopCashFlowCopy.append(maintentanceCost)
         nextTransactionYear = 2015 + renter_exit_year + (3*q + 7)/12
         nextTransactionMonth = (7 + 3*q) % 12
         futureTerm = max(1, sell_year - renter_exit_year - int(ceil(3*q/12)))
-        transaction_date = [date(nextTransactionYear + i, nextTransactionMonth, 1) for i in xrange(futureTerm + 1)]
+        nextTransactionDate = date(nextTransactionYear, nextTransactionMonth, 1)
 
-        randomRenter = renter.Renter('unknown',
-                                     INITIAL_RENT_PER_SQM_AT_2015 * (1 + ANNUAL_INCREASE)**(renter_exit_year + 3*q/12.0) ,
-                                     FUTURE_TERM, ANNUAL_INCREASE, IS_GUARANTEE, ABATEMENT, TI, CAP_RATE)
-
-        randomCashFlow = renter.getCashFlowFutureUnleveraged(cashFlowBeforeDebtService=randomRenter.getCashFlowBeforeDebtService(),
-                                                           netOperatingIncome=randomRenter.getNetOperatingIncome(),
-                                                           capRate=randomRenter.getCapRate(),
-                                                           yearExit=futureTerm)
+        randomCashFlow = getFutureTenantCashFlow(getFutureTenantInputs(renter_exit_year + 3*q/12.0), futureTerm)
 
         mergeCashFlow = topshopCashFlowCopy + randomCashFlow
-        mergeCashFlow[-1] -= -pv(0.05/12.0, 240 - 12*sell_year, 1108726/12.0)
-        print mergeCashFlow
-
-        # print "mortgage: " + repr(-pv(0.05/12.0, 240 - 12*sell_year, 1108726/12.0))
-        # print mergeCashFlow
-        mergeTransactionDate = topshop_transaction_date + transaction_date
-        print mergeTransactionDate
-        randomRenterIRR = renter.computeIRR(mergeCashFlow, mergeTransactionDate)
-        randomRenterIRRWithNoSunkCost = renter.computeIRRWithNoSunkCost(mergeCashFlow, mergeTransactionDate)
-
-        irr += prob * randomRenterIRR
-        irrWithNoSunkCost += prob * randomRenterIRRWithNoSunkCost
-        equityMultiple += prob * renter.computeEquityMultiple(mergeCashFlow)
-        equityMultipleWithNoSunkCost += prob * renter.computeEquityMultipleWithNoSunkCost(mergeCashFlow)
-
-    return irr, irrWithNoSunkCost, equityMultiple, equityMultipleWithNoSunkCost
-
+        mergeTransactionDate = renter.getTransactionDates(nextTransactionDate, futureTerm + 1, prefix=topshop_transaction_date)
+        rows.append((prob, mergeCashFlow, mergeTransactionDate))
+    return rows
 
 """
     function: topshopLenderBOutcome
@@ -177,123 +280,124 @@ def topshopLenderAOutcome(renter_exit_year, sell_year, capRate):
 def topshopLenderBOutcome(renter_exit_year, sell_year, capRate):
     topshop.setTerm(renter_exit_year)
     topshop.setCapRate(capRate)
+    return computeCachedOutcome(topshop, topshopLenderBCashFlows, (renter_exit_year, sell_year, capRate))
 
-    if sell_year <= renter_exit_year:
-        topshopCashFlow, DCSR = renter.getNetCashFlowLenderB(topshop.getTerm(), topshop.getCashFlowBeforeDebtService(), topshop.getNetOperatingIncome(), yearExit=sell_year)
-        topshopCashFlow = renter.getLeveragedCashFlowLenderB(topshopCashFlow, topshop.getNetOperatingIncome(), topshop.getCapRate(), yearExit=sell_year)
-
-        irr = renter.computeIRR(topshopCashFlow)
-        irrWithNoSunkCost = renter.computeIRRWithNoSunkCost(topshopCashFlow)
-        equityMultiple = renter.computeEquityMultiple(topshopCashFlow)
-        equityMultipleWithNoSunkCost = renter.computeEquityMultipleWithNoSunkCost(topshopCashFlow)
-    else:
-        topshopCashFlow, DCSR = renter.getNetCashFlowLenderA(topshop.getTerm(), topshop.getCashFlowBeforeDebtService(), topshop.getNetOperatingIncome(), yearExit=sell_year)
-        topshopCashFlow = renter.getLeveragedCashFlowLenderA(topshopCashFlow, topshop.getNetOperatingIncome(), topshop.getCapRate(), yearExit=sell_year, isEnd=False)
-        topshop_transaction_date = [date(i, 7, 1) for i in xrange(2015, 2015 + len(topshopCashFlow) + 1)]
-
-        irr = 0
-        irrWithNoSunkCost = 0
-        equityMultiple = 0
-        equityMultipleWithNoSunkCost = 0
-
-        for q in POISSON_EMPTY_DIST:
-            prob = POISSON_EMPTY_DIST[q]
-            topshopCashFlowCopy = deepcopy(topshopCashFlow)
-            maintentanceCost = 3*q/12.0*topshop.getOperatingExpense()[-1]*topshop.getAnnualIncrease()
-            topshopCashFlowCopy.append(maintentanceCost)
-            nextTransactionYear = 2015 + renter_exit_year + (3*q + 7)/12
-            nextTransactionMonth = (7 + 3*q) % 12
-            futureTerm = max(1, sell_year - renter_exit_year - int(ceil(3*q/12)))
-            transaction_date = [date(nextTransactionYear + i, nextTransactionMonth, 1) for i in xrange(futureTerm + 1)]
-
-            randomRenter = renter.Renter('unknown',
-                                         INITIAL_RENT_PER_SQM_AT_2015 * (1 + ANNUAL_INCREASE)**(renter_exit_year + 3*q/12.0) ,
-                                         FUTURE_TERM, ANNUAL_INCREASE, IS_GUARANTEE, ABATEMENT, TI, CAP_RATE)
-
-            randomCashFlow = renter.getCashFlowFutureUnleveraged(cashFlowBeforeDebtService=randomRenter.getCashFlowBeforeDebtService(),
-                                                               netOperatingIncome=randomRenter.getNetOperatingIncome(),
-                                                               capRate=randomRenter.getCapRate(),
-                                                               yearExit=futureTerm)
-
-            mergeCashFlow = topshopCashFlowCopy + randomCashFlow
-            mergeTransactionDate = topshop_transaction_date + transaction_date
-            randomRenterIRR = renter.computeIRR(mergeCashFlow, mergeTransactionDate)
-            randomRenterIRRWithNoSunkCost = renter.computeIRRWithNoSunkCost(mergeCashFlow, mergeTransactionDate)
-
-            irr += prob * randomRenterIRR
-            irrWithNoSunkCost += prob * randomRenterIRRWithNoSunkCost
-            equityMultiple += prob * renter.computeEquityMultiple(mergeCashFlow)
-            equityMultipleWithNoSunkCost += prob * renter.computeEquityMultipleWithNoSunkCost(mergeCashFlow)
-
-    return irr, irrWithNoSunkCost, equityMultiple, equityMultipleWithNoSunkCost
+def zaraUnleveragedCashFlows(sell_year, capRate, tenant=None):
+    if tenant is None: tenant = zara
+    zaraCashFlow = renter.getCashFlowUnleveraged(cashFlowBeforeDebtService=tenant.getCashFlowBeforeDebtService(),
+                                                    netOperatingIncome=tenant.getNetOperatingIncome(),
+                                                    capRate=capRate, yearExit=sell_year)
+    return [(1, zaraCashFlow, None)]
 
 def zaraUnleveragedOutcome(sell_year, capRate):
     zara.setCapRate(capRate)
-    zaraCashFlow = renter.getCashFlowUnleveraged(cashFlowBeforeDebtService=zara.getCashFlowBeforeDebtService(),
-                                                    netOperatingIncome=zara.getNetOperatingIncome(),
-                                                    capRate=zara.getCapRate(), yearExit=sell_year)
+    return computeCachedOutcome(zara, zaraUnleveragedCashFlows, (sell_year, capRate))
 
-    irr = renter.computeIRR(zaraCashFlow)
-    irrWithNoSunkCost = renter.computeIRRWithNoSunkCost(zaraCashFlow)
-    equityMultiple = renter.computeEquityMultiple(zaraCashFlow)
-    equityMultipleWithNoSunkCost = renter.computeEquityMultipleWithNoSunkCost(zaraCashFlow)
-    return irr, irrWithNoSunkCost, equityMultiple, equityMultipleWithNoSunkCost
+def zaraLenderACashFlows(sell_year, capRate, tenant=None):
+    if tenant is None: tenant = zara
+    zaraCashFlow, DSCR = renter.getNetCashFlowLenderA(tenant.getTerm(), tenant.getCashFlowBeforeDebtService(), tenant.getNetOperatingIncome(), yearExit=sell_year)
+    zaraCashFlow = renter.getLeveragedCashFlowLenderA(zaraCashFlow, tenant.getNetOperatingIncome(), capRate, yearExit=sell_year)
+    return [(1, zaraCashFlow, None)]
 
 def zaraLenderAOutcome(sell_year, capRate):
     zara.setCapRate(capRate)
-    zaraCashFlow, DSCR = renter.getNetCashFlowLenderA(zara.getTerm(), zara.getCashFlowBeforeDebtService(), zara.getNetOperatingIncome(), yearExit=sell_year)
-    zaraCashFlow = renter.getLeveragedCashFlowLenderA(zaraCashFlow, zara.getNetOperatingIncome(), zara.getCapRate(), yearExit=sell_year)
+    return computeCachedOutcome(zara, zaraLenderACashFlows, (sell_year, capRate))
 
-    irr = renter.computeIRR(zaraCashFlow)
-    irrWithNoSunkCost = renter.computeIRRWithNoSunkCost(zaraCashFlow)
-    equityMultiple = renter.computeEquityMultiple(zaraCashFlow)
-    equityMultipleWithNoSunkCost = renter.computeEquityMultipleWithNoSunkCost(zaraCashFlow)
-    return irr, irrWithNoSunkCost, equityMultiple, equityMultipleWithNoSunkCost
+def zaraLenderBCashFlows(sell_year, capRate, tenant=None):
+    if tenant is None: tenant = zara
+    zaraCashFlow, DCSR = renter.getNetCashFlowLenderB(tenant.getTerm(), tenant.getCashFlowBeforeDebtService(), tenant.getNetOperatingIncome(), yearExit=sell_year)
+    zaraCashFlow = renter.getLeveragedCashFlowLenderB(zaraCashFlow, tenant.getNetOperatingIncome(), capRate, yearExit=sell_year)
+    return [(1, zaraCashFlow, None)]
 
 def zaraLenderBOutcome(sell_year, capRate):
     zara.setCapRate(capRate)
-    zaraCashFlow, DCSR = renter.getNetCashFlowLenderB(zara.getTerm(), zara.getCashFlowBeforeDebtService(), zara.getNetOperatingIncome(), yearExit=sell_year)
-    zaraCashFlow = renter.getLeveragedCashFlowLenderB(zaraCashFlow, zara.getNetOperatingIncome(), zara.getCapRate(), yearExit=sell_year)
+    return computeCachedOutcome(zara, zaraLenderBCashFlows, (sell_year, capRate))
 
-    irr = renter.computeIRR(zaraCashFlow)
-    irrWithNoSunkCost = renter.computeIRRWithNoSunkCost(zaraCashFlow)
-    equityMultiple = renter.computeEquityMultiple(zaraCashFlow)
-    equityMultipleWithNoSunkCost = renter.computeEquityMultipleWithNoSunkCost(zaraCashFlow)
-    return irr, irrWithNoSunkCost, equityMultiple, equityMultipleWithNoSunkCost
+def decathlonUnleveragedCashFlows(sell_year, capRate, tenant=None):
+    if tenant is None: tenant = decathlon
+    decathlonCashFlow = renter.getCashFlowUnleveraged(cashFlowBeforeDebtService=tenant.getCashFlowBeforeDebtService(),
+                                                    netOperatingIncome=tenant.getNetOperatingIncome(),
+                                                    capRate=capRate, yearExit=sell_year)
+    return [(1, decathlonCashFlow, None)]
 
 def decathlonUnleveragedOutcome(sell_year, capRate):
     decathlon.setCapRate(capRate)
-    decathlonCashFlow = renter.getCashFlowUnleveraged(cashFlowBeforeDebtService=decathlon.getCashFlowBeforeDebtService(),
-                                                    netOperatingIncome=decathlon.getNetOperatingIncome(),
-                                                    capRate=decathlon.getCapRate(), yearExit=sell_year)
+    return computeCachedOutcome(decathlon, decathlonUnleveragedCashFlows, (sell_year, capRate))
 
-    irr = renter.computeIRR(decathlonCashFlow)
-    irrWithNoSunkCost = renter.computeIRRWithNoSunkCost(decathlonCashFlow)
-    equityMultiple = renter.computeEquityMultiple(decathlonCashFlow)
-    equityMultipleWithNoSunkCost = renter.computeEquityMultipleWithNoSunkCost(decathlonCashFlow)
-    return irr, irrWithNoSunkCost, equityMultiple, equityMultipleWithNoSunkCost
+def decathlonLenderACashFlows(sell_year, capRate, tenant=None):
+    if tenant is None: tenant = decathlon
+    decathlonCashFlow, DSCR = renter.getNetCashFlowLenderA(tenant.getTerm(), tenant.getCashFlowBeforeDebtService(), tenant.getNetOperatingIncome(), yearExit=sell_year)
+    decathlonCashFlow = renter.getLeveragedCashFlowLenderA(decathlonCashFlow, tenant.getNetOperatingIncome(), capRate, yearExit=sell_year)
+    return [(1, decathlonCashFlow, None)]
 
 def decathlonLenderAOutcome(sell_year, capRate):
     decathlon.setCapRate(capRate)
+    return computeCachedOutcome(decathlon, decathlonLenderACashFlows, (sell_year, capRate))
 
-    decathlonCashFlow, DSCR = renter.getNetCashFlowLenderA(decathlon.getTerm(), decathlon.getCashFlowBeforeDebtService(), decathlon.getNetOperatingIncome(), yearExit=sell_year)
-    decathlonCashFlow = renter.getLeveragedCashFlowLenderA(decathlonCashFlow, decathlon.getNetOperatingIncome(), decathlon.getCapRate(), yearExit=sell_year)
-
-    print decathlonCashFlow
-
-    irr = renter.computeIRR(decathlonCashFlow)
-    irrWithNoSunkCost = renter.computeIRRWithNoSunkCost(decathlonCashFlow)
-    equityMultiple = renter.computeEquityMultiple(decathlonCashFlow)
-    equityMultipleWithNoSunkCost = renter.computeEquityMultipleWithNoSunkCost(decathlonCashFlow)
-    return irr, irrWithNoSunkCost, equityMultiple, equityMultipleWithNoSunkCost
+def decathlonLenderBCashFlows(sell_year, capRate, tenant=None):
+    if tenant is None: tenant = decathlon
+    decathlonCashFlow, DCSR = renter.getNetCashFlowLenderB(tenant.getTerm(), tenant.getCashFlowBeforeDebtService(), tenant.getNetOperatingIncome(), yearExit=sell_year)
+    decathlonCashFlow = renter.getLeveragedCashFlowLenderB(decathlonCashFlow, tenant.getNetOperatingIncome(), capRate, yearExit=sell_year)
+    return [(1, decathlonCashFlow, None)]
 
 def decathlonLenderBOutcome(sell_year, capRate):
     decathlon.setCapRate(capRate)
-    decathlonCashFlow, DCSR = renter.getNetCashFlowLenderB(decathlon.getTerm(), decathlon.getCashFlowBeforeDebtService(), decathlon.getNetOperatingIncome(), yearExit=sell_year)
-    decathlonCashFlow = renter.getLeveragedCashFlowLenderB(decathlonCashFlow, decathlon.getNetOperatingIncome(), decathlon.getCapRate(), yearExit=sell_year)
-
-    irr = renter.computeIRR(decathlonCashFlow)
-    irrWithNoSunkCost = renter.computeIRRWithNoSunkCost(decathlonCashFlow)
-    equityMultiple = renter.computeEquityMultiple(decathlonCashFlow)
-    equityMultipleWithNoSunkCost = renter.computeEquityMultipleWithNoSunkCost(decathlonCashFlow)
-    return irr, irrWithNoSunkCost, equityMultiple, equityMultipleWithNoSunkCost
+    return computeCachedOutcome(decathlon, decathlonLenderBCashFlows, (sell_year, capRate))
+
+# Cash flow builder behind every outcome function, used by sweep.py to batch whole grids.
+# Every builder takes an optional tenant, a Renter used instead of the module instance.
+OUTCOME_CASH_FLOWS = {
+    topshopUnleveragedOutcome: topshopUnleveragedCashFlows,
+    topshopLenderAOutcome: topshopLenderACashFlows,
+    topshopLenderBOutcome: topshopLenderBCashFlows,
+    zaraUnleveragedOutcome: zaraUnleveragedCashFlows,
+    zaraLenderAOutcome: zaraLenderACashFlows,
+    zaraLenderBOutcome: zaraLenderBCashFlows,
+    decathlonUnleveragedOutcome: decathlonUnleveragedCashFlows,
+    decathlonLenderAOutcome: decathlonLenderACashFlows,
+    decathlonLenderBOutcome: decathlonLenderBCashFlows
+}
+
+# Financing structures every tenant is evaluated under
+STRUCTURES = ('unleveraged', 'lenderA', 'lenderB')
+
+# Cash flow builders by tenant and financing structure, used by sweep.evaluateStructures
+TENANT_CASH_FLOWS = {
+    'topshop': {'unleveraged': topshopUnleveragedCashFlows, 'lenderA': topshopLenderACashFlows, 'lenderB': topshopLenderBCashFlows},
+    'zara': {'unleveraged': zaraUnleveragedCashFlows, 'lenderA': zaraLenderACashFlows, 'lenderB': zaraLenderBCashFlows},
+    'decathlon': {'unleveraged': decathlonUnleveragedCashFlows, 'lenderA': decathlonLenderACashFlows, 'lenderB': decathlonLenderBCashFlows}
+}
+
+"""
+    function: getBuilderTenant
+    ==========================
+    Return the module Renter a cash flow builder of TENANT_CASH_FLOWS uses when no tenant is given.
+"""
+def getBuilderTenant(buildCashFlows):
+    for tenantName, builders in TENANT_CASH_FLOWS.items():
+        if buildCashFlows in builders.values(): return globals()[tenantName]
+    raise ValueError("%s is not a cash flow builder" % buildCashFlows.__name__)
+
+"""
+    function: getScenarioAssumptions
+    ================================
+    Return the module assumptions a scenario of a cash flow builder depends on: all of them
+    when a Topshop scenario goes through the vacancy and re-leasing branch (sell_year after
+    renter_exit_year), only those of renter.py otherwise.
+"""
+def getScenarioAssumptions(buildCashFlows, args):
+    if buildCashFlows in TENANT_CASH_FLOWS['topshop'].values() and args[1] > args[0]: return getAssumptions()
+    return renter.getAssumptions()
+
+"""
+    function: getScenarioTenantInputs
+    =================================
+    Return the inputs of tenant a scenario of a cash flow builder depends on. The state left
+    by the last outcome function called does not count: the Topshop builders set the term to
+    renter_exit_year first, and no builder reads the capRate of tenant (the exit cap rate is
+    the last scenario argument), so it is left out.
+"""
+def getScenarioTenantInputs(buildCashFlows, args, tenant):
+    tenantInputs = tuple(tenant.getInputs())[:7]
+    if buildCashFlows in TENANT_CASH_FLOWS['topshop'].values(): return tenantInputs[:2] + (args[0],) + tenantInputs[3:]
+    return tenantInputs
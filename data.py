@@ -75,5 +75,21 @@ readableMap = {
     'equityMultiplelenderB': 'Equity Multiple for lender B',
     'IRRunleveraged': 'IRR for unleveraged',
     'IRRlenderA': 'IRR for lender A',
-    'IRRlenderB': 'IRR for lender B'
+    'IRRlenderB': 'IRR for lender B',
+    'equityMultipleWithNoSunkCostunleveraged': 'Equity Multiple with no sunk cost for unleveraged',
+    'equityMultipleWithNoSunkCostlenderA': 'Equity Multiple with no sunk cost for lender A',
+    'equityMultipleWithNoSunkCostlenderB': 'Equity Multiple with no sunk cost for lender B',
+    'IRRWithNoSunkCostunleveraged': 'IRR with no sunk cost for unleveraged',
+    'IRRWithNoSunkCostlenderA': 'IRR with no sunk cost for lender A',
+    'IRRWithNoSunkCostlenderB': 'IRR with no sunk cost for lender B',
+    'tenant': 'Tenant',
+    'renter_exit_year': 'Renter Exit Year',
+    'sell_year': 'Sell Year',
+    'capRate': 'Cap Rate',
+    'structure': 'Financing Structure',
+    'vacancy': 'Vacancy Row',
+    'probability': 'Probability',
+    'year': 'Year',
+    'date': 'Transaction Date',
+    'cashFlow': 'Cash Flow'
 }
@@ -0,0 +1,180 @@
+import csv
+from itertools import islice, product
+import cashflow
+import renter
+import sweep
+from data import readableMap
+
+EXPORT_CHUNK_SIZE = 1024 # grid cells computed and written at a time, bounds the memory of an export
+
+# readableMap key of every metric of sweep.METRICS, the financing structure is appended
+EXPORT_METRIC_KEYS = {'irr': 'IRR',
+                      'irrWithNoSunkCost': 'IRRWithNoSunkCost',
+                      'equityMultiple': 'equityMultiple',
+                      'equityMultipleWithNoSunkCost': 'equityMultipleWithNoSunkCost'}
+
+# readableMap keys of the per-year cash flow detail, after the grid axes
+EXPORT_DETAIL_KEYS = ('structure', 'vacancy', 'probability', 'year', 'date', 'cashFlow')
+
+"""
+    class: CsvWriter
+    ================
+    class CsvWriter writes rows to a CSV file as they come.
+    This class requires 2 inputs
+
+    1. path                        Path of the CSV file
+    2. columns                     Column names, written as the header
+"""
+class CsvWriter(object):
+
+    def __init__(self, path, columns):
+        self.file = open(path, 'wb')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def writeRows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+"""
+    class: ParquetWriter
+    ====================
+    class ParquetWriter writes rows to a Parquet file, one row group per call of writeRows.
+    pyarrow is only imported here, it is not needed for CSV.
+    This class requires 2 inputs
+
+    1. path                        Path of the Parquet file
+    2. columns                     Column names
+"""
+class ParquetWriter(object):
+
+    def __init__(self, path, columns):
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.path = path
+        self.columns = columns
+        self.writer = None
+
+    def writeRows(self, rows):
+        if not rows: return
+        table = self.pyarrow.Table.from_arrays([self.pyarrow.array(list(column)) for column in zip(*rows)], names=self.columns)
+        # the schema is that of the first chunk
+        if self.writer is None: self.writer = self.pyarrow.parquet.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self):
+        if self.writer is not None: self.writer.close()
+
+"""
+    function: openWriter
+    ====================
+    Return the writer of a path, Parquet for a .parquet path and CSV otherwise.
+"""
+def openWriter(path, columns):
+    if path.lower().endswith('.parquet'): return ParquetWriter(path, columns)
+    return CsvWriter(path, columns)
+
+"""
+    function: getChunks
+    ===================
+    Split an iterable into lists of at most size items, without holding more than one of them.
+"""
+def getChunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk: return
+        yield chunk
+
+def getAxisNames(tenantName):
+    if tenantName == 'topshop': return ['renter_exit_year', 'sell_year', 'capRate']
+    return ['sell_year', 'capRate']
+
+"""
+    function: getGridColumns
+    ========================
+    Return the readable column names of the grid export of a tenant: the tenant, the grid axes
+    and every metric of every financing structure.
+"""
+def getGridColumns(tenantName):
+    return ([readableMap['tenant']] + [readableMap[axis] for axis in getAxisNames(tenantName)] +
+            [readableMap[EXPORT_METRIC_KEYS[metric] + structure] for structure in cashflow.STRUCTURES for metric in sweep.METRICS])
+
+def getDetailColumns(tenantName):
+    return [readableMap[key] for key in ['tenant'] + getAxisNames(tenantName) + list(EXPORT_DETAIL_KEYS)]
+
+"""
+    function: getDetailRows
+    =======================
+    Return the per-year cash flow rows of the weighted cash flows of one cell and structure.
+    Rows without transaction dates are yearly from renter.FIRST_TRANSACTION_DATE.
+"""
+def getDetailRows(prefix, structure, weightedCashFlows):
+    rows = []
+    for vacancy, (prob, cashFlow, transactionDate) in enumerate(weightedCashFlows):
+        if transactionDate is None:
+            transactionDate = renter.getTransactionDates(renter.FIRST_TRANSACTION_DATE, len(cashFlow))
+        for year, (d, value) in enumerate(zip(transactionDate, cashFlow)):
+            rows.append(prefix + [structure, vacancy, prob, year, d.isoformat(), value])
+    return rows
+
+"""
+    function: exportGrid
+    ====================
+    Compute the outcomes of every financing structure of a tenant over a grid and stream them
+    to path, chunkSize cells at a time, so that neither the grid nor its results are ever held
+    in memory as a whole. This function requires four input variables and three optional.
+
+    tenantName = 'topshop', 'zara' or 'decathlon'
+    path = output file, Parquet when it ends in .parquet (requires pyarrow) and CSV otherwise
+    sellYears = values of sell_year
+    capRates = values of capRate
+    renterExitYears = values of renter_exit_year (only for Topshop)
+    detailPath = output file of the per-year cash flow of every vacancy row, structure and
+                 cell, in long format (one row per year), skipped when None
+    chunkSize = cells per chunk
+
+    Column names come from data.readableMap. Cells that cannot be evaluated (e.g. Lender B
+    with a sell year below 4) are empty in CSV and null in Parquet.
+    Return the number of cells exported.
+"""
+def exportGrid(tenantName, path, sellYears, capRates, renterExitYears=None, detailPath=None, chunkSize=EXPORT_CHUNK_SIZE):
+    axes = [list(sellYears), list(capRates)]
+    if tenantName == 'topshop':
+        if renterExitYears is None: raise ValueError("topshop requires renterExitYears")
+        axes = [list(renterExitYears)] + axes
+    builders = cashflow.TENANT_CASH_FLOWS[tenantName]
+    tenantLabel = cashflow.getBuilderTenant(builders['unleveraged']).getName()
+
+    writer = openWriter(path, getGridColumns(tenantName))
+    detailWriter = openWriter(detailPath, getDetailColumns(tenantName)) if detailPath is not None else None
+    cells = 0
+    try:
+        for cellArgs in getChunks(product(*axes), chunkSize):
+            cellRows = []
+            for structure in cashflow.STRUCTURES:
+                cellRows += sweep.buildCells(builders[structure], cellArgs)
+            values = sweep.solveCells(cellRows)
+            rows = []
+            for cell, args in enumerate(cellArgs):
+                row = [tenantLabel] + list(args)
+                for s in xrange(len(cashflow.STRUCTURES)):
+                    row += [None if value != value else float(value) for value in values[s*len(cellArgs) + cell]]
+                rows.append(row)
+            writer.writeRows(rows)
+            if detailWriter is not None:
+                for s, structure in enumerate(cashflow.STRUCTURES):
+                    detailRows = []
+                    for cell, args in enumerate(cellArgs):
+                        weightedCashFlows = cellRows[s*len(cellArgs) + cell]
+                        if weightedCashFlows is not None:
+                            detailRows += getDetailRows([tenantLabel] + list(args), structure, weightedCashFlows)
+                    detailWriter.writeRows(detailRows)
+            cells += len(cellArgs)
+    finally:
+        writer.close()
+        if detailWriter is not None: detailWriter.close()
+    return cells
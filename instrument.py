@@ -0,0 +1,165 @@
+import atexit
+import sys
+from functools import wraps
+from timeit import default_timer
+import cache
+
+# Instrumentation is off by default, the hooks below only check this flag while it is off
+ENABLED = False
+
+# Stages of the outcome functions that are timed
+INSTRUMENT_STAGES = ('renter', 'lenderCashFlow', 'irr', 'equityMultiple')
+
+# Recomputed Renter stages by renter name, e.g. {'TopShop': {'revenue': 3, ...}}
+RECOMPUTE_COUNTS = {}
+
+# xirrBatch telemetry, summed over every call
+XIRR_TELEMETRY = {}
+
+# [calls, seconds] by stage
+STAGE_TIMES = {}
+
+# Path the snapshot is written to at exit (stderr when None), see enable
+DUMP_STATE = {'path': None, 'registered': False}
+
+"""
+    function: reset
+    ===============
+    Clear every counter, timer and the xirr telemetry.
+"""
+def reset():
+    RECOMPUTE_COUNTS.clear()
+    XIRR_TELEMETRY.update({'calls': 0, 'rows': 0, 'iterations': 0, 'maxIterations': 0,
+                           'maxResidual': 0.0, 'nonConverged': 0, 'unbracketed': 0})
+    STAGE_TIMES.clear()
+    for stage in INSTRUMENT_STAGES: STAGE_TIMES[stage] = [0, 0.0]
+
+reset()
+
+"""
+    function: enable
+    ================
+    Turn instrumentation on. At exit the snapshot is dumped as JSON to dumpPath, or to stderr
+    when dumpPath is None.
+"""
+def enable(dumpPath=None):
+    global ENABLED
+    ENABLED = True
+    DUMP_STATE['path'] = dumpPath
+    if not DUMP_STATE['registered']:
+        atexit.register(dumpAtExit)
+        DUMP_STATE['registered'] = True
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+def recordRecompute(renterName, stage):
+    stages = RECOMPUTE_COUNTS.setdefault(renterName, {})
+    stages[stage] = stages.get(stage, 0) + 1
+
+"""
+    function: recordXirr
+    ====================
+    Record one xirrBatch call. This function requires four input variables.
+
+    iterations = array of Newton/bisection iterations per row (maxIter for the rows that did not converge)
+    residuals = array of |NPV| at the returned rate per row, relative to the sum of |cash flow|
+    converged = boolean array of the rows that converged
+    bracketed = boolean array of the rows with a sign change in the bracket
+"""
+def recordXirr(iterations, residuals, converged, bracketed):
+    XIRR_TELEMETRY['calls'] += 1
+    XIRR_TELEMETRY['rows'] += len(iterations)
+    XIRR_TELEMETRY['iterations'] += int(iterations.sum())
+    XIRR_TELEMETRY['nonConverged'] += int((~converged).sum())
+    XIRR_TELEMETRY['unbracketed'] += int((~bracketed).sum())
+    if len(iterations):
+        XIRR_TELEMETRY['maxIterations'] = max(XIRR_TELEMETRY['maxIterations'], int(iterations.max()))
+    if converged.any():
+        XIRR_TELEMETRY['maxResidual'] = max(XIRR_TELEMETRY['maxResidual'], float(residuals[converged].max()))
+
+"""
+    class: StageTimer
+    =================
+    class StageTimer is a context manager adding the time spent in its block to STAGE_TIMES.
+    This class requires 1 input
+
+    1. name                        Stage name, one of INSTRUMENT_STAGES
+"""
+class StageTimer(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, *excInfo):
+        times = STAGE_TIMES.setdefault(self.name, [0, 0.0])
+        times[0] += 1
+        times[1] += default_timer() - self.start
+        return False
+
+class NullTimer(object):
+    def __enter__(self): return self
+    def __exit__(self, *excInfo): return False
+
+NULL_TIMER = NullTimer()
+
+"""
+    function: stage
+    ===============
+    Context manager timing its block as the given stage, e.g.
+
+        with instrument.stage('irr'):
+            ...
+
+    While instrumentation is off, a shared no-op timer is returned.
+"""
+def stage(name):
+    if not ENABLED: return NULL_TIMER
+    return StageTimer(name)
+
+"""
+    function: timed
+    ===============
+    Decorator timing every call of a function as the given stage.
+"""
+def timed(name):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED: return function(*args, **kwargs)
+            with StageTimer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+"""
+    function: snapshot
+    ==================
+    Return a copy of everything recorded so far, with the mean xirr iterations per row and the
+    cache statistics of cache.getStats.
+"""
+def snapshot():
+    xirrTelemetry = dict(XIRR_TELEMETRY)
+    xirrTelemetry['meanIterations'] = float(xirrTelemetry['iterations'])/xirrTelemetry['rows'] if xirrTelemetry['rows'] else 0.0
+    return {'enabled': ENABLED,
+            'recomputes': dict((name, dict(stages)) for name, stages in RECOMPUTE_COUNTS.items()),
+            'xirr': xirrTelemetry,
+            'stages': dict((name, {'calls': calls, 'seconds': seconds}) for name, (calls, seconds) in STAGE_TIMES.items()),
+            'caches': cache.getStats()}
+
+def dump(path=None):
+    import json
+    text = json.dumps(snapshot(), indent=2, sort_keys=True)
+    if path is None:
+        sys.stderr.write(text + '\n')
+    else:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+
+def dumpAtExit():
+    if ENABLED: dump(DUMP_STATE['path'])
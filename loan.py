@@ -0,0 +1,220 @@
+from collections import namedtuple
+import numpy as np
+from numpy import pmt, pv
+import cache
+
+LOAN_SCHEDULE_CACHE_SIZE = 256 # loan specs whose monthly schedule is kept
+
+LOAN_SCHEDULE_CACHE = cache.LRUCache('loanSchedule', LOAN_SCHEDULE_CACHE_SIZE)
+
+"""
+    class: ExitLockoutError
+    =======================
+    Raised when a loan is repaid before the minExitYear of its spec, e.g. Lender B with a sell
+    year below 4. Callers evaluating a grid catch it to leave such scenarios out.
+"""
+class ExitLockoutError(ValueError):
+    pass
+
+"""
+    class: LoanSpec
+    ===============
+    class LoanSpec is the immutable term sheet of a loan. Every field is a plain number, so a
+    spec is hashable and a variant is one _replace away, e.g. spec._replace(ltv=0.65).
+    This class requires 15 inputs
+
+    1. name                        Name of the lender
+    2. propertyValue               Value the LTV applies to (in euro)
+    3. purchasePrice               Price paid at closing, the loan takes out part of it (in euro)
+    4. ltv                         Loan to value (decimal)
+    5. interestRate                Annual interest rate (decimal)
+    6. amortization                Amortization period after the interest-only period (in month)
+    7. interestOnlyYears           Years at the start in which only interest is paid
+    8. initialTermYears            Years before the first extension fee is due
+    9. maturityYears               Year the loan ends, extensions included. No debt service after it
+    10. entryFee                   Fee at closing (decimal of the loan)
+    11. extensionFee               Fee at the start of every extension year (decimal of the loan)
+    12. exitFee                    Fee when the loan is repaid (decimal of the loan)
+    13. minExitYear                First year the building can be sold (lockout)
+    14. treasuryYield              Treasury yield of the yield maintenance when repaid before maturity, None for no yield maintenance
+    15. repayBalance               True if the outstanding balance is repaid at the exit (or at maturity)
+"""
+class LoanSpec(namedtuple('LoanSpec', ['name', 'propertyValue', 'purchasePrice', 'ltv', 'interestRate', 'amortization',
+                                       'interestOnlyYears', 'initialTermYears', 'maturityYears', 'entryFee',
+                                       'extensionFee', 'exitFee', 'minExitYear', 'treasuryYield', 'repayBalance'])):
+    __slots__ = ()
+
+    """ GET FUNCTIONS """
+    def getPrincipal(self): return self.propertyValue*self.ltv
+
+"""
+    function: getLoanSchedule
+    =========================
+    Return the monthly schedule of a loan spec, computed once per spec and kept in
+    LOAN_SCHEDULE_CACHE. The schedule spans the whole interest-only and amortization period.
+
+    The outputs of this function are a dict of read-only arrays
+
+    payment = monthly payment (negative), interest only and then the level payment of the amortization
+    balance = outstanding balance at the start of every month, one more entry than payment
+    debtService = annual debt service (negative) of the years before maturity
+    yearBalance = outstanding balance at the start of every year
+"""
+def getLoanSchedule(spec):
+    schedule = LOAN_SCHEDULE_CACHE.get(spec)
+    if schedule is None:
+        principal = spec.getPrincipal()
+        monthlyRate = spec.interestRate/12.0
+        interestOnlyMonths = 12*spec.interestOnlyYears
+        months = np.arange(interestOnlyMonths + spec.amortization + 1)
+        amortized = np.clip(months - interestOnlyMonths, 0, spec.amortization)
+        levelPayment = pmt(monthlyRate, spec.amortization, principal)
+        balance = np.where(months < interestOnlyMonths, principal, pv(monthlyRate, spec.amortization - amortized, levelPayment))
+        payment = np.where(months[:-1] < interestOnlyMonths, -monthlyRate*principal, levelPayment)
+        schedule = {'payment': payment,
+                    'balance': balance,
+                    'debtService': payment[:12*spec.maturityYears].reshape(-1, 12).sum(axis=1),
+                    'yearBalance': balance[::12]}
+        for array in schedule.values(): array.flags.writeable = False
+        LOAN_SCHEDULE_CACHE.put(spec, schedule)
+    return schedule
+
+"""
+    function: getBalance
+    ====================
+    Return the outstanding balance of a loan spec at the start of the given year.
+"""
+def getBalance(spec, year):
+    return float(getLoanSchedule(spec)['yearBalance'][year])
+
+"""
+    function: getLoanFlows
+    ======================
+    Return the cash flows of the loan alone (debt service, fees and yield maintenance) for an
+    exit at the beginning of yearExit, as an array of yearExit + 1 values. The principal and
+    its repayment are left to getFinancingFlows.
+"""
+def getLoanFlows(spec, yearExit):
+    if yearExit < spec.minExitYear: raise ExitLockoutError("yearExit must be at least %d" % spec.minExitYear)
+    schedule = getLoanSchedule(spec)
+    principal = spec.getPrincipal()
+    repaid = min(yearExit, spec.maturityYears)
+    flows = np.zeros(yearExit + 1)
+    flows[:repaid] = schedule['debtService'][:repaid]
+    flows[0] -= spec.entryFee*principal
+    flows[spec.initialTermYears:repaid] -= spec.extensionFee*principal
+    if repaid > 0: flows[repaid] -= spec.exitFee*principal
+    if spec.treasuryYield is not None and yearExit < spec.maturityYears:
+        remaining = spec.maturityYears - yearExit
+        flows[yearExit] += ((spec.interestRate - spec.treasuryYield)*((1 - (1 + spec.treasuryYield)**remaining)/spec.treasuryYield)
+                            *schedule['yearBalance'][yearExit])
+    return flows
+
+"""
+    function: getFinancingFlows
+    ===========================
+    Return getLoanFlows plus the loan take out net of the purchase price at closing and, when
+    the spec repays its balance, the repayment at the exit or at maturity.
+"""
+def getFinancingFlows(spec, yearExit):
+    flows = getLoanFlows(spec, yearExit)
+    flows[0] += spec.getPrincipal() - spec.purchasePrice
+    if spec.repayBalance:
+        repaid = min(yearExit, spec.maturityYears)
+        flows[repaid] -= getLoanSchedule(spec)['yearBalance'][repaid]
+    return flows
+
+"""
+    function: getMonthlyFinancingFlows
+    ==================================
+    Monthly version of getFinancingFlows for an exit at the beginning of month exitMonth after
+    closing, as an array of exitMonth + 1 values: the monthly payments of the schedule, the
+    fees at the start of their year and the repayment at the exit or at maturity. The yield
+    maintenance runs on the exact remaining time, in months.
+"""
+def getMonthlyFinancingFlows(spec, exitMonth):
+    if exitMonth < 12*spec.minExitYear: raise ExitLockoutError("exitMonth must be at least %d" % (12*spec.minExitYear))
+    schedule = getLoanSchedule(spec)
+    principal = spec.getPrincipal()
+    repaid = min(exitMonth, 12*spec.maturityYears)
+    flows = np.zeros(exitMonth + 1)
+    flows[:repaid] = schedule['payment'][:repaid]
+    flows[0] += principal - spec.purchasePrice - spec.entryFee*principal
+    flows[12*spec.initialTermYears:repaid:12] -= spec.extensionFee*principal
+    if repaid > 0: flows[repaid] -= spec.exitFee*principal
+    if spec.treasuryYield is not None and exitMonth < 12*spec.maturityYears:
+        remaining = spec.maturityYears - exitMonth/12.0
+        flows[exitMonth] += ((spec.interestRate - spec.treasuryYield)*((1 - (1 + spec.treasuryYield)**remaining)/spec.treasuryYield)
+                             *schedule['balance'][exitMonth])
+    if spec.repayBalance: flows[repaid] -= schedule['balance'][repaid]
+    return flows
+
+"""
+    function: getNetLoanCashFlow
+    ============================
+    Compute the net cash flow of a loan spec. This function requires four input variables.
+
+    cashFlowBeforeDebtService = cash flow before the debt of service
+    netOperatingIncome = net operating income
+    yearExit = The beginning of the year that sells the building.
+
+    The outputs of this function are
+
+    netCashFlow = the net cash flow, without the cash flow before debt service of the exit year
+    DCSR = net operating income / debt service of the years before the exit and maturity
+"""
+def getNetLoanCashFlow(spec, cashFlowBeforeDebtService, netOperatingIncome, yearExit):
+    flows = getLoanFlows(spec, yearExit)
+    held = min(yearExit, len(cashFlowBeforeDebtService))
+    flows[:held] += cashFlowBeforeDebtService[:held]
+    debtService = getLoanSchedule(spec)['debtService']
+    DCSR = [-(netOperatingIncome[i] if i < len(netOperatingIncome) else 0)/debtService[i]
+            for i in xrange(min(yearExit, spec.maturityYears))]
+    return flows.tolist(), DCSR
+
+"""
+    function: getSalePrice
+    ======================
+    Sale price at the exit: the net operating income of the exit year (or of the last year of
+    the lease) over the cap rate.
+"""
+def getSalePrice(netOperatingIncome, capRate, yearExit):
+    return netOperatingIncome[min(yearExit, len(netOperatingIncome) - 1)]/capRate
+
+"""
+    function: getLeveragedLoanCashFlow
+    ==================================
+    Compute the leveraged cash flow from the output of getNetLoanCashFlow: the loan take out
+    net of the purchase price at closing, the repayment of the balance when the spec has one and,
+    when isEnd is True, the sale price at the exit.
+"""
+def getLeveragedLoanCashFlow(spec, netCashFlow, netOperatingIncome, capRate, yearExit, isEnd=True):
+    leveragedCashFlow = list(netCashFlow)
+    leveragedCashFlow[0] += spec.getPrincipal() - spec.purchasePrice
+    if spec.repayBalance:
+        repaid = min(yearExit, spec.maturityYears)
+        leveragedCashFlow[repaid] -= getBalance(spec, repaid)
+    if isEnd: leveragedCashFlow[-1] += getSalePrice(netOperatingIncome, capRate, len(netCashFlow) - 1)
+    return leveragedCashFlow
+
+"""
+    function: getLeveragedLoanCashFlowBatch
+    =======================================
+    Leveraged cash flows of many term sheets on the same tenant in one pass. This function
+    requires five input variables and one optional.
+
+    specs = list of LoanSpec, e.g. [renter.getLenderSpec('A')._replace(ltv=ltv) for ltv in (0.5, 0.6, 0.7)]
+    cashFlowBeforeDebtService = cash flow before the debt of service
+    netOperatingIncome = net operating income
+    capRate = capital rate at the exit, a number or one per spec
+    yearExit = The beginning of the year that sells the building.
+    isEnd = True to add the sale price at the exit
+
+    Return an array of shape (len(specs), yearExit + 1), one leveraged cash flow per spec.
+"""
+def getLeveragedLoanCashFlowBatch(specs, cashFlowBeforeDebtService, netOperatingIncome, capRate, yearExit, isEnd=True):
+    flows = np.array([getFinancingFlows(spec, yearExit) for spec in specs])
+    held = min(yearExit, len(cashFlowBeforeDebtService))
+    flows[:, :held] += np.asarray(cashFlowBeforeDebtService[:held], dtype=np.float64)
+    if isEnd: flows[:, -1] += getSalePrice(netOperatingIncome, np.asarray(capRate, dtype=np.float64), yearExit)
+    return flows
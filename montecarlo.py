@@ -0,0 +1,163 @@
+from datetime import date
+import numpy as np
+import aggregate
+import cashflow
+import loan
+import renter
+import sweep
+
+# Monte Carlo Assumption on the re-leasing market
+RENT_VOLATILITY = 0.10 # lognormal volatility of the re-leasing rent around the market trend
+FUTURE_TERMS = (5, 10, 15) # lease terms (in year) a future tenant signs, equally likely
+MONTE_CARLO_CHUNK_SIZE = 65536 # paths held in memory at once
+
+# Financing structure of the Topshop vacancy branch behind each outcome function
+MONTE_CARLO_STRUCTURES = {
+    cashflow.topshopUnleveragedOutcome: 'unleveraged',
+    cashflow.topshopLenderAOutcome: 'lenderA',
+    cashflow.topshopLenderBOutcome: 'lenderB'
+}
+
+"""
+    function: getTopshopHead
+    ========================
+    Compute the part of the Topshop cash flow that does not depend on the vacancy path, as the
+    *CashFlows functions of cashflow.py do before their vacancy loop.
+
+    The outputs of this function are
+
+    head = cash flow while Topshop is in place
+    headDates = transaction dates of head (plus the date of the maintenance cost for the lenders)
+"""
+def getTopshopHead(structure, tenant, renter_exit_year, sell_year, capRate):
+    if structure == 'unleveraged':
+        head = renter.getCashFlowUnleveraged(cashFlowBeforeDebtService=tenant.getCashFlowBeforeDebtService(),
+                                             netOperatingIncome=tenant.getNetOperatingIncome(),
+                                             capRate=capRate)
+        headDates = renter.getTransactionDates(renter.FIRST_TRANSACTION_DATE, renter_exit_year)
+    else:
+        head, DCSR = renter.getNetCashFlowLenderA(tenant.getTerm(), tenant.getCashFlowBeforeDebtService(), tenant.getNetOperatingIncome(), yearExit=sell_year)
+        head = renter.getLeveragedCashFlowLenderA(head, tenant.getNetOperatingIncome(), capRate, yearExit=sell_year, isEnd=False)
+        headDates = renter.getTransactionDates(renter.FIRST_TRANSACTION_DATE, len(head) + 1)
+    return head, headDates
+
+"""
+    function: evaluateGroup
+    =======================
+    Build and solve the merged cash flows of every path sharing the same vacancy length q (in
+    quarters) and future term. Only the re-leasing rent differs between these paths, so the
+    transaction dates are shared and the future tenant schedules are built as one 2-D array.
+    Return an array of shape (len(rents), len(sweep.METRICS)).
+"""
+def evaluateGroup(structure, tenant, head, headDates, renter_exit_year, sell_year, q, term, rents):
+    futureTerm = max(1, sell_year - renter_exit_year - int(3*q/12))
+    schedules = renter.computeScheduleArrays(rents, term, cashflow.ANNUAL_INCREASE, cashflow.ABATEMENT, cashflow.TI,
+                                             hasName=True)
+    # When the future lease ends before the sale, the building stays empty until sell_year and is
+    # sold on the NOI of the last year of the lease, where getCashFlowFutureUnleveraged sells nothing
+    leased = min(futureTerm, term)
+    future = np.zeros((len(rents), futureTerm + 1))
+    future[:, :leased] = schedules['cashFlowBeforeDebtService'][:, :leased]
+    future[:, futureTerm] = schedules['netOperatingIncome'][:, min(futureTerm, term - 1)]/cashflow.CAP_RATE
+
+    maintentanceCost = 3*q/12.0*tenant.getOperatingExpense()[-1]*tenant.getAnnualIncrease()
+    nextTransactionYear = 2015 + renter_exit_year + (3*q + 7)/12
+    nextTransactionMonth = (7 + 3*q) % 12
+    nextTransactionDate = date(nextTransactionYear, nextTransactionMonth, 1)
+
+    headFlows = np.tile(head, (len(rents), 1))
+    if structure == 'unleveraged' and q == 0:
+        future[:, 0] += maintentanceCost
+        flows = np.hstack([headFlows, future])
+        transactionDate = renter.getTransactionDates(nextTransactionDate, futureTerm + 1, prefix=headDates)
+    elif structure == 'unleveraged':
+        flows = np.hstack([headFlows, np.full((len(rents), 1), maintentanceCost), future])
+        transactionDate = renter.getTransactionDates(nextTransactionDate, futureTerm + 1,
+                                                     prefix=renter.getTransactionDates(renter.FIRST_TRANSACTION_DATE, renter_exit_year + 1))
+    else:
+        flows = np.hstack([headFlows, np.full((len(rents), 1), maintentanceCost), future])
+        transactionDate = renter.getTransactionDates(nextTransactionDate, futureTerm + 1, prefix=headDates)
+    if structure == 'lenderA':
+        flows[:, -1] -= loan.getBalance(renter.getLenderSpec('A'), sell_year)
+
+    lead = (transactionDate[0] - renter.SUNK_COST_DATES[0]).days / 365.0
+    return renter.computeMetrics(flows, renter.getYearFractions(transactionDate), lead)
+
+"""
+    function: simulateChunks
+    ========================
+    Generator behind simulate, yielding one (draws, values) pair per chunk of at most chunkSize
+    paths so that arbitrarily many paths run in bounded memory. draws is a dict of the per-path
+    vacancy quarters 'q', re-leasing rent per sqm 'rent' and future 'term'; values has one row
+    of sweep.METRICS per path.
+"""
+def simulateChunks(outcome, renter_exit_year, sell_year, capRate, paths, seed=None, rentVolatility=RENT_VOLATILITY,
+                   futureTerms=FUTURE_TERMS, chunkSize=MONTE_CARLO_CHUNK_SIZE, tenant=None):
+    structure = MONTE_CARLO_STRUCTURES[outcome]
+    if sell_year <= renter_exit_year:
+        raise ValueError("sell_year must be after renter_exit_year for the vacancy to matter")
+    if tenant is None: tenant = cashflow.topshop
+    if tenant.getTerm() != renter_exit_year: tenant.setTerm(renter_exit_year)
+    head, headDates = getTopshopHead(structure, tenant, renter_exit_year, sell_year, capRate)
+
+    randomState = np.random.RandomState(seed)
+    maxQuarters = cashflow.POISSON_EMPTY_UPPER_TRUNCATE - cashflow.POISSON_EMPTY_LOWER_TRUNCATE
+    for start in xrange(0, paths, chunkSize):
+        n = min(chunkSize, paths - start)
+        # Same buckets as POISSON_EMPTY_DIST: q = 0 up to the lower truncation, the tail is lumped into maxQuarters
+        q = np.clip(randomState.poisson(cashflow.POISSON_EMPTY_MEAN, n) - cashflow.POISSON_EMPTY_LOWER_TRUNCATE, 0, maxQuarters)
+        shock = np.exp(rentVolatility*randomState.standard_normal(n) - 0.5*rentVolatility**2)
+        rent = cashflow.INITIAL_RENT_PER_SQM_AT_2015 * (1 + cashflow.ANNUAL_INCREASE)**(renter_exit_year + 3*q/12.0) * shock
+        term = np.asarray(futureTerms)[randomState.randint(0, len(futureTerms), n)]
+
+        values = np.empty((n, len(sweep.METRICS)))
+        for groupQ in np.unique(q):
+            for groupTerm in np.unique(term):
+                members = np.flatnonzero((q == groupQ) & (term == groupTerm))
+                if members.size == 0: continue
+                values[members] = evaluateGroup(structure, tenant, head, headDates, renter_exit_year, sell_year,
+                                                int(groupQ), int(groupTerm), rent[members])
+        yield {'q': q, 'rent': rent, 'term': term}, values
+
+"""
+    function: simulate
+    ==================
+    Monte Carlo version of the Topshop outcome functions. Instead of the probability-weighted mean
+    over POISSON_EMPTY_DIST, every path draws its own vacancy length, re-leasing rent (lognormal
+    around the market trend with rentVolatility) and future term (uniform over futureTerms).
+    This function requires five input variables.
+
+    outcome = cashflow.topshopUnleveragedOutcome, cashflow.topshopLenderAOutcome or cashflow.topshopLenderBOutcome
+    renter_exit_year = the year Topshop leaves
+    sell_year = the year the building is sold, after renter_exit_year
+    capRate = capital rate at the exit
+    paths = number of paths
+    seed = seed of the random generator, the same seed and chunkSize give the same paths
+
+    Return an array with one row of sweep.METRICS per path. With rentVolatility=0 and
+    futureTerms=(cashflow.FUTURE_TERM,), the mean converges to the outcome function. Note
+    that topshopLenderAOutcome only considers q = 0 while the simulation draws q for it too.
+    Note also that a future term shorter than the years left to sell_year is followed by empty
+    years and a sale at the NOI of its last year, while the outcome functions (through
+    renter.getCashFlowFutureUnleveraged) keep the cash flows of the lease and add no sale.
+"""
+def simulate(outcome, renter_exit_year, sell_year, capRate, paths, seed=None, rentVolatility=RENT_VOLATILITY,
+             futureTerms=FUTURE_TERMS, chunkSize=MONTE_CARLO_CHUNK_SIZE, tenant=None):
+    values = np.empty((paths, len(sweep.METRICS)))
+    start = 0
+    for _, chunkValues in simulateChunks(outcome, renter_exit_year, sell_year, capRate, paths, seed, rentVolatility,
+                                         futureTerms, chunkSize, tenant):
+        values[start:start + len(chunkValues)] = chunkValues
+        start += len(chunkValues)
+    return values
+
+"""
+    function: summarizeSimulation
+    =============================
+    simulate without holding the paths: return the aggregate.StreamingSummary of the
+    sweep.METRICS of every path, built chunk by chunk.
+"""
+def summarizeSimulation(outcome, renter_exit_year, sell_year, capRate, paths, seed=None, rentVolatility=RENT_VOLATILITY,
+                        futureTerms=FUTURE_TERMS, chunkSize=MONTE_CARLO_CHUNK_SIZE, tenant=None):
+    return aggregate.summarize(values for _, values in simulateChunks(outcome, renter_exit_year, sell_year, capRate, paths, seed,
+                                                                      rentVolatility, futureTerms, chunkSize, tenant))
@@ -0,0 +1,186 @@
+from collections import namedtuple
+import numpy as np
+import cashflow
+import loan
+import renter
+
+MONTHS_PER_YEAR = 12
+
+"""
+    class: Lease
+    ============
+    class Lease is one lease on the monthly grid. Every field is either a number or a 1-D array
+    with one value per scenario row, so the leases of many scenarios (e.g. one per vacancy
+    length) are built in one pass.
+    This class requires 7 inputs
+
+    1. initialRentPerSqm           Rent of the first lease year (in euro per sqm per year)
+    2. annualIncrease              Rent increase at every lease anniversary (decimal)
+    3. abatement                   Months without rent at the start of the lease
+    4. ti                          Tenant Improvement paid at the start of the lease (in euro per sqm)
+    5. startMonth                  First month of the lease, counted from July 2015
+    6. termMonths                  Length of the lease (in month)
+    7. totalSqm                    Leased area (in sqm)
+"""
+class Lease(namedtuple('Lease', ['initialRentPerSqm', 'annualIncrease', 'abatement', 'ti', 'startMonth', 'termMonths', 'totalSqm'])):
+    __slots__ = ()
+
+    """ GET FUNCTIONS """
+    def getEndMonth(self): return np.asarray(self.startMonth) + np.asarray(self.termMonths)
+
+"""
+    function: getRenterLease
+    ========================
+    Return the Lease of a Renter starting at startMonth, for its whole term by default.
+"""
+def getRenterLease(tenant, startMonth=0, termMonths=None):
+    name, initialRentPerSqm, term, annualIncrease, isGuarantee, abatement, ti, capRate = tenant.getInputs()
+    if termMonths is None: termMonths = MONTHS_PER_YEAR*term
+    return Lease(initialRentPerSqm, annualIncrease, abatement, ti, startMonth, termMonths, renter.TOTAL_AREA)
+
+"""
+    function: rollUp
+    ================
+    Sum a monthly array (one month per column) into years of MONTHS_PER_YEAR columns. A last
+    partial year is summed as it is.
+"""
+def rollUp(monthly):
+    monthly = np.asarray(monthly, dtype=np.float64)
+    years = -(-monthly.shape[-1]//MONTHS_PER_YEAR)
+    padded = np.zeros(monthly.shape[:-1] + (years*MONTHS_PER_YEAR,))
+    padded[..., :monthly.shape[-1]] = monthly
+    return padded.reshape(monthly.shape[:-1] + (years, MONTHS_PER_YEAR)).sum(axis=-1)
+
+"""
+    function: computeMonthlySchedules
+    =================================
+    Compute the monthly schedules of a building let through a list of leases, for rows
+    scenarios over horizon months from July 2015. The building pays the operating expense and
+    the capital reserve every month, a lease reimburses the operating expense of the months it
+    is occupied, so a vacant month costs the unreimbursed expense. Within a lease, the rent
+    increases at every anniversary and the first abatement months are free.
+
+    Rolled up to years, the schedules of a single lease starting in July 2015 with at most 12
+    months of abatement are those of renter.computeScheduleArrays.
+
+    Return a dict from schedule name (as in renter.RENTER_SCHEDULE_STAGE) to an array of shape
+    (rows, horizon).
+"""
+def computeMonthlySchedules(leases, rows, horizon):
+    months = np.arange(horizon)
+    operatingExpense = (renter.INITIAL_OPERATING_EXPENSE/MONTHS_PER_YEAR*
+                        (1 + renter.OPERATING_EXPENSE_INCREASE_RATE)**(months//MONTHS_PER_YEAR))
+    schedules = {'baseRentalRevenue': np.zeros((rows, horizon)),
+                 'baseRentalAbatement': np.zeros((rows, horizon)),
+                 'expenseReimburseRevenue': np.zeros((rows, horizon)),
+                 'leasingCommission': np.zeros((rows, horizon)),
+                 'totalLeasingAndCapitalCost': np.zeros((rows, horizon))}
+    for lease in leases:
+        initialRentPerSqm, annualIncrease, abatement, ti, startMonth, termMonths, totalSqm = [
+            np.broadcast_to(np.asarray(value, dtype=np.float64), (rows,))[:, None] for value in lease]
+        leaseMonth = months - startMonth
+        occupied = (leaseMonth >= 0) & (leaseMonth < termMonths)
+        rent = np.where(occupied, initialRentPerSqm*totalSqm/MONTHS_PER_YEAR*(1 + annualIncrease)**(leaseMonth//MONTHS_PER_YEAR), 0.0)
+        schedules['baseRentalRevenue'] += rent
+        schedules['baseRentalAbatement'] += np.where(leaseMonth < abatement, rent, 0.0)
+        schedules['expenseReimburseRevenue'] += np.where(occupied, operatingExpense, 0.0)
+        schedules['leasingCommission'] += renter.LEASING_COMMISSION_RATE*rent
+        schedules['totalLeasingAndCapitalCost'] += np.where(leaseMonth == 0, ti*totalSqm, 0.0)
+    schedules['operatingExpense'] = np.tile(operatingExpense, (rows, 1))
+    schedules['scheduleBaseRentalRevenue'] = schedules['baseRentalRevenue'] - schedules['baseRentalAbatement']
+    schedules['totalGrossRevenue'] = schedules['scheduleBaseRentalRevenue'] + schedules['expenseReimburseRevenue']
+    schedules['netOperatingIncome'] = schedules['totalGrossRevenue'] - schedules['operatingExpense']
+    schedules['capitalReserve'] = np.full((rows, horizon), renter.TOTAL_AREA*renter.CAPITAL_RESERVE_RATE/MONTHS_PER_YEAR)
+    schedules['totalLeasingAndCapitalCost'] += schedules['capitalReserve'] + schedules['leasingCommission']
+    schedules['cashFlowBeforeDebtService'] = schedules['netOperatingIncome'] - schedules['totalLeasingAndCapitalCost']
+    return schedules
+
+"""
+    function: getMonthlyCashFlows
+    =============================
+    Build the monthly cash flows of a building let through a list of leases and sold at the
+    beginning of sellMonth. This function requires four input variables and one optional.
+
+    leases = list of Lease (see computeMonthlySchedules)
+    rows = number of scenario rows
+    sellMonth = month of the sale, counted from July 2015
+    capRate = capital rate at the exit
+    spec = loan.LoanSpec of the financing, None for the unleveraged case
+
+    The sale price is the net operating income of the 12 months from the sale over capRate,
+    or of the last 12 months of the leases when they end before. Return an array of shape
+    (rows, sellMonth + 1), one cash flow per month.
+"""
+def getMonthlyCashFlows(leases, rows, sellMonth, capRate, spec=None):
+    horizon = sellMonth + MONTHS_PER_YEAR
+    schedules = computeMonthlySchedules(leases, rows, horizon)
+    lastEnd = np.broadcast_to(np.max([np.broadcast_to(lease.getEndMonth(), (rows,)) for lease in leases], axis=0), (rows,))
+    window = np.clip(np.minimum(sellMonth, lastEnd - MONTHS_PER_YEAR), 0, sellMonth).astype(np.int64)
+    cumulative = np.zeros((rows, horizon + 1))
+    cumulative[:, 1:] = np.cumsum(schedules['netOperatingIncome'], axis=1)
+    index = np.arange(rows)
+    salePrice = (cumulative[index, window + MONTHS_PER_YEAR] - cumulative[index, window])/capRate
+
+    flows = schedules['cashFlowBeforeDebtService'][:, :sellMonth + 1].copy()
+    flows[:, sellMonth] = salePrice
+    if spec is None: flows[:, 0] -= renter.PURCHASE_PRICE
+    else: flows += loan.getMonthlyFinancingFlows(spec, sellMonth)
+    return flows
+
+"""
+    function: getScenarioLeases
+    ===========================
+    Return the leases, the number of rows and the row probabilities of a scenario of a tenant of
+    cashflow.TENANT_CASH_FLOWS, with the same arguments as its cash flow builders.
+
+    Topshop sold after it leaves gets one row per vacancy length of cashflow.POISSON_EMPTY_DIST:
+    its lease ends after renter_exit_year, the building is empty for 3*q months and the future
+    tenant of cashflow.getFutureTenantInputs moves in at the market rent of that exact month.
+"""
+def getScenarioLeases(tenantName, args, tenant=None):
+    if tenant is None: tenant = getattr(cashflow, tenantName)
+    if tenantName != 'topshop':
+        return [getRenterLease(tenant)], 1, np.ones(1)
+    renter_exit_year, sell_year, capRate = args
+    topshopLease = getRenterLease(tenant, termMonths=MONTHS_PER_YEAR*renter_exit_year)
+    if sell_year <= renter_exit_year:
+        return [topshopLease], 1, np.ones(1)
+
+    quarters = np.array(sorted(cashflow.POISSON_EMPTY_DIST), dtype=np.float64)
+    startMonth = MONTHS_PER_YEAR*renter_exit_year + 3*quarters
+    futureLease = Lease(cashflow.INITIAL_RENT_PER_SQM_AT_2015*(1 + cashflow.ANNUAL_INCREASE)**(startMonth/MONTHS_PER_YEAR),
+                        cashflow.ANNUAL_INCREASE, cashflow.ABATEMENT, cashflow.TI, startMonth,
+                        MONTHS_PER_YEAR*cashflow.FUTURE_TERM, renter.TOTAL_AREA)
+    probs = np.array([cashflow.POISSON_EMPTY_DIST[q] for q in sorted(cashflow.POISSON_EMPTY_DIST)])
+    return [topshopLease, futureLease], len(quarters), probs
+
+"""
+    function: computeMonthlyMetrics
+    ===============================
+    renter.computeMetrics on monthly cash flows from July 2015, with the exact day count of
+    every month.
+"""
+def computeMonthlyMetrics(flows):
+    years = renter.getYearFractions(renter.getTransactionDates(renter.FIRST_TRANSACTION_DATE, flows.shape[1], step=1))
+    lead = (renter.FIRST_TRANSACTION_DATE - renter.SUNK_COST_DATES[0]).days / 365.0
+    return renter.computeMetrics(flows, years, lead)
+
+"""
+    function: monthlyOutcome
+    ========================
+    Monthly-resolution counterpart of the outcome functions of cashflow.py. This function
+    requires two input variables and the arguments of the tenant's outcome functions.
+
+    tenantName = 'topshop', 'zara' or 'decathlon'
+    structure = 'unleveraged', 'lenderA' or 'lenderB' (see cashflow.STRUCTURES)
+    args = (renter_exit_year, sell_year, capRate) for Topshop, (sell_year, capRate) otherwise
+
+    Every row of the vacancy distribution is used for every structure. tenant is a Renter
+    used instead of the module instance. Return the probability-weighted (irr,
+    irrWithNoSunkCost, equityMultiple, equityMultipleWithNoSunkCost).
+"""
+def monthlyOutcome(tenantName, structure, *args, **kwargs):
+    leases, rows, probs = getScenarioLeases(tenantName, args, kwargs.get('tenant'))
+    spec = None if structure == 'unleveraged' else renter.getLenderSpec({'lenderA': 'A', 'lenderB': 'B'}[structure])
+    flows = getMonthlyCashFlows(leases, rows, MONTHS_PER_YEAR*args[-2], args[-1], spec)
+    return tuple(float(value) for value in np.dot(probs, computeMonthlyMetrics(flows)))
@@ -0,0 +1,161 @@
+import numpy as np
+import cashflow
+import renter
+import sweep
+
+OPTIMIZER_BATCH_SIZE = 8 # candidates solved per round, those with the highest IRR upper bounds
+
+# Lender net cash flow function of every leveraged structure, the source of the DSCR
+LENDER_NET_CASH_FLOWS = {'lenderA': renter.getNetCashFlowLenderA, 'lenderB': renter.getNetCashFlowLenderB}
+
+def getCandidateArgs(tenantName, sellYears, capRate, renterExitYears):
+    if tenantName == 'topshop': return [(r, s, capRate) for r in renterExitYears for s in sellYears]
+    return [(s, capRate) for s in sellYears]
+
+"""
+    function: getMinDSCR
+    ====================
+    Return the lowest DCSR returned by getNetCashFlowLenderA/B for a scenario of a tenant, i.e.
+    the worst debt service coverage of the years before the exit and the maturity, inf for the
+    unleveraged structure. The coverage only counts the NOI of the tenant's own lease, so a
+    Topshop scenario holding the building after Topshop leaves has a DSCR of 0. As in
+    cashflow.topshopLenderBCashFlows, that scenario is financed on the Lender A terms.
+"""
+def getMinDSCR(tenantName, structure, args, tenant=None):
+    if structure not in LENDER_NET_CASH_FLOWS: return np.inf
+    if tenant is None: tenant = cashflow.getBuilderTenant(cashflow.TENANT_CASH_FLOWS[tenantName][structure])
+    getNetCashFlow = LENDER_NET_CASH_FLOWS[structure]
+    if tenantName == 'topshop':
+        if tenant.getTerm() != args[0]: tenant.setTerm(args[0])
+        if args[1] > args[0]: getNetCashFlow = renter.getNetCashFlowLenderA
+    DCSR = getNetCashFlow(tenant.getTerm(), tenant.getCashFlowBeforeDebtService(),
+                         tenant.getNetOperatingIncome(), yearExit=args[-2])[1]
+    return min(DCSR) if DCSR else np.inf
+
+"""
+    function: getDominated
+    ======================
+    Return the boolean mask of the candidates that are surely dominated, given bounds of their
+    IRR and their equity multiple: candidate c is dominated when another candidate d has
+    lower[d] >= upper[c] and multiple[d] >= multiple[c], one of them strictly.
+    With lower = upper = irr, this is the plain Pareto dominance.
+"""
+def getDominated(lower, upper, multiple):
+    with np.errstate(invalid='ignore'):
+        atLeast = (lower[:, None] >= upper[None, :]) & (multiple[:, None] >= multiple[None, :])
+        strictly = (lower[:, None] > upper[None, :]) | (multiple[:, None] > multiple[None, :])
+    return (atLeast & strictly).any(axis=0)
+
+"""
+    class: OptimizerStats
+    =====================
+    Counters of an optimize run, summed over its cap rates: candidates, infeasible (below
+    the equity multiple or DSCR floor), pruned (dominated by the IRR bounds), solved
+    (candidates whose IRRs were solved), solvedRows and gridRows (the cash flow rows solved,
+    and those an exhaustive grid would solve).
+"""
+class OptimizerStats(dict):
+
+    def __init__(self):
+        dict.__init__(self, candidates=0, infeasible=0, pruned=0, solved=0, solvedRows=0, gridRows=0)
+
+    def add(self, name, count): self[name] += int(count)
+
+"""
+    function: optimize
+    ==================
+    Find the tenant, financing structure and sell year (and Topshop exit year) that maximize
+    the IRR and the equity multiple, without solving the IRR of every scenario. This function
+    requires two input variables and five optional.
+
+    sellYears = sell years to search
+    capRates = exit cap rates, each one is a separate scenario with its own Pareto set
+    renterExitYears = years Topshop may leave (required when searching Topshop)
+    tenants = tenants of cashflow.TENANT_CASH_FLOWS to search
+    structures = financing structures of cashflow.STRUCTURES to search
+    minEquityMultiple = floor of the equity multiple, None for no floor
+    minDSCR = floor of the lowest DSCR (see getMinDSCR), None for no floor
+    stats = OptimizerStats updated with the counts of the run
+
+    The equity multiples and the DSCR need no IRR solve, so infeasible scenarios are dropped
+    first. The IRRs of the others are bounded by renter.getIRRBounds, and tightened by the
+    monotonicity in the cap rate: a scenario is worth less at a higher cap rate, so its IRR at
+    the previous cap rate bounds it. Then the scenarios with the highest upper bounds are
+    solved in rounds of OPTIMIZER_BATCH_SIZE, and every round prunes the scenarios whose upper
+    bound is dominated by the lower bound of another one.
+
+    Return a dict from cap rate to the Pareto set of (irr, equityMultiple): a list of dicts
+    with tenant, structure, args, DSCR and the metrics of sweep.METRICS, by decreasing irr.
+    The first entry is the best IRR under the floors.
+"""
+def optimize(sellYears, capRates, renterExitYears=None, tenants=('topshop', 'zara', 'decathlon'),
+             structures=cashflow.STRUCTURES, minEquityMultiple=None, minDSCR=None, stats=None):
+    if 'topshop' in tenants and renterExitYears is None: raise ValueError("topshop requires renterExitYears")
+    if stats is None: stats = OptimizerStats()
+    previousUpper = {}
+    paretoSets = {}
+    for capRate in sorted(capRates):
+        candidates, cellRows = [], []
+        for tenantName in tenants:
+            for structure in structures:
+                buildCashFlows = cashflow.TENANT_CASH_FLOWS[tenantName][structure]
+                for args in getCandidateArgs(tenantName, sellYears, capRate, renterExitYears):
+                    weightedCashFlows = sweep.buildCells(buildCashFlows, [args])[0]
+                    if weightedCashFlows is None: continue
+                    candidates.append((tenantName, structure, args))
+                    cellRows.append(weightedCashFlows)
+        stats.add('candidates', len(candidates))
+        stats.add('gridRows', sum(len(weightedCashFlows) for weightedCashFlows in cellRows))
+        if not candidates:
+            paretoSets[capRate] = []
+            continue
+
+        owners = np.repeat(np.arange(len(candidates)), [len(weightedCashFlows) for weightedCashFlows in cellRows])
+        probs = np.array([prob for weightedCashFlows in cellRows for prob, _, _ in weightedCashFlows])
+        transactionDates = [transactionDate for weightedCashFlows in cellRows for _, _, transactionDate in weightedCashFlows]
+        flows, years = renter.padTransactions([cashFlow for weightedCashFlows in cellRows for _, cashFlow, _ in weightedCashFlows],
+                                              transactionDates)
+        lead = [((renter.FIRST_TRANSACTION_DATE if transactionDate is None else transactionDate[0]) - renter.SUNK_COST_DATES[0]).days / 365.0
+                for transactionDate in transactionDates]
+        multiple = np.bincount(owners, weights=probs*renter.computeEquityMultipleBatch(flows))
+        feasible = np.ones(len(candidates), dtype=bool)
+        if minEquityMultiple is not None: feasible &= multiple >= minEquityMultiple
+        if minDSCR is not None:
+            feasible &= np.array([feasible[c] and getMinDSCR(*candidates[c]) >= minDSCR for c in xrange(len(candidates))])
+        stats.add('infeasible', (~feasible).sum())
+
+        keep = np.flatnonzero(feasible)
+        rows = np.flatnonzero(feasible[owners])
+        sunkFlows, sunkYears = renter.getSunkCostFlows(flows[rows], years[rows], np.asarray(lead)[rows])
+        rowLower, rowUpper = renter.getIRRBounds(sunkFlows, sunkYears)
+        position = np.full(len(candidates), -1)
+        position[keep] = np.arange(len(keep))
+        lower = np.bincount(position[owners[rows]], weights=probs[rows]*rowLower, minlength=len(keep))
+        upper = np.bincount(position[owners[rows]], weights=probs[rows]*rowUpper, minlength=len(keep))
+        decisions = [candidates[c][:2] + (candidates[c][2][:-1],) for c in keep]
+        upper = np.minimum(upper, [previousUpper.get(decision, np.inf) for decision in decisions])
+        multiple = multiple[keep]
+
+        metrics = np.full((len(keep), len(sweep.METRICS)), np.nan)
+        solved = np.zeros(len(keep), dtype=bool)
+        decided = np.zeros(len(keep), dtype=bool)
+        while True:
+            decided |= getDominated(lower, upper, multiple) & ~solved
+            remaining = np.flatnonzero(~decided)
+            if remaining.size == 0: break
+            batch = remaining[np.argsort(-upper[remaining], kind='mergesort')[:OPTIMIZER_BATCH_SIZE]]
+            metrics[batch] = sweep.solveCells([cellRows[keep[c]] for c in batch])
+            lower[batch] = upper[batch] = metrics[batch, 0]
+            solved[batch] = decided[batch] = True
+            stats.add('solvedRows', sum(len(cellRows[keep[c]]) for c in batch))
+        stats.add('solved', solved.sum())
+        stats.add('pruned', (~solved).sum())
+        for decision, bound in zip(decisions, upper): previousUpper[decision] = bound
+
+        solvedIndex = np.flatnonzero(solved & ~np.isnan(metrics[:, 0]))
+        front = solvedIndex[~getDominated(metrics[solvedIndex, 0], metrics[solvedIndex, 0], multiple[solvedIndex])]
+        paretoSets[capRate] = [dict(zip(sweep.METRICS, metrics[c].tolist()), tenant=candidates[keep[c]][0],
+                                    structure=candidates[keep[c]][1], args=candidates[keep[c]][2],
+                                    DSCR=float(getMinDSCR(*candidates[keep[c]])))
+                               for c in front[np.argsort(-metrics[front, 0], kind='mergesort')]]
+    return paretoSets
@@ -1,6 +1,11 @@
-from copy import deepcopy
+from collections import namedtuple
+from contextlib import contextmanager
 from datetime import date
-from numpy import pmt, pv
+import numpy as np
+import cache
+import instrument
+import loan
+from data import renterData
 
 BASEMENT_AREA = 904
 GROUND_AREA = 756
@@ -16,6 +21,7 @@ PURCHASE_PRICE = 15000000
 ### LENDER A Constants ###
 LENDER_A_LTV = 0.7
 LENDER_A_INITIAL_TERM = 2 #years
+LENDER_A_EXTENSIONS = 2 # one-year extensions after the initial term
 LENDER_A_AMORTIZATION = 240 # months
 LENDER_A_INTEREST_RATE = 0.05
 LENDER_A_ENTRY_FEE = 0.01
@@ -25,38 +31,287 @@ LENDER_A_EXIT_FEE = 0.01
 ### Lender B Constants ###
 LENDER_B_LTV = 0.6
 LENDER_B_INITIAL_TERM = 5 #years
+LENDER_B_INTEREST_ONLY = 2 #years
+LENDER_B_LOCKOUT = 4 # years before the building can be sold
 LENDER_B_AMORTIZATION = 240 # months
 LENDER_B_INTEREST_RATE = 0.035
 LENDER_B_ENTRY_FEE = 0.005
 TREASURY_YIELD = 0.0014
 
+### Transaction Dates ###
+FIRST_TRANSACTION_DATE = date(2015, 7, 1)
+SUNK_COST_DATES = (date(2013, 4, 1), date(2014, 7, 1)) # deposit and closing, before FIRST_TRANSACTION_DATE
+
+### Cache Sizes ###
+LENDER_CASH_FLOW_CACHE_SIZE = 4096
+TRANSACTION_TABLE_CACHE_SIZE = 4096
+RENTER_POOL_SIZE = 256 # interned FrozenRenter instances
+
+# Module constants the cash flows depend on, part of every cache key built from getAssumptions
+ASSUMPTIONS = ('TOTAL_AREA', 'OPERATING_EXPENSE_INCREASE_RATE', 'LEASING_COMMISSION_RATE', 'CAPITAL_RESERVE_RATE',
+               'INITIAL_OPERATING_EXPENSE', 'DEPOSIT', 'PURCHASE_PRICE',
+               'LENDER_A_LTV', 'LENDER_A_INITIAL_TERM', 'LENDER_A_EXTENSIONS', 'LENDER_A_AMORTIZATION', 'LENDER_A_INTEREST_RATE',
+               'LENDER_A_ENTRY_FEE', 'LENDER_A_PER_EXTENSION_FEE', 'LENDER_A_EXIT_FEE',
+               'LENDER_B_LTV', 'LENDER_B_INITIAL_TERM', 'LENDER_B_INTEREST_ONLY', 'LENDER_B_LOCKOUT',
+               'LENDER_B_AMORTIZATION', 'LENDER_B_INTEREST_RATE', 'LENDER_B_ENTRY_FEE', 'TREASURY_YIELD')
+
+LENDER_CASH_FLOW_CACHE = cache.LRUCache('lenderCashFlow', LENDER_CASH_FLOW_CACHE_SIZE)
+TRANSACTION_DATES_CACHE = cache.LRUCache('transactionDates', TRANSACTION_TABLE_CACHE_SIZE)
+YEAR_FRACTIONS_CACHE = cache.LRUCache('yearFractions', TRANSACTION_TABLE_CACHE_SIZE)
+RENTER_POOL = cache.LRUCache('renterPool', RENTER_POOL_SIZE)
+
+"""
+    Function: getAssumptions
+    ========================
+    Return the current values of the module constants listed in ASSUMPTIONS as a tuple of
+    (name, value) pairs.
+"""
+def getAssumptions():
+    return tuple((name, globals()[name]) for name in ASSUMPTIONS)
+
+"""
+    Function: getLenderSpec
+    =======================
+    Return the loan.LoanSpec of Lender 'A' or 'B' built from the current module constants.
+
+    Lender A amortizes from closing, can be extended twice by a year and is not repaid in the
+    leveraged cash flow. Lender B is interest only for two years, cannot be exited before
+    LENDER_B_LOCKOUT, charges yield maintenance before its initial term and is repaid at the exit.
+"""
+def getLenderSpec(lender):
+    if lender == 'A':
+        return loan.LoanSpec(name='A', propertyValue=DEPOSIT + PURCHASE_PRICE, purchasePrice=PURCHASE_PRICE,
+                             ltv=LENDER_A_LTV, interestRate=LENDER_A_INTEREST_RATE, amortization=LENDER_A_AMORTIZATION,
+                             interestOnlyYears=0, initialTermYears=LENDER_A_INITIAL_TERM,
+                             maturityYears=LENDER_A_INITIAL_TERM + LENDER_A_EXTENSIONS,
+                             entryFee=LENDER_A_ENTRY_FEE, extensionFee=LENDER_A_PER_EXTENSION_FEE, exitFee=LENDER_A_EXIT_FEE,
+                             minExitYear=0, treasuryYield=None, repayBalance=False)
+    if lender == 'B':
+        return loan.LoanSpec(name='B', propertyValue=DEPOSIT + PURCHASE_PRICE, purchasePrice=PURCHASE_PRICE,
+                             ltv=LENDER_B_LTV, interestRate=LENDER_B_INTEREST_RATE, amortization=LENDER_B_AMORTIZATION,
+                             interestOnlyYears=LENDER_B_INTEREST_ONLY, initialTermYears=LENDER_B_INITIAL_TERM,
+                             maturityYears=LENDER_B_INITIAL_TERM,
+                             entryFee=LENDER_B_ENTRY_FEE, extensionFee=0, exitFee=0,
+                             minExitYear=LENDER_B_LOCKOUT, treasuryYield=TREASURY_YIELD, repayBalance=True)
+    raise ValueError("unknown lender %r" % (lender,))
+
+### XIRR Solver Bracket ###
+XIRR_LOWER_BOUND = -0.99
+XIRR_UPPER_BOUND = 10.0
+XIRR_BRACKET_EXPANSIONS = 6 # the upper bound grows tenfold per expansion
+CONTINUATION_SAMPLE_SIZE = 64 # warm solves repeated from their cold seed to estimate the iterations saved
+
+"""
+    Function: xirrBatch
+    ===================
+    Compute xirr for a batch of cash flows at once. This function requires two input variables.
+
+    cashFlows = 2-D array, one row of cash flows per scenario (pad shorter rows with 0)
+    years = year-fraction offsets of each cash flow from the first transaction, either
+            one row shared by every scenario or one row per scenario
+    guess = starting rate, a number or one per scenario
+
+    Each row is solved with Newton's method on x = 1 + rate, safeguarded by the bracket
+    [XIRR_LOWER_BOUND, XIRR_UPPER_BOUND] (widened upwards when it holds no sign change).
+    The bracket shrinks on every iteration and a bisection step is taken whenever the
+    Newton step would leave it. A row is done when its step falls below tol, or when the
+    quadratic convergence of the last two Newton steps predicts the new iterate within tol.
+
+    The outputs of this function are
+
+    irr = array of rates (nan where the row did not converge)
+    converged = boolean array, False when the row has no sign change in the bracket
+                or did not reach the tolerance within maxIter iterations
+    iterations = array of iterations per row, only returned when getIterations is True
+"""
+def xirrBatch(cashFlows, years, guess=0.05, tol=1e-12, maxIter=100, getIterations=False):
+    cashFlows = np.atleast_2d(np.asarray(cashFlows, dtype=np.float64))
+    years = np.broadcast_to(np.atleast_2d(np.asarray(years, dtype=np.float64)), cashFlows.shape)
+    n = cashFlows.shape[0]
+
+    def npv(x, c, t):
+        discount = np.exp(-t*np.log(x)[:, None])
+        value = (c*discount).sum(axis=1)
+        slope = -(t*c*discount).sum(axis=1)/x
+        return value, slope
+
+    lo = np.full(n, 1 + XIRR_LOWER_BOUND)
+    hi = np.full(n, 1 + XIRR_UPPER_BOUND)
+    fLo = npv(lo, cashFlows, years)[0]
+    fHi = npv(hi, cashFlows, years)[0]
+    bracketed = np.sign(fLo) != np.sign(fHi)
+    for _ in xrange(XIRR_BRACKET_EXPANSIONS):
+        grow = np.flatnonzero(~bracketed)
+        if grow.size == 0: break
+        hi[grow] *= 10
+        fHi[grow] = npv(hi[grow], cashFlows[grow], years[grow])[0]
+        bracketed[grow] = np.sign(fLo[grow]) != np.sign(fHi[grow])
+
+    x = np.clip(1.0 + np.broadcast_to(np.asarray(guess, dtype=np.float64), (n,)), lo, hi)
+    converged = np.zeros(n, dtype=bool)
+    lastStep = np.full(n, np.nan)
+    active = np.flatnonzero(bracketed)
+    iterations = np.where(bracketed, maxIter, 0)
+    for iteration in xrange(maxIter):
+        if active.size == 0: break
+        c, t = cashFlows[active], years[active]
+        xa, loa, hia = x[active], lo[active], hi[active]
+        f, df = npv(xa, c, t)
+
+        # keep lo on the same side of the root as the original lower bound
+        sameAsLo = np.sign(f) == np.sign(fLo[active])
+        loa = np.where(sameAsLo, xa, loa)
+        hia = np.where(sameAsLo, hia, xa)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = np.where(f == 0, xa, xa - f/df)
+        inside = (newton >= np.minimum(loa, hia)) & (newton <= np.maximum(loa, hia))
+        xNew = np.where(inside, newton, 0.5*(loa + hia))
+
+        step = np.abs(xNew - xa)
+        # error of xNew predicted from step ~ C*lastStep**2, i.e. C*step**2
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            predicted = np.where(inside, step**3/lastStep[active]**2, np.inf)
+            done = (step <= tol*np.abs(xa)) | (np.abs(hia - loa) <= tol*np.abs(xa)) | (predicted <= tol*np.abs(xNew))
+        x[active], lo[active], hi[active] = xNew, loa, hia
+        lastStep[active] = np.where(inside, step, np.nan)
+        converged[active[done]] = True
+        iterations[active[done]] = iteration + 1
+        active = active[~done]
+
+    if instrument.ENABLED:
+        scale = np.abs(cashFlows).sum(axis=1)
+        residuals = np.abs(npv(x, cashFlows, years)[0])/np.where(scale > 0, scale, 1)
+        instrument.recordXirr(iterations, residuals, converged, bracketed)
+    irr = np.where(converged, x - 1, np.nan)
+    if getIterations: return irr, converged, iterations
+    return irr, converged
+
+"""
+    Function: getContinuationWaves
+    ==============================
+    Order the solves of xirrContinuation. Every chain is a list of (coordinate, row) pairs by
+    increasing coordinate, in which neighbours have nearby roots, e.g. the rows of a line of
+    cells by cap rate. Wave k solves the k-th row of every chain, after the rows before it.
+
+    Return a list of waves, each one a tuple of arrays (rows, coordinates, previous,
+    previousCoordinates, before, beforeCoordinates) with the two rows before every row in its
+    chain and their coordinates (-1 and nan for none).
+"""
+def getContinuationWaves(chains):
+    waves = []
+    for chain in chains:
+        for k, (coordinate, row) in enumerate(chain):
+            if k == len(waves): waves.append([])
+            previous = chain[k - 1] if k >= 1 else (np.nan, -1)
+            before = chain[k - 2] if k >= 2 else (np.nan, -1)
+            waves[k].append((row, coordinate, previous[1], previous[0], before[1], before[0]))
+    return [tuple(np.array(column, dtype=dtype) for column, dtype in zip(zip(*wave), (int, float)*3)) for wave in waves]
+
+"""
+    Function: getNewtonStep
+    =======================
+    Return the length of the Newton step of xirrBatch from rate, one per row of cashFlows: an
+    estimate of the distance from rate to the root, nan where rate is not above -1.
+"""
+def getNewtonStep(cashFlows, years, rate):
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        x = 1 + np.asarray(rate, dtype=np.float64)
+        discount = np.exp(-years*np.log(x)[:, None])
+        return (cashFlows*discount).sum(axis=1)*x/(years*cashFlows*discount).sum(axis=1)
+
+"""
+    Function: xirrContinuation
+    ==========================
+    xirrBatch solved by continuation along chains of neighbouring rows (see getContinuationWaves).
+    The first row of a chain starts from guess, the second one from the root of the first, and
+    every other row from the line through the roots of the two rows before it, extrapolated to
+    its coordinate. guess is kept when the Newton step there is the shorter one, i.e. guess looks
+    closer to the root. Rows in no chain are solved from guess with the first wave.
+
+    The outputs of this function are those of xirrBatch with getIterations=True, plus
+
+    cold = boolean array of the rows that did not start from a neighbour
+"""
+def xirrContinuation(cashFlows, years, chains, guess=0.05, tol=1e-12, maxIter=100):
+    cashFlows = np.atleast_2d(np.asarray(cashFlows, dtype=np.float64))
+    years = np.broadcast_to(np.atleast_2d(np.asarray(years, dtype=np.float64)), cashFlows.shape)
+    n = cashFlows.shape[0]
+    guess = np.array(np.broadcast_to(np.asarray(guess, dtype=np.float64), (n,)))
+    irr = np.full(n, np.nan)
+    converged = np.zeros(n, dtype=bool)
+    iterations = np.zeros(n, dtype=int)
+    cold = np.ones(n, dtype=bool)
+    chained = set(row for chain in chains for _, row in chain)
+    chains = list(chains) + [[(0.0, row)] for row in xrange(n) if row not in chained]
+    for rows, coordinates, previous, previousCoordinates, before, beforeCoordinates in getContinuationWaves(chains):
+        seed = guess[rows]
+        previousRoot = np.where(previous >= 0, irr[previous], np.nan)
+        beforeRoot = np.where(before >= 0, irr[before], np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (previousRoot - beforeRoot)/(previousCoordinates - beforeCoordinates)
+        extrapolated = previousRoot + slope*(coordinates - previousCoordinates)
+        neighbour = np.where(np.isfinite(extrapolated), extrapolated, previousRoot)
+        warm = ~np.isnan(neighbour)
+        if warm.any():
+            ahead = np.abs(getNewtonStep(cashFlows[rows[warm]], years[rows[warm]], neighbour[warm]))
+            behind = np.abs(getNewtonStep(cashFlows[rows[warm]], years[rows[warm]], seed[warm]))
+            warm[warm] = ahead < np.where(np.isnan(behind), np.inf, behind)
+        seed = np.where(warm, neighbour, seed)
+        cold[rows] = ~warm
+        irr[rows], converged[rows], iterations[rows] = xirrBatch(cashFlows[rows], years[rows], guess=seed, tol=tol,
+                                                                 maxIter=maxIter, getIterations=True)
+    return irr, converged, iterations, cold
+
 """
     Function: xirr
     ==============
     Compute xirr given the transaction in the format
 
         [(date1, cashflow1), (date2, cashflow2), ....]
+
+    Return None if the solver does not converge.
 """
 def xirr(transactions):
     years = [(ta[0] - transactions[0][0]).days / 365.0 for ta in transactions]
-    residual = 1
-    step = 0.05
-    guess = 0.05
-    epsilon = 0.0001
-    limit = 10000
-    while abs(residual) > epsilon and limit > 0:
-        limit -= 1
-        residual = 0.0
-        for i, ta in enumerate(transactions):
-            if pow(guess, years[i]) == 0: return None
-            residual += ta[1] / pow(guess, years[i])
-        if abs(residual) > epsilon:
-            if residual > 0:
-                guess += step
-            else:
-                guess -= step
-                step /= 2.0
-    return guess-1
+    irr, converged = xirrBatch([ta[1] for ta in transactions], years)
+    if not converged[0]: return None
+    return float(irr[0])
+
+"""
+    Function: getTransactionDates
+    =============================
+    Return the interned tuple of transaction dates
+
+        prefix + (start, start + step months, start + 2*step months, ...)
+
+    with length dates after the prefix. The same (start, length, step, prefix) always returns
+    the same tuple, so callers can pass it around without allocating dates again.
+"""
+def getTransactionDates(start, length, step=12, prefix=()):
+    key = (start, length, step, tuple(prefix))
+    transaction_date = TRANSACTION_DATES_CACHE.get(key)
+    if transaction_date is None:
+        months = [start.month - 1 + i*step for i in xrange(length)]
+        transaction_date = tuple(prefix) + tuple(date(start.year + m//12, m % 12 + 1, start.day) for m in months)
+        TRANSACTION_DATES_CACHE.put(key, transaction_date)
+    return transaction_date
+
+"""
+    Function: getYearFractions
+    ==========================
+    Return the interned, read-only array of year fractions of prefix + transaction_date from
+    its first date, as xirr computes them: (date - first date).days / 365.0
+"""
+def getYearFractions(transaction_date, prefix=()):
+    key = (tuple(transaction_date), tuple(prefix))
+    years = YEAR_FRACTIONS_CACHE.get(key)
+    if years is None:
+        transaction_date = key[1] + key[0]
+        years = np.array([(d - transaction_date[0]).days / 365.0 for d in transaction_date])
+        years.flags.writeable = False
+        YEAR_FRACTIONS_CACHE.put(key, years)
+    return years
 
 """
     class: Renter
@@ -72,7 +327,47 @@ def xirr(transactions):
     6. abatement                   The number of months that the renter does not pay for the rent at the start of the contract
     7. ti                          Tenant Improvement (in euro per square meters)
     8. capRate                     Capital Rate for the tenant (decimal)
+
+    The schedules are computed lazily in stages (see RENTER_STAGES). A setter only marks the
+    stages that depend on the changed input as dirty and a stage is recomputed on the first
+    get function that needs it.
 """
+# Derived stages of Renter, in the order they are computed, and the stages each one reads
+RENTER_STAGES = ('revenue', 'expense', 'netOperatingIncome', 'capital', 'cashFlowBeforeDebtService')
+RENTER_STAGE_REQUIRES = {
+    'revenue': (),
+    'expense': (),
+    'netOperatingIncome': ('revenue', 'expense'),
+    'capital': (),
+    'cashFlowBeforeDebtService': ('netOperatingIncome', 'capital')
+}
+# Stages invalidated when an input changes. isGuarantee and capRate do not reach any schedule.
+RENTER_INPUT_INVALIDATES = {
+    'name': ('expense', 'netOperatingIncome', 'cashFlowBeforeDebtService'),
+    'initialRentPerSqm': ('revenue', 'netOperatingIncome', 'capital', 'cashFlowBeforeDebtService'),
+    'term': RENTER_STAGES,
+    'isGuarantee': (),
+    'abatement': ('revenue', 'netOperatingIncome', 'cashFlowBeforeDebtService'),
+    'annualIncrease': ('revenue', 'netOperatingIncome', 'capital', 'cashFlowBeforeDebtService'),
+    'TI': ('capital', 'cashFlowBeforeDebtService'),
+    'capRate': ()
+}
+# Stage that computes each derived figure
+RENTER_SCHEDULE_STAGE = {
+    'initialAnnualRent': 'revenue',
+    'baseRentalRevenue': 'revenue',
+    'baseRentalAbatement': 'revenue',
+    'scheduleBaseRentalRevenue': 'revenue',
+    'operatingExpense': 'expense',
+    'expenseReimburseRevenue': 'expense',
+    'totalGrossRevenue': 'netOperatingIncome',
+    'netOperatingIncome': 'netOperatingIncome',
+    'leasingCommission': 'capital',
+    'capitalReserve': 'capital',
+    'totalLeasingAndCapitalCost': 'capital',
+    'cashFlowBeforeDebtService': 'cashFlowBeforeDebtService'
+}
+
 class Renter(object):
 
     def __init__(self, name, initialRentPerSqm, term, annualIncrease, isGuarantee, abatement, ti, capRate):
@@ -84,9 +379,11 @@ class Renter(object):
         self.isGuarantee = isGuarantee
         self.abatement = abatement
         self.annualIncrease = annualIncrease
+        self.tiPerSqm = ti
         self.TI = ti*TOTAL_AREA
         self.capRate = capRate
-        self.recompute()
+        self.dirty = set(RENTER_STAGES)
+        self.batchDepth = 0
 
     """ GET FUNCTIONS """
     def getName(self): return self.name
@@ -97,80 +394,281 @@ class Renter(object):
     def getAnnualIncrease(self): return self.annualIncrease
     def getTI(self): return self.TI
     def getCapRate(self): return self.capRate
-    def getOperatingExpense(self): return self.operatingExpense
-    def getInitialAnnualRent(self): return self.initialAnnualRent
-    def getBaseRentalRevenue(self): return self.baseRentalRevenue
-    def getBaseRentalAbatement(self): return self.baseRentalAbatement
-    def getScheduleBaseRentalRevenue(self): return self.scheduleBaseRentalRevenue
-    def getTotalGrossRevenue(self): return self.totalGrossRevenue
-    def getExpenseReimburseRevenue(self): return self.expenseReimburseRevenue
-    def getNetOperatingIncome(self): return self.netOperatingIncome
-    def getTotalLeasingAndCapitalCost(self): return self.totalLeasingAndCapitalCost
-    def getCashFlowBeforeDebtService(self): return self.cashFlowBeforeDebtService
+    # Constructor arguments, so that Renter(*renter.getInputs()) is an independent copy
+    def getInputs(self):
+        return (self.name, self.initialRentPerSqm, self.term, self.annualIncrease,
+                self.isGuarantee, self.abatement, self.tiPerSqm, self.capRate)
+
+    def getOperatingExpense(self): return self.getSchedule('operatingExpense')
+    def getInitialAnnualRent(self): return self.getSchedule('initialAnnualRent')
+    def getBaseRentalRevenue(self): return self.getSchedule('baseRentalRevenue')
+    def getBaseRentalAbatement(self): return self.getSchedule('baseRentalAbatement')
+    def getScheduleBaseRentalRevenue(self): return self.getSchedule('scheduleBaseRentalRevenue')
+    def getTotalGrossRevenue(self): return self.getSchedule('totalGrossRevenue')
+    def getExpenseReimburseRevenue(self): return self.getSchedule('expenseReimburseRevenue')
+    def getNetOperatingIncome(self): return self.getSchedule('netOperatingIncome')
+    def getTotalLeasingAndCapitalCost(self): return self.getSchedule('totalLeasingAndCapitalCost')
+    def getCashFlowBeforeDebtService(self): return self.getSchedule('cashFlowBeforeDebtService')
+
+    """
+        class function: getSchedule
+        ===========================
+        Return a derived figure by attribute name, computing its stage first if it is dirty.
+    """
+    def getSchedule(self, scheduleName):
+        self.refresh(RENTER_SCHEDULE_STAGE[scheduleName])
+        return getattr(self, scheduleName)
 
     """ SET FUNCTIONS """
     def setName(self, name):
         self.name = name
-        if not name: self.recompute()
+        self.invalidate('name')
 
     def setInitialRentPerSqm(self, initialRentPerSqm):
         self.initialRentPerSqm = initialRentPerSqm
-        self.recompute()
+        self.invalidate('initialRentPerSqm')
 
     def setTerm(self, term):
         self.term = term
-        self.recompute()
+        self.invalidate('term')
 
     def setIsGuarantee(self, isGuarantee):
         self.isGuarantee = isGuarantee
-        self.recompute()
+        self.invalidate('isGuarantee')
 
     def setAbatement(self, abatement):
         self.abatement = abatement
-        self.recompute()
+        self.invalidate('abatement')
 
     def setAnnualIncrease(self, annualIncrease):
         self.annualIncrease = annualIncrease
-        self.recompute()
+        self.invalidate('annualIncrease')
 
     def setTI(self, ti):
+        self.tiPerSqm = ti
         self.TI = ti*TOTAL_AREA
-        self.recompute()
+        self.invalidate('TI')
 
     def setCapRate(self, capRate):
         self.capRate = capRate
-        self.recompute()
+        self.invalidate('capRate')
+
+    """
+        class function: invalidate
+        ==========================
+        Mark every stage that depends on the given input as dirty.
+    """
+    def invalidate(self, inputName):
+        self.dirty.update(RENTER_INPUT_INVALIDATES[inputName])
+
+    """
+        class function: batch_update
+        ============================
+        Context manager to apply several changes at once, e.g.
+
+            with topshop.batch_update():
+                topshop.setTerm(6)
+                topshop.setAbatement(3)
+
+        The dirty stages are recomputed once when the outermost block exits.
+    """
+    @contextmanager
+    def batch_update(self):
+        self.batchDepth += 1
+        try:
+            yield self
+        finally:
+            self.batchDepth -= 1
+        if self.batchDepth == 0: self.refresh(*RENTER_STAGES)
+
+    """
+        class function: refresh
+        =======================
+        Recompute the given stages, and the stages they read, if they are dirty.
+    """
+    def refresh(self, *stages):
+        for stage in stages:
+            if stage not in self.dirty: continue
+            self.refresh(*RENTER_STAGE_REQUIRES[stage])
+            with instrument.stage('renter'):
+                getattr(self, 'compute' + stage[0].upper() + stage[1:])()
+            if instrument.ENABLED: instrument.recordRecompute(self.name, stage)
+            self.dirty.discard(stage)
 
     """
         class function: recompute
         =========================
         Recompute all essential figures related to cash flow before debt Service.
-        This function should be called once any input variable is changed.
+        The get functions already do this on demand, so calling it is never required.
     """
     def recompute(self):
-        ### Compute Net Operating Income
+        self.dirty.update(RENTER_STAGES)
+        self.refresh(*RENTER_STAGES)
+
+    def computeRevenue(self):
         self.initialAnnualRent = self.initialRentPerSqm * TOTAL_AREA
         self.baseRentalRevenue = [self.initialAnnualRent*((1 + self.annualIncrease) ** i) for i in xrange(self.term)]
         self.baseRentalAbatement = self.abatement/12.0*self.initialAnnualRent
-        self.scheduleBaseRentalRevenue = deepcopy(self.baseRentalRevenue)
+        self.scheduleBaseRentalRevenue = list(self.baseRentalRevenue)
         self.scheduleBaseRentalRevenue[0] -= self.baseRentalAbatement
+
+    def computeExpense(self):
         self.operatingExpense = [INITIAL_OPERATING_EXPENSE * ((1 + OPERATING_EXPENSE_INCREASE_RATE)**i) for i in xrange(self.term)]
         if self.name is not None:
-            self.expenseReimburseRevenue = deepcopy(self.operatingExpense)
+            self.expenseReimburseRevenue = list(self.operatingExpense)
         else:
             self.expenseReimburseRevenue = [0 for _ in xrange(self.term)]
 
+    def computeNetOperatingIncome(self):
         self.totalGrossRevenue = map(lambda x,y: x + y, self.scheduleBaseRentalRevenue, self.expenseReimburseRevenue)
         self.netOperatingIncome = map(lambda x,y: x - y, self.totalGrossRevenue, self.operatingExpense)
 
-        ### Compute Cash Flow Before Debt Service
-        self.leasingCommission = [self.baseRentalRevenue[0]*LEASING_COMMISSION_RATE*(1 + self.annualIncrease)**(i) for i in xrange(self.term)]
+    def computeCapital(self):
+        initialAnnualRent = self.initialRentPerSqm * TOTAL_AREA
+        self.leasingCommission = [initialAnnualRent*LEASING_COMMISSION_RATE*(1 + self.annualIncrease)**(i) for i in xrange(self.term)]
         self.capitalReserve = [TOTAL_AREA*CAPITAL_RESERVE_RATE for _ in xrange(self.term)]
-        self.totalLeasingAndCapitalCost = deepcopy(self.capitalReserve)
+        self.totalLeasingAndCapitalCost = list(self.capitalReserve)
         self.totalLeasingAndCapitalCost[0] += self.TI #+ self.leasingCommission
         self.totalLeasingAndCapitalCost = map(lambda x,y: x + y, self.totalLeasingAndCapitalCost, self.leasingCommission)
+
+    def computeCashFlowBeforeDebtService(self):
         self.cashFlowBeforeDebtService = map(lambda x,y: x - y, self.netOperatingIncome, self.totalLeasingAndCapitalCost)
 
+"""
+    class: ArrayRenter
+    ==================
+    class ArrayRenter is a Renter that stores its schedules as contiguous float64 arrays,
+    computed as vectorized geometric series instead of per-year lists. It takes the same
+    8 inputs as Renter.
+
+    The get functions still return lists for compatibility with the cash flow functions
+    below, getArray returns the underlying array.
+"""
+class ArrayRenter(Renter):
+
+    def getSchedule(self, scheduleName):
+        schedule = Renter.getSchedule(self, scheduleName)
+        if isinstance(schedule, np.ndarray): return schedule.tolist()
+        return schedule
+
+    def getArray(self, scheduleName):
+        return Renter.getSchedule(self, scheduleName)
+
+    def computeRevenue(self):
+        self.initialAnnualRent = self.initialRentPerSqm * TOTAL_AREA
+        self.baseRentalRevenue = self.initialAnnualRent*(1 + self.annualIncrease)**np.arange(self.term, dtype=np.float64)
+        self.baseRentalAbatement = self.abatement/12.0*self.initialAnnualRent
+        self.scheduleBaseRentalRevenue = self.baseRentalRevenue.copy()
+        self.scheduleBaseRentalRevenue[0] -= self.baseRentalAbatement
+
+    def computeExpense(self):
+        self.operatingExpense = INITIAL_OPERATING_EXPENSE*(1 + OPERATING_EXPENSE_INCREASE_RATE)**np.arange(self.term, dtype=np.float64)
+        if self.name is not None:
+            self.expenseReimburseRevenue = self.operatingExpense.copy()
+        else:
+            self.expenseReimburseRevenue = np.zeros(self.term)
+
+    def computeNetOperatingIncome(self):
+        self.totalGrossRevenue = self.scheduleBaseRentalRevenue + self.expenseReimburseRevenue
+        self.netOperatingIncome = self.totalGrossRevenue - self.operatingExpense
+
+    def computeCapital(self):
+        initialAnnualRent = self.initialRentPerSqm * TOTAL_AREA
+        self.leasingCommission = initialAnnualRent*LEASING_COMMISSION_RATE*(1 + self.annualIncrease)**np.arange(self.term, dtype=np.float64)
+        self.capitalReserve = np.full(self.term, TOTAL_AREA*CAPITAL_RESERVE_RATE)
+        self.totalLeasingAndCapitalCost = self.capitalReserve.copy()
+        self.totalLeasingAndCapitalCost[0] += self.TI #+ self.leasingCommission
+        self.totalLeasingAndCapitalCost += self.leasingCommission
+
+    def computeCashFlowBeforeDebtService(self):
+        self.cashFlowBeforeDebtService = self.netOperatingIncome - self.totalLeasingAndCapitalCost
+
+"""
+    class: RenterSpec
+    =================
+    class RenterSpec holds the 8 Renter inputs as an immutable, hashable tuple in the order of
+    the Renter constructor, so that Renter(*spec) builds the renter it describes.
+"""
+class RenterSpec(namedtuple('RenterSpec', ['name', 'initialRentPerSqm', 'term', 'annualIncrease', 'isGuarantee',
+                                           'abatement', 'ti', 'capRate'])):
+    __slots__ = ()
+
+"""
+    class: FrozenRenter
+    ===================
+    class FrozenRenter is a read-only Renter: every schedule is computed once at construction
+    and held as a tuple, and any set function raises AttributeError, so one instance can be
+    shared by every caller. It takes the same 8 inputs as Renter. Use internRenter to get one.
+"""
+class FrozenRenter(Renter):
+
+    def __init__(self, name, initialRentPerSqm, term, annualIncrease, isGuarantee, abatement, ti, capRate):
+        Renter.__init__(self, name, initialRentPerSqm, term, annualIncrease, isGuarantee, abatement, ti, capRate)
+        self.refresh(*RENTER_STAGES)
+        for scheduleName in RENTER_SCHEDULE_STAGE:
+            schedule = getattr(self, scheduleName)
+            if isinstance(schedule, list): setattr(self, scheduleName, tuple(schedule))
+        self.frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, 'frozen', False): raise AttributeError("FrozenRenter %s is read-only" % (self.name,))
+        object.__setattr__(self, name, value)
+
+    def getInputs(self): return RenterSpec(*Renter.getInputs(self))
+
+"""
+    function: internRenter
+    ======================
+    Return the shared FrozenRenter of a RenterSpec (or any tuple of the 8 Renter inputs), built on
+    the first request and kept in RENTER_POOL, so identical renters (e.g. the hypothetical future
+    tenants of cashflow.py) are computed once. The key holds getAssumptions, so a change of the
+    module constants builds a new one.
+"""
+def internRenter(spec):
+    spec = RenterSpec(*spec)
+    key = (spec, getAssumptions())
+    frozenRenter = RENTER_POOL.get(key)
+    if frozenRenter is None:
+        frozenRenter = FrozenRenter(*spec)
+        RENTER_POOL.put(key, frozenRenter)
+    return frozenRenter
+
+"""
+    function: computeScheduleArrays
+    ===============================
+    Compute the ArrayRenter schedules of many renters sharing the same term at once.
+    initialRentPerSqm, annualIncrease, abatement and ti are scalars or 1-D arrays (one value
+    per renter), with the same meaning as the Renter inputs. hasName is False to reproduce a
+    Renter named None, which does not reimburse the operating expense. totalSqm is the leased
+    area the rent and the TI apply to, TOTAL_AREA as for a Renter by default.
+
+    Return a dict from schedule name (as in RENTER_SCHEDULE_STAGE) to an array with one row
+    per renter.
+"""
+def computeScheduleArrays(initialRentPerSqm, term, annualIncrease, abatement, ti, hasName=True, totalSqm=TOTAL_AREA):
+    initialRentPerSqm, annualIncrease, abatement, ti, totalSqm = np.broadcast_arrays(*[np.atleast_1d(np.asarray(v, dtype=np.float64))
+                                                                                       for v in (initialRentPerSqm, annualIncrease, abatement, ti, totalSqm)])
+    years = np.arange(term, dtype=np.float64)
+    growth = (1 + annualIncrease[:, None])**years
+    schedules = {}
+    schedules['initialAnnualRent'] = initialAnnualRent = initialRentPerSqm * totalSqm
+    schedules['baseRentalRevenue'] = initialAnnualRent[:, None]*growth
+    schedules['baseRentalAbatement'] = abatement/12.0*initialAnnualRent
+    schedules['scheduleBaseRentalRevenue'] = schedules['baseRentalRevenue'].copy()
+    schedules['scheduleBaseRentalRevenue'][:, 0] -= schedules['baseRentalAbatement']
+    operatingExpense = INITIAL_OPERATING_EXPENSE*(1 + OPERATING_EXPENSE_INCREASE_RATE)**years
+    schedules['operatingExpense'] = np.tile(operatingExpense, (len(initialAnnualRent), 1))
+    schedules['expenseReimburseRevenue'] = schedules['operatingExpense'].copy() if hasName else np.zeros_like(schedules['operatingExpense'])
+    schedules['totalGrossRevenue'] = schedules['scheduleBaseRentalRevenue'] + schedules['expenseReimburseRevenue']
+    schedules['netOperatingIncome'] = schedules['totalGrossRevenue'] - schedules['operatingExpense']
+    schedules['leasingCommission'] = (initialAnnualRent*LEASING_COMMISSION_RATE)[:, None]*growth
+    schedules['capitalReserve'] = np.full(growth.shape, TOTAL_AREA*CAPITAL_RESERVE_RATE)
+    schedules['totalLeasingAndCapitalCost'] = schedules['capitalReserve'].copy()
+    schedules['totalLeasingAndCapitalCost'][:, 0] += ti*totalSqm
+    schedules['totalLeasingAndCapitalCost'] += schedules['leasingCommission']
+    schedules['cashFlowBeforeDebtService'] = schedules['netOperatingIncome'] - schedules['totalLeasingAndCapitalCost']
+    return schedules
+
 """
     function: getCashFlowUnleveraged
     ======================================
@@ -228,30 +726,15 @@ def getCashFlowFutureUnleveraged(cashFlowBeforeDebtService, netOperatingIncome,
 
     Netcashflow = the net cash flow
     DCSR = net operating income / debt service
+
+    The loan terms come from getLenderSpec, see loan.getNetLoanCashFlow.
+    Results are memoized in LENDER_CASH_FLOW_CACHE.
 """
+@instrument.timed('lenderCashFlow')
+@cache.memoize(LENDER_CASH_FLOW_CACHE, getAssumptions)
 def getNetCashFlowLenderA(totalYear, cashFlowBeforeDebtService, netOperatingIncome, yearExit=None):
     if yearExit is None: yearExit = totalYear - 1
-    totalProceed = (DEPOSIT + PURCHASE_PRICE)*LENDER_A_LTV
-    normalAnnualPayment = pmt(LENDER_A_INTEREST_RATE/12.0, LENDER_A_AMORTIZATION, totalProceed)*12 # Negative Value
-    filled = min(yearExit, 4)
-    debtService = [normalAnnualPayment for _ in xrange(filled)] + [0 for _ in xrange(filled + 1, yearExit+1)] + [0]
-    fees = [LENDER_A_ENTRY_FEE*totalProceed] + [0 for _ in xrange(1, yearExit+1)]
-    if (yearExit == 1):
-        fees[1] = LENDER_A_EXIT_FEE*totalProceed
-    if (yearExit == 2):
-        fees[2] = LENDER_A_EXIT_FEE*totalProceed
-    if (yearExit == 3):
-        fees[2] = LENDER_A_PER_EXTENSION_FEE*totalProceed
-        fees[3] = LENDER_A_EXIT_FEE*totalProceed
-    if (yearExit >= 4):
-        fees[2] = LENDER_A_PER_EXTENSION_FEE*totalProceed
-        fees[3] = LENDER_A_PER_EXTENSION_FEE*totalProceed
-        fees[4] = LENDER_A_EXIT_FEE*totalProceed
-    cashflow = [(cashFlowBeforeDebtService[i] if i < len(cashFlowBeforeDebtService) else 0) + (debtService[i] if i < yearExit else 0) - fees[i] for i in xrange(yearExit + 1)]
-    if yearExit < len(cashFlowBeforeDebtService): cashflow[yearExit] -= cashFlowBeforeDebtService[yearExit]
-
-    DCSR = [-(netOperatingIncome[i] if i < len(netOperatingIncome) else 0)/debtService[i] for i in xrange(min(yearExit, 4))]
-    return cashflow, DCSR
+    return loan.getNetLoanCashFlow(getLenderSpec('A'), cashFlowBeforeDebtService, netOperatingIncome, yearExit)
 
 """
     function: getLeveragedCashFlowLenderA
@@ -261,20 +744,12 @@ def getNetCashFlowLenderA(totalYear, cashFlowBeforeDebtService, netOperatingInco
 
     netOperatingIncome = net operating income (must be concat with empty period and match with the transation date in IRR computation)
     capRate = capital rate of the renter at the time that we exit
+
+    The loan terms come from getLenderSpec, see loan.getLeveragedLoanCashFlow.
 """
+@instrument.timed('lenderCashFlow')
 def getLeveragedCashFlowLenderA(netCashFlow, netOperatingIncome, capRate, yearExit, isEnd=True):
-    loanTakeOut = (DEPOSIT + PURCHASE_PRICE)*LENDER_A_LTV
-    if (len(netCashFlow) > len(netOperatingIncome)):
-        salePriceWithCapRate = netOperatingIncome[-1]/capRate
-    else:
-        salePriceWithCapRate = netOperatingIncome[len(netCashFlow)-1]/capRate
-    leveragedCashFlow = [netCashFlow[0] - PURCHASE_PRICE + loanTakeOut] + netCashFlow[1:]
-    mortgageExpireYear = min(4, yearExit)
-    totalProceed = (DEPOSIT + PURCHASE_PRICE)*LENDER_A_LTV
-    normalAnnualPayment = pmt(LENDER_A_INTEREST_RATE/12.0, LENDER_A_AMORTIZATION, totalProceed)*12 # Negative Value
-    # leveragedCashFlow[mortgageExpireYear] -= pv(LENDER_A_INTEREST_RATE/12.0, LENDER_A_AMORTIZATION - 12*mortgageExpireYear, normalAnnualPayment/12)
-    if isEnd: leveragedCashFlow[-1] += salePriceWithCapRate
-    return leveragedCashFlow
+    return loan.getLeveragedLoanCashFlow(getLenderSpec('A'), netCashFlow, netOperatingIncome, capRate, yearExit, isEnd)
 
 """
     function: getNetCashFlowLenderB
@@ -287,25 +762,15 @@ def getLeveragedCashFlowLenderA(netCashFlow, netOperatingIncome, capRate, yearEx
 
     Netcashflow = the net cash flow
     DCSR = net operating income / debt service
+
+    The loan terms come from getLenderSpec, see loan.getNetLoanCashFlow.
+    Results are memoized in LENDER_CASH_FLOW_CACHE.
 """
+@instrument.timed('lenderCashFlow')
+@cache.memoize(LENDER_CASH_FLOW_CACHE, getAssumptions)
 def getNetCashFlowLenderB(totalYear, cashFlowBeforeDebtService, netOperatingIncome, yearExit=None):
     if yearExit is None: yearExit = totalYear
-    if yearExit < 4: raise Exception("yearExit must be at least 4")
-    totalProceed = (DEPOSIT + PURCHASE_PRICE)*LENDER_B_LTV
-    interestOnlyPayment = -LENDER_B_INTEREST_RATE*totalProceed # Negative Value
-    normalAnnualPayment = pmt(LENDER_B_INTEREST_RATE/12.0, LENDER_B_AMORTIZATION, totalProceed)*12 # Negative Value
-    debtService = [interestOnlyPayment, interestOnlyPayment] + [normalAnnualPayment for _ in xrange(2, min(5, yearExit))] + [0 for _ in xrange(min(5, yearExit), yearExit)] #Negative Value
-    entryFee = LENDER_B_ENTRY_FEE*totalProceed
-    netCashFlow = [(cashFlowBeforeDebtService[i] if i < len(cashFlowBeforeDebtService) else 0) + debtService[i] for i in xrange(yearExit)] + [0]
-    netCashFlow[0] -= entryFee
-    if yearExit == 4:
-        totalProceed = (DEPOSIT + PURCHASE_PRICE)*LENDER_B_LTV
-        normalAnnualPayment = pmt(LENDER_B_INTEREST_RATE/12.0, LENDER_B_AMORTIZATION, totalProceed)*12 # Negative Value
-        mortgageExpireYear = 4
-        mortgageBalance = pv(LENDER_B_INTEREST_RATE/12.0, LENDER_B_AMORTIZATION - 12*(mortgageExpireYear-2), normalAnnualPayment/12)
-        netCashFlow[4] = (LENDER_B_INTEREST_RATE - TREASURY_YIELD)*((1 - (1 + TREASURY_YIELD))/TREASURY_YIELD)*mortgageBalance
-    DCSR = [-(netOperatingIncome[i] if i < len(netOperatingIncome) else 0)/debtService[i] for i in xrange(min(yearExit, 5))]
-    return netCashFlow, DCSR
+    return loan.getNetLoanCashFlow(getLenderSpec('B'), cashFlowBeforeDebtService, netOperatingIncome, yearExit)
 
 """
     function: getLeveragedCashFlowLenderB
@@ -315,20 +780,12 @@ def getNetCashFlowLenderB(totalYear, cashFlowBeforeDebtService, netOperatingInco
 
     netOperatingIncome = net operating income (must be concat with empty period and match with the transation date in IRR computation)
     capRate = capital rate of the renter at the time that we exit
+
+    The loan terms come from getLenderSpec, see loan.getLeveragedLoanCashFlow.
 """
+@instrument.timed('lenderCashFlow')
 def getLeveragedCashFlowLenderB(netCashFlow, netOperatingIncome, capRate, yearExit, isEnd=True):
-    loanTakeOut = (DEPOSIT + PURCHASE_PRICE)*LENDER_B_LTV
-    if (len(netCashFlow) > len(netOperatingIncome)):
-        salePriceWithCapRate = netOperatingIncome[-1]/capRate
-    else:
-        salePriceWithCapRate = netOperatingIncome[len(netCashFlow)-1]/capRate
-    leveragedCashFlow = [netCashFlow[0] - PURCHASE_PRICE + loanTakeOut] + netCashFlow[1:]
-    mortgageExpireYear = min(5, yearExit)
-    totalProceed = (DEPOSIT + PURCHASE_PRICE)*LENDER_B_LTV
-    normalAnnualPayment = pmt(LENDER_B_INTEREST_RATE/12.0, LENDER_B_AMORTIZATION, totalProceed)*12 # Negative Value
-    leveragedCashFlow[mortgageExpireYear] -= pv(LENDER_B_INTEREST_RATE/12.0, LENDER_B_AMORTIZATION - 12*(mortgageExpireYear-2), normalAnnualPayment/12)
-    if isEnd: leveragedCashFlow[-1] += salePriceWithCapRate
-    return leveragedCashFlow
+    return loan.getLeveragedLoanCashFlow(getLenderSpec('B'), netCashFlow, netOperatingIncome, capRate, yearExit, isEnd)
 
 """
     function: computeIRRWithNoSunkCost
@@ -337,12 +794,19 @@ def getLeveragedCashFlowLenderB(netCashFlow, netOperatingIncome, capRate, yearEx
 
     cashFlow = [cashflow1, cashflow2, ...]
     transaction_date = [date 1 of the cash flow, date 2 of the cash flow, ...]
+    years = year fractions of the cash flows from the first one, used instead of transaction_date
+
+    Return None if the solver does not converge.
 """
-def computeIRRWithNoSunkCost(cashFlow, transaction_date=None):
-    if transaction_date is None:
-        transaction_date = [date(i, 7, 1) for i in xrange(2015, 2015 + len(cashFlow))]
-    cashFlowData = map(lambda x, y: (x,y), transaction_date, cashFlow)
-    return xirr(cashFlowData)
+@instrument.timed('irr')
+def computeIRRWithNoSunkCost(cashFlow, transaction_date=None, years=None):
+    if years is None:
+        if transaction_date is None:
+            transaction_date = getTransactionDates(FIRST_TRANSACTION_DATE, len(cashFlow))
+        years = getYearFractions(transaction_date)
+    irr, converged = xirrBatch(cashFlow, years)
+    if not converged[0]: return None
+    return float(irr[0])
 
 """
     function: computeIRR
@@ -351,19 +815,27 @@ def computeIRRWithNoSunkCost(cashFlow, transaction_date=None):
 
     cashFlow = [cashflow1, cashflow2, ...]
     transaction_date = [date 1 of the cash flow, date 2 of the cash flow, ...]
+    years = year fractions of the deposit, the closing and the cash flows from the deposit date,
+            used instead of transaction_date
+
+    Return None if the solver does not converge.
 """
-def computeIRR(cashFlow, transaction_date=None):
-    if transaction_date is None:
-        transaction_date = [date(i, 7, 1) for i in xrange(2015, 2015 + len(cashFlow))]
-    transaction_date = [date(2013, 4, 1), date(2014, 7, 1)] + transaction_date
-    cashFlowData = map(lambda x, y: (x,y), transaction_date, [-DEPOSIT, 0] + cashFlow)
-    return xirr(cashFlowData)
+@instrument.timed('irr')
+def computeIRR(cashFlow, transaction_date=None, years=None):
+    if years is None:
+        if transaction_date is None:
+            transaction_date = getTransactionDates(FIRST_TRANSACTION_DATE, len(cashFlow))
+        years = getYearFractions(transaction_date, prefix=SUNK_COST_DATES)
+    irr, converged = xirrBatch([-DEPOSIT, 0] + list(cashFlow), years)
+    if not converged[0]: return None
+    return float(irr[0])
 
 """
     function: computeEquityMultipleWithNoSunkCost
     =============================================
     Compute equity multiple with no sunk cost. This function requires cashFlow
 """
+@instrument.timed('equityMultiple')
 def computeEquityMultipleWithNoSunkCost(cashFlow):
     nom, denom = 0, 0
     for cf in cashFlow:
@@ -376,6 +848,7 @@ def computeEquityMultipleWithNoSunkCost(cashFlow):
     =============================================
     Compute equity multiple. This function requires cashFlow
 """
+@instrument.timed('equityMultiple')
 def computeEquityMultiple(cashFlow):
     nom, denom = 0, DEPOSIT
     for cf in cashFlow:
@@ -383,39 +856,279 @@ def computeEquityMultiple(cashFlow):
         else: denom -= cf
     return float(nom)/denom
 
+"""
+    function: padTransactions
+    =========================
+    Pack ragged cash flows into arrays for xirrBatch. This function requires cashFlows and
+    optionally transaction_dates (one list of dates per cash flow, None for the default
+    yearly dates starting in July 2015) and a prefix of (date, cashflow) pairs put in front
+    of every row.
+
+    The outputs of this function are
+
+    flows = 2-D array of cash flows, padded with 0
+    years = 2-D array of year fractions from the first date of each row
+"""
+def padTransactions(cashFlows, transaction_dates=None, prefix=()):
+    if transaction_dates is None: transaction_dates = [None]*len(cashFlows)
+    width = len(prefix) + max(len(cf) for cf in cashFlows)
+    flows = np.zeros((len(cashFlows), width))
+    years = np.zeros((len(cashFlows), width))
+    for row, (cashFlow, transaction_date) in enumerate(zip(cashFlows, transaction_dates)):
+        if transaction_date is None:
+            transaction_date = getTransactionDates(FIRST_TRANSACTION_DATE, len(cashFlow))
+        rowYears = getYearFractions(transaction_date, prefix=[ta[0] for ta in prefix])
+        flows[row, :len(rowYears)] = [ta[1] for ta in prefix] + list(cashFlow)
+        years[row, :len(rowYears)] = rowYears
+    return flows, years
+
+"""
+    function: computeIRRWithNoSunkCostBatch
+    =======================================
+    Batch version of computeIRRWithNoSunkCost. Return an array of IRRs, nan where the solver
+    does not converge.
+"""
+@instrument.timed('irr')
+def computeIRRWithNoSunkCostBatch(cashFlows, transaction_dates=None):
+    flows, years = padTransactions(cashFlows, transaction_dates)
+    return xirrBatch(flows, years)[0]
+
+"""
+    function: computeIRRBatch
+    =========================
+    Batch version of computeIRR. Return an array of IRRs, nan where the solver does not converge.
+"""
+@instrument.timed('irr')
+def computeIRRBatch(cashFlows, transaction_dates=None):
+    flows, years = padTransactions(cashFlows, transaction_dates, prefix=zip(SUNK_COST_DATES, [-DEPOSIT, 0]))
+    return xirrBatch(flows, years)[0]
+
+"""
+    function: computeEquityMultipleWithNoSunkCostBatch
+    ==================================================
+    Batch version of computeEquityMultipleWithNoSunkCost on a 2-D array of cash flows padded with 0
+"""
+@instrument.timed('equityMultiple')
+def computeEquityMultipleWithNoSunkCostBatch(flows):
+    flows = np.atleast_2d(np.asarray(flows, dtype=np.float64))
+    return np.clip(flows, 0, None).sum(axis=1) / -np.clip(flows, None, 0).sum(axis=1)
+
+"""
+    function: computeEquityMultipleBatch
+    ====================================
+    Batch version of computeEquityMultiple on a 2-D array of cash flows padded with 0
+"""
+@instrument.timed('equityMultiple')
+def computeEquityMultipleBatch(flows):
+    flows = np.atleast_2d(np.asarray(flows, dtype=np.float64))
+    return np.clip(flows, 0, None).sum(axis=1) / (DEPOSIT - np.clip(flows, None, 0).sum(axis=1))
+
+"""
+    function: getIRRSeed
+    ====================
+    Starting rate of xirrBatch from the equity multiple: the rate that grows the outflows into
+    the inflows over the time between their weighted mean dates. It is usually a few Newton
+    steps closer to the root than a fixed guess.
+"""
+def getIRRSeed(inflow, outflow, inflowYear, outflowYear):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        duration = np.maximum(inflowYear/inflow - outflowYear/outflow, 1/12.0)
+        seed = (inflow/outflow)**(1/duration) - 1
+    return np.where(np.isfinite(seed), seed, 0.05)
+
+"""
+    function: getSunkCostFlows
+    ==========================
+    Put the deposit and the closing (SUNK_COST_DATES) in front of padded cash flows, with lead the
+    years from the deposit to the first cash flow of every row. Return the flows and years the
+    IRR with sunk cost is solved on.
+"""
+def getSunkCostFlows(flows, years, lead):
+    n = flows.shape[0]
+    closing = (SUNK_COST_DATES[1] - SUNK_COST_DATES[0]).days / 365.0
+    lead = np.broadcast_to(np.asarray(lead, dtype=np.float64), (n,))
+    return (np.hstack([np.tile([-DEPOSIT, 0.0], (n, 1)), flows]),
+            np.hstack([np.column_stack([np.zeros(n), np.full(n, closing)]), years + lead[:, None]]))
+
+"""
+    function: getIRRBounds
+    ======================
+    Bound the IRR of padded cash flows without solving them. For r >= 0, the discount factor
+    (1 + r)**-t is convex in t, so by Jensen's inequality and its chord:
+
+        upper: NPV(r) <= inflow*((1 - a)*v**firstIn + a*v**lastIn) - outflow*v**meanOut
+        lower: NPV(r) >= inflow*v**meanIn - outflow*((1 - b)*v**firstOut + b*v**lastOut)
+
+    with the mean, first and last dates of the inflows and outflows and a, b placing the means
+    on the chords. Each surrogate has three terms and one sign change, so its single root is
+    found in a few cheap iterations and bounds the IRR. The lower bound also needs the IRR to
+    be unique, which holds when the cumulative cash flow changes sign once (Norstrom).
+
+    Return the arrays lower and upper, XIRR_LOWER_BOUND and inf where a bound does not apply.
+"""
+def getIRRBounds(flows, years):
+    flows = np.atleast_2d(np.asarray(flows, dtype=np.float64))
+    years = np.broadcast_to(np.atleast_2d(np.asarray(years, dtype=np.float64)), flows.shape)
+    n = flows.shape[0]
+    isIn, isOut = flows > 0, flows < 0
+    inflow, outflow = np.where(isIn, flows, 0).sum(axis=1), -np.where(isOut, flows, 0).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        meanIn = np.where(isIn, flows*years, 0).sum(axis=1)/inflow
+        meanOut = -np.where(isOut, flows*years, 0).sum(axis=1)/outflow
+        firstIn, lastIn = np.where(isIn, years, np.inf).min(axis=1), np.where(isIn, years, -np.inf).max(axis=1)
+        firstOut, lastOut = np.where(isOut, years, np.inf).min(axis=1), np.where(isOut, years, -np.inf).max(axis=1)
+        a = np.where(lastIn > firstIn, (meanIn - firstIn)/(lastIn - firstIn), 0.0)
+        b = np.where(lastOut > firstOut, (meanOut - firstOut)/(lastOut - firstOut), 0.0)
+    hasBoth = (inflow > 0) & (outflow > 0)
+    hasUpper = hasBoth & (meanOut < firstIn)
+    hasLower = hasBoth & (lastOut < meanIn) & (inflow > outflow)
+    order = np.argsort(years, axis=1, kind='mergesort')
+    positive = np.cumsum(flows[np.arange(n)[:, None], order], axis=1) > 0
+    hasLower &= ((np.diff(positive, axis=1) != 0).sum(axis=1) == 1) & positive[:, -1]
+
+    surrogateFlows = np.vstack([np.column_stack([-outflow, inflow*(1 - a), inflow*a]),
+                                np.column_stack([-outflow*(1 - b), -outflow*b, inflow])])
+    surrogateYears = np.vstack([np.column_stack([meanOut, firstIn, lastIn]),
+                                np.column_stack([firstOut, lastOut, meanIn])])
+    surrogateFlows[~np.concatenate([hasUpper, hasLower])] = [-1.0, 0.0, 2.0]
+    surrogateYears[~np.concatenate([hasUpper, hasLower])] = [0.0, 0.0, 1.0]
+    root, converged = xirrBatch(surrogateFlows, surrogateYears)
+    upper = np.where(hasUpper & converged[:n], np.maximum(root[:n], 0.0), np.inf)
+    lower = np.where(hasLower & converged[n:], root[n:], XIRR_LOWER_BOUND)
+    return lower, upper
+
+"""
+    function: computeMetrics
+    ========================
+    Fused kernel computing the four metrics of padded cash flows in one pass. This function
+    requires three input variables.
+
+    flows = 2-D array, one row of cash flows per scenario (padded with 0)
+    years = year fractions of the cash flows from the first one, one row or one per scenario
+    lead = years from the deposit (SUNK_COST_DATES[0]) to the first cash flow, a number or one per scenario
+
+    The inflow and outflow sums behind both equity multiples also seed both IRRs (see getIRRSeed).
+    The sunk cost rows reuse the flows and years of the rows without it, shifted by lead, and
+    both IRRs are solved in a single xirrBatch call.
+
+    When chains of neighbouring rows are given ((coordinate, row) pairs, see getContinuationWaves),
+    both IRRs are solved by xirrContinuation instead. When solverStats is a dict, it is updated
+    with the number of solves, warmSolves (started from a neighbour) and iterations, and with
+    saved, the iterations the warm solves saved. saved is estimated by solving a sample of
+    CONTINUATION_SAMPLE_SIZE warm rows again from their cold seed, so pass solverStats only when
+    the statistics are wanted.
+
+    Return an array of shape (len(flows), 4) with the columns irr, irrWithNoSunkCost,
+    equityMultiple and equityMultipleWithNoSunkCost, nan where the solver does not converge.
+"""
+@instrument.timed('irr')
+def computeMetrics(flows, years, lead, chains=None, solverStats=None):
+    flows = np.atleast_2d(np.asarray(flows, dtype=np.float64))
+    n = flows.shape[0]
+    years = np.broadcast_to(np.atleast_2d(np.asarray(years, dtype=np.float64)), flows.shape)
+    lead = np.broadcast_to(np.asarray(lead, dtype=np.float64), (n,))
+    inflows = np.clip(flows, 0, None)
+    outflows = -np.clip(flows, None, 0)
+    inflow, outflow = inflows.sum(axis=1), outflows.sum(axis=1)
+    inflowYear, outflowYear = (inflows*years).sum(axis=1), (outflows*years).sum(axis=1)
+
+    sunkFlows, sunkYears = getSunkCostFlows(flows, years, lead)
+    stackedFlows = np.vstack([np.hstack([np.zeros((n, 2)), flows]), sunkFlows])
+    stackedYears = np.vstack([np.hstack([np.zeros((n, 2)), years]), sunkYears])
+    seed = np.concatenate([getIRRSeed(inflow, outflow, inflowYear, outflowYear),
+                           getIRRSeed(inflow, outflow + DEPOSIT, inflowYear + lead*inflow, outflowYear + lead*outflow)])
+    if chains is None:
+        irr, _, iterations = xirrBatch(stackedFlows, stackedYears, guess=seed, getIterations=True)
+        cold = np.ones(2*n, dtype=bool)
+    else:
+        stackedChains = list(chains) + [[(coordinate, row + n) for coordinate, row in chain] for chain in chains]
+        irr, _, iterations, cold = xirrContinuation(stackedFlows, stackedYears, stackedChains, guess=seed)
+    if solverStats is not None:
+        warm = np.flatnonzero(~cold)
+        saved = 0.0
+        if warm.size:
+            sample = warm[::max(1, warm.size // CONTINUATION_SAMPLE_SIZE)]
+            coldIterations = xirrBatch(stackedFlows[sample], stackedYears[sample], guess=seed[sample], getIterations=True)[2]
+            saved = warm.size*(coldIterations.mean() - iterations[sample].mean())
+        solverStats['solves'] = solverStats.get('solves', 0) + 2*n
+        solverStats['warmSolves'] = solverStats.get('warmSolves', 0) + int(warm.size)
+        solverStats['iterations'] = solverStats.get('iterations', 0) + int(iterations.sum())
+        solverStats['saved'] = solverStats.get('saved', 0.0) + float(saved)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.column_stack([irr[n:], irr[:n], inflow/(DEPOSIT + outflow), inflow/outflow])
+
+"""
+    function: computeMetricsBatch
+    =============================
+    computeMetrics on a list of cash flows and their transaction dates (None for the default
+    yearly dates starting in July 2015).
+"""
+def computeMetricsBatch(cashFlows, transaction_dates=None, chains=None, solverStats=None):
+    if transaction_dates is None: transaction_dates = [None]*len(cashFlows)
+    flows, years = padTransactions(cashFlows, transaction_dates)
+    lead = [((FIRST_TRANSACTION_DATE if transaction_date is None else transaction_date[0]) - SUNK_COST_DATES[0]).days / 365.0
+            for transaction_date in transaction_dates]
+    return computeMetrics(flows, years, lead, chains, solverStats)
+
+"""
+    function: computeMetricsGradient
+    ================================
+    computeMetrics and the derivatives of its four metrics with respect to parameters of the
+    cash flows, given dFlows, the derivatives of flows (one array shaped like flows per
+    parameter). The IRRs are solved once: at the root r of NPV(r) = sum(f*(1 + r)**-t), the
+    implicit function theorem gives
+
+        dr/dp = -sum(df/dp*(1 + r)**-t) / sum(-t*f*(1 + r)**(-t - 1))
+
+    and the equity multiples are differentiated through their inflow and outflow sums, so a
+    parameter costs a few dot products instead of a solve.
+
+    Return metrics and an array of shape (len(flows), 4, len(dFlows)), nan where the IRR does
+    not converge.
+"""
+def computeMetricsGradient(flows, years, lead, dFlows):
+    flows = np.atleast_2d(np.asarray(flows, dtype=np.float64))
+    n = flows.shape[0]
+    years = np.broadcast_to(np.atleast_2d(np.asarray(years, dtype=np.float64)), flows.shape)
+    lead = np.broadcast_to(np.asarray(lead, dtype=np.float64), (n,))
+    dFlows = np.asarray(dFlows, dtype=np.float64).reshape((-1,) + flows.shape)
+    metrics = computeMetrics(flows, years, lead)
+    sunkFlows, sunkYears = getSunkCostFlows(flows, years, lead)
+    sunkDFlows = np.concatenate([np.zeros((len(dFlows), n, 2)), dFlows], axis=2)
+    gradient = np.empty((n, 4, len(dFlows)))
+    inflow, outflow = np.clip(flows, 0, None).sum(axis=1), -np.clip(flows, None, 0).sum(axis=1)
+    dInflow = np.where(flows > 0, dFlows, 0).sum(axis=2).T
+    dOutflow = -np.where(flows < 0, dFlows, 0).sum(axis=2).T
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for m, irrFlows, irrYears, irrDFlows in ((0, sunkFlows, sunkYears, sunkDFlows), (1, flows, years, dFlows)):
+            rate = metrics[:, m][:, None]
+            discount = (1 + rate)**-irrYears
+            slope = -(irrYears*irrFlows*discount).sum(axis=1)/(1 + rate[:, 0])
+            gradient[:, m] = -(irrDFlows*discount).sum(axis=2).T/slope[:, None]
+        gradient[:, 2] = (dInflow - (inflow/(DEPOSIT + outflow))[:, None]*dOutflow)/(DEPOSIT + outflow)[:, None]
+        gradient[:, 3] = (dInflow - (inflow/outflow)[:, None]*dOutflow)/outflow[:, None]
+    return metrics, gradient
+
+
+"""
+    function: getRecordRenter
+    =========================
+    Build a Renter from a record shaped like those of data.renterData (term and abatement in
+    months, TI per sqm), e.g. getRecordRenter('Zara', renterData['Zara'], 0.055).
+"""
+def getRecordRenter(name, record, capRate, renterClass=Renter):
+    return renterClass(name=name,
+                       initialRentPerSqm=record['initialRentPerSqm'],
+                       term=record['term']/12,
+                       annualIncrease=record['annualIncrease'],
+                       isGuarantee=record['isGuaranteed'],
+                       abatement=record['abatement'],
+                       ti=record['TI'],
+                       capRate=capRate)
 
-topshop =   Renter(
-                name = 'TopShop',
-                initialRentPerSqm = 833,
-                term = 10,
-                annualIncrease = 0.025,
-                isGuarantee = False,
-                abatement = 0,
-                ti = 200,
-                capRate = 0.08
-            )
-
-zara    =   Renter(
-                name = 'Zara',
-                initialRentPerSqm = 583,
-                term = 12,
-                annualIncrease = 0.025,
-                isGuarantee = True,
-                abatement = 12,
-                ti = 600,
-                capRate = 0.055
-            )
-
-decathlon = Renter(
-                name = 'Decathlon',
-                initialRentPerSqm = 708,
-                term = 10,
-                annualIncrease = 0.025,
-                isGuarantee = True,
-                abatement = 9,
-                ti = 400,
-                capRate = 0.055
-            )
+topshop = getRecordRenter('TopShop', renterData['Topshop'], capRate=0.08)
+zara = getRecordRenter('Zara', renterData['Zara'], capRate=0.055)
+decathlon = getRecordRenter('Decathlon', renterData['Decathlon'], capRate=0.055)
 
 # print getCashFlowUnleveraged(cashFlowBeforeDebtService=topshop.getCashFlowBeforeDebtService(),
 #                         netOperatingIncome=topshop.getNetOperatingIncome(),
@@ -0,0 +1,80 @@
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+import numpy as np
+import cashflow
+import renter
+import sweep
+
+RUNNER_CHUNK_SIZE = 256 # scenarios per task
+
+# Shared arrays of the run the current worker process belongs to, set by initWorker
+WORKER_STATE = {}
+
+"""
+    function: initWorker
+    ====================
+    Pool initializer: map the shared scenario and result buffers into numpy arrays once per
+    worker process, so tasks only carry their index range.
+"""
+def initWorker(rawScenarios, rawResults, scenarioShape, outcomeName):
+    WORKER_STATE['scenarios'] = np.frombuffer(rawScenarios).reshape(scenarioShape)
+    WORKER_STATE['results'] = np.frombuffer(rawResults).reshape(scenarioShape[0], len(sweep.METRICS))
+    WORKER_STATE['buildCashFlows'] = cashflow.OUTCOME_CASH_FLOWS[getattr(cashflow, outcomeName)]
+
+"""
+    function: runChunk
+    ==================
+    Evaluate the scenarios [start, stop) on a private Renter built from spec and write the
+    metrics straight into the shared result array. Only the number of scenarios is returned
+    to the parent process.
+"""
+def runChunk(task):
+    spec, start, stop = task
+    tenant = renter.Renter(*spec)
+    cellArgs = [tuple(int(v) for v in row[:-1]) + (float(row[-1]),) for row in WORKER_STATE['scenarios'][start:stop]]
+    WORKER_STATE['results'][start:stop] = sweep.evaluateCells(WORKER_STATE['buildCashFlows'], cellArgs, tenant)
+    return stop - start
+
+"""
+    function: runScenarios
+    ======================
+    Evaluate an outcome function of cashflow.py on many scenarios in a pool of worker processes.
+    This function requires three input variables and two optional.
+
+    outcome = any *Outcome function of cashflow.py, e.g. cashflow.zaraLenderAOutcome
+    spec = the Renter inputs as a tuple, e.g. renter.zara.getInputs(). Every task builds its own
+           Renter from it, so the module instances of renter.py are never touched.
+    scenarios = 2-D array with one row of outcome arguments per scenario, e.g. (sell_year, capRate)
+    processes = number of worker processes (default: one per core, 1 runs in this process)
+    chunkSize = number of scenarios per task
+
+    Scenarios and results live in shared memory, so neither is pickled per scenario. Return an
+    array of shape (len(scenarios), len(sweep.METRICS)), nan for the scenarios sweep.buildCells leaves out.
+"""
+def runScenarios(outcome, spec, scenarios, processes=None, chunkSize=RUNNER_CHUNK_SIZE):
+    scenarios = np.atleast_2d(np.asarray(scenarios, dtype=np.float64))
+    n, k = scenarios.shape
+    parameterCount = sweep.getParameterCount(cashflow.OUTCOME_CASH_FLOWS[outcome])
+    if parameterCount != k:
+        raise ValueError("%s expects %d parameters" % (outcome.__name__, parameterCount))
+
+    rawScenarios = RawArray('d', n*k)
+    rawResults = RawArray('d', n*len(sweep.METRICS))
+    np.frombuffer(rawScenarios).reshape(n, k)[:] = scenarios
+    initargs = (rawScenarios, rawResults, (n, k), outcome.__name__)
+    tasks = [(tuple(spec), start, min(start + chunkSize, n)) for start in xrange(0, n, chunkSize)]
+
+    if processes == 1:
+        initWorker(*initargs)
+        for task in tasks: runChunk(task)
+    else:
+        pool = multiprocessing.Pool(processes, initializer=initWorker, initargs=initargs)
+        try:
+            for _ in pool.imap_unordered(runChunk, tasks): pass
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    return np.frombuffer(rawResults).reshape(n, len(sweep.METRICS))
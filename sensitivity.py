@@ -0,0 +1,97 @@
+import numpy as np
+import cashflow
+import renter
+import sweep
+
+SENSITIVITY_STEP = 1e-4 # relative step of the central differences of the cash flows
+
+# Parameters the sensitivities are taken with respect to: the exit cap rate of the scenario,
+# the rent inputs of the tenant's Renter and the market rent assumptions of the future tenant
+# of cashflow.py (only reached by Topshop sold after it leaves)
+SENSITIVITY_PARAMETERS = ('capRate', 'initialRentPerSqm', 'annualIncrease', 'INITIAL_RENT_PER_SQM_AT_2015', 'ANNUAL_INCREASE')
+RENTER_PARAMETERS = {'initialRentPerSqm': ('getInitialRentPerSqm', 'setInitialRentPerSqm'),
+                     'annualIncrease': ('getAnnualIncrease', 'setAnnualIncrease')}
+
+def getParameterValue(parameter, tenant, args):
+    if parameter == 'capRate': return args[-1]
+    if parameter in RENTER_PARAMETERS: return getattr(tenant, RENTER_PARAMETERS[parameter][0])()
+    return getattr(cashflow, parameter)
+
+"""
+    function: buildRows
+    ===================
+    Call a cash flow builder on a private copy of tenant with one parameter of
+    SENSITIVITY_PARAMETERS set to value (none when parameter is None). A module assumption of
+    cashflow.py is set for the call only.
+"""
+def buildRows(buildCashFlows, args, tenant, parameter=None, value=None):
+    tenant = renter.Renter(*tenant.getInputs())
+    if parameter == 'capRate': args = args[:-1] + (value,)
+    elif parameter in RENTER_PARAMETERS: getattr(tenant, RENTER_PARAMETERS[parameter][1])(value)
+    elif parameter is not None:
+        previous = getattr(cashflow, parameter)
+        setattr(cashflow, parameter, value)
+        try:
+            return buildCashFlows(*args, tenant=tenant)
+        finally:
+            setattr(cashflow, parameter, previous)
+    return buildCashFlows(*args, tenant=tenant)
+
+def getRowFlows(rows):
+    transactionDates = [transactionDate for _, _, transactionDate in rows]
+    flows, years = renter.padTransactions([cashFlow for _, cashFlow, _ in rows], transactionDates)
+    lead = [((renter.FIRST_TRANSACTION_DATE if transactionDate is None else transactionDate[0]) - renter.SUNK_COST_DATES[0]).days / 365.0
+            for transactionDate in transactionDates]
+    return np.array([prob for prob, _, _ in rows]), flows, years, lead
+
+"""
+    function: outcomeSensitivities
+    ==============================
+    Compute the outcome of a scenario together with the first-order derivatives of its metrics.
+    This function requires two input variables and the arguments of the tenant's outcome
+    functions, and takes two optional keyword arguments.
+
+    tenantName = 'topshop', 'zara' or 'decathlon'
+    structure = 'unleveraged', 'lenderA' or 'lenderB' (see cashflow.STRUCTURES)
+    args = (renter_exit_year, sell_year, capRate) for Topshop, (sell_year, capRate) otherwise
+    parameters = names of SENSITIVITY_PARAMETERS to differentiate (default: all of them)
+    tenant = Renter used instead of the module instance
+
+    The cash flows are differentiated by central differences of the cash flow builder, which
+    solve nothing, and the IRRs by renter.computeMetricsGradient, which solves them once. The
+    sell year is an integer and has no derivative, sweep it instead.
+
+    Return the probability-weighted (irr, irrWithNoSunkCost, equityMultiple,
+    equityMultipleWithNoSunkCost), as the outcome functions, and a dict from parameter to the
+    derivatives of the four metrics.
+"""
+def outcomeSensitivities(tenantName, structure, *args, **kwargs):
+    parameters = kwargs.get('parameters', SENSITIVITY_PARAMETERS)
+    buildCashFlows = cashflow.TENANT_CASH_FLOWS[tenantName][structure]
+    tenant = kwargs.get('tenant') or cashflow.getBuilderTenant(buildCashFlows)
+    probs, flows, years, lead = getRowFlows(buildRows(buildCashFlows, args, tenant))
+
+    dFlows = np.empty((len(parameters),) + flows.shape)
+    for p, parameter in enumerate(parameters):
+        value = getParameterValue(parameter, tenant, args)
+        step = SENSITIVITY_STEP*(abs(value) or 1.0)
+        up = getRowFlows(buildRows(buildCashFlows, args, tenant, parameter, value + step))[1]
+        down = getRowFlows(buildRows(buildCashFlows, args, tenant, parameter, value - step))[1]
+        dFlows[p] = (up - down)/(2*step)
+    metrics, gradient = renter.computeMetricsGradient(flows, years, lead, dFlows)
+    values = tuple(float(value) for value in np.dot(probs, metrics))
+    weighted = np.tensordot(probs, gradient, axes=1)
+    return values, dict((parameter, tuple(float(d) for d in weighted[:, p])) for p, parameter in enumerate(parameters))
+
+"""
+    function: getTornado
+    ====================
+    Return the first-order change of a metric of sweep.METRICS for a bump of every parameter,
+    e.g. getTornado('zara', 'lenderA', (5, 0.055), {'capRate': 0.005, 'annualIncrease': 0.01}),
+    as a list of (parameter, change) by decreasing absolute change.
+"""
+def getTornado(tenantName, structure, args, bumps, metric='irr'):
+    values, gradient = outcomeSensitivities(tenantName, structure, *args, parameters=tuple(bumps))
+    m = sweep.METRICS.index(metric)
+    changes = [(parameter, gradient[parameter][m]*bump) for parameter, bump in bumps.items()]
+    return sorted(changes, key=lambda change: -abs(change[1]))
@@ -0,0 +1,315 @@
+import argparse
+import json
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from collections import deque
+from itertools import product
+from timeit import default_timer
+from urlparse import parse_qs, urlparse
+import numpy as np
+import cache
+import cashflow
+import renter
+import sweep
+
+SERVICE_HOST = '127.0.0.1' # the service only listens on localhost
+SERVICE_PORT = 8765
+SERVICE_CACHE_SIZE = 10000 # responses kept in memory
+SERVICE_LATENCY_WINDOW = 10000 # latest requests the latency percentiles are computed on
+SERVICE_POOL_MIN_CELLS = 256 # sweeps with at least this many cells go to the worker pool
+SERVICE_CHUNK_SIZE = 128 # sweep cells per worker task
+
+SERVICE_CACHE = cache.LRUCache('service', SERVICE_CACHE_SIZE)
+
+# Outcome functions of cashflow.py by name, the only functions the service runs
+SERVICE_OUTCOMES = dict((outcome.__name__, outcome) for outcome in cashflow.OUTCOME_CASH_FLOWS)
+
+"""
+    function: evaluateChunk
+    =======================
+    Worker pool task: evaluate the cells of a sweep on a private Renter built from spec, so the
+    module renters of the worker are never touched (see runner.runChunk).
+"""
+def evaluateChunk(task):
+    outcomeName, spec, cellArgs = task
+    return sweep.evaluateCells(cashflow.OUTCOME_CASH_FLOWS[SERVICE_OUTCOMES[outcomeName]], cellArgs, renter.Renter(*spec))
+
+"""
+    function: getOutcome
+    ====================
+    Return the outcome function of a request by name. Raise ValueError for any other name.
+"""
+def getOutcome(name):
+    if name not in SERVICE_OUTCOMES: raise ValueError("unknown outcome %r" % (name,))
+    return SERVICE_OUTCOMES[name]
+
+"""
+    function: getScenarioArgs
+    =========================
+    Convert the JSON arguments of an outcome function: the years are integers and the last
+    argument is the cap rate.
+"""
+def getScenarioArgs(outcome, args):
+    parameterCount = sweep.getParameterCount(cashflow.OUTCOME_CASH_FLOWS[outcome])
+    if not isinstance(args, list) or len(args) != parameterCount:
+        raise ValueError("%s expects %d arguments" % (outcome.__name__, parameterCount))
+    return tuple(int(v) for v in args[:-1]) + (float(args[-1]),)
+
+def getMetrics(values):
+    return dict((metric, None if value != value else float(value)) for metric, value in zip(sweep.METRICS, values))
+
+"""
+    class: PendingResult
+    ====================
+    class PendingResult is the result of a computation in flight, which every request for the
+    same key waits on instead of computing it again.
+"""
+class PendingResult(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+    def setValue(self, value):
+        self.value = value
+        self.event.set()
+
+    def setError(self, error):
+        self.error = error
+        self.event.set()
+
+    def wait(self):
+        self.event.wait()
+        if self.error is not None: raise self.error
+        return self.value
+
+"""
+    class: ScenarioService
+    ======================
+    class ScenarioService answers outcome and sweep queries. A repeated query is served from
+    SERVICE_CACHE, identical concurrent queries are computed once (request coalescing) and
+    sweeps of at least SERVICE_POOL_MIN_CELLS cells are split across a worker pool.
+    This class requires 1 optional input
+
+    1. processes                   Worker processes for large sweeps (default: one per core, 1 for no pool)
+
+    The outcome functions set the term and cap rate of the module renters, so the computations
+    of this process run one at a time; the worker pool builds its own renters.
+"""
+class ScenarioService(object):
+
+    def __init__(self, processes=None):
+        self.lock = threading.Lock()
+        self.computeLock = threading.Lock()
+        self.inflight = {}
+        self.latencies = deque(maxlen=SERVICE_LATENCY_WINDOW)
+        self.finished = deque(maxlen=SERVICE_LATENCY_WINDOW)
+        self.counts = {'requests': 0, 'errors': 0, 'cacheHits': 0, 'coalesced': 0, 'computed': 0, 'pooled': 0}
+        self.started = default_timer()
+        self.pool = None
+        if processes != 1:
+            import multiprocessing
+            self.pool = multiprocessing.Pool(processes)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+    """
+        class function: query
+        =====================
+        Return the cached value of key, wait for the computation of key in flight, or call
+        compute and cache its value.
+    """
+    def query(self, key, compute):
+        with self.lock:
+            value = SERVICE_CACHE.get(key, cache.CACHE_MISS)
+            if value is not cache.CACHE_MISS:
+                self.counts['cacheHits'] += 1
+                return value
+            pending = self.inflight.get(key)
+            isOwner = pending is None
+            if isOwner: pending = self.inflight[key] = PendingResult()
+            else: self.counts['coalesced'] += 1
+        if not isOwner: return pending.wait()
+        try:
+            value = compute()
+        except Exception as e:
+            with self.lock: del self.inflight[key]
+            pending.setError(e)
+            raise
+        with self.lock:
+            SERVICE_CACHE.put(key, value)
+            del self.inflight[key]
+            self.counts['computed'] += 1
+        pending.setValue(value)
+        return value
+
+    """
+        class function: getOutcome
+        ==========================
+        Answer {"outcome": "zaraLenderAOutcome", "args": [5, 0.055]} with the metrics of the
+        outcome function.
+    """
+    def getOutcome(self, request):
+        outcome = getOutcome(request.get('outcome'))
+        args = getScenarioArgs(outcome, request.get('args'))
+        def compute():
+            with self.computeLock:
+                return getMetrics(outcome(*args))
+        result = self.query(('outcome', outcome.__name__, args, cashflow.getAssumptions()), compute)
+        return dict(result, outcome=outcome.__name__, args=list(args))
+
+    """
+        class function: getSweep
+        ========================
+        Answer {"outcome": ..., "sellYears": [...], "capRates": [...], "renterExitYears": [...]}
+        (renterExitYears only for Topshop) with the axes and the nested metric values of
+        sweep.sweep, null where a cell cannot be evaluated.
+    """
+    def getSweep(self, request):
+        outcome = getOutcome(request.get('outcome'))
+        axes = [('sell_year', [int(v) for v in request.get('sellYears', [])]),
+                ('capRate', [float(v) for v in request.get('capRates', [])])]
+        if request.get('renterExitYears') is not None:
+            axes = [('renter_exit_year', [int(v) for v in request['renterExitYears']])] + axes
+        if sweep.getParameterCount(cashflow.OUTCOME_CASH_FLOWS[outcome]) != len(axes):
+            raise ValueError("%s expects %d axes" % (outcome.__name__, sweep.getParameterCount(cashflow.OUTCOME_CASH_FLOWS[outcome])))
+        key = ('sweep', outcome.__name__, tuple((name, tuple(values)) for name, values in axes), cashflow.getAssumptions())
+        result = self.query(key, lambda: self.computeSweep(outcome, axes))
+        return {'outcome': outcome.__name__, 'axes': [[name, values] for name, values in axes], 'metrics': list(sweep.METRICS),
+                'values': np.where(np.isnan(result), None, result).tolist()}
+
+    def computeSweep(self, outcome, axes):
+        shape = tuple(len(values) for _, values in axes)
+        cellArgs = list(product(*[values for _, values in axes]))
+        if self.pool is None or len(cellArgs) < SERVICE_POOL_MIN_CELLS:
+            axisValues = dict(axes)
+            with self.computeLock:
+                return sweep.sweep(outcome, axisValues['sell_year'], axisValues['capRate'], axisValues.get('renter_exit_year')).getValues()
+        spec = cashflow.getBuilderTenant(cashflow.OUTCOME_CASH_FLOWS[outcome]).getInputs()
+        tasks = [(outcome.__name__, spec, cellArgs[start:start + SERVICE_CHUNK_SIZE])
+                 for start in xrange(0, len(cellArgs), SERVICE_CHUNK_SIZE)]
+        with self.lock: self.counts['pooled'] += 1
+        return np.concatenate(self.pool.map(evaluateChunk, tasks)).reshape(shape + (len(sweep.METRICS),))
+
+    def recordRequest(self, latency, isError):
+        with self.lock:
+            self.counts['requests'] += 1
+            if isError: self.counts['errors'] += 1
+            self.latencies.append(latency)
+            self.finished.append(default_timer())
+
+    """
+        class function: getStats
+        ========================
+        Return the request counts, the p50/p99/mean latency (in millisecond) of the latest
+        SERVICE_LATENCY_WINDOW requests, the throughput since start and over that window (in
+        requests per second) and the cache statistics.
+    """
+    def getStats(self):
+        with self.lock:
+            latencies = np.array(self.latencies)*1e3
+            finished = list(self.finished)
+            stats = dict(self.counts)
+        uptime = default_timer() - self.started
+        stats['uptime'] = uptime
+        stats['throughput'] = stats['requests']/uptime if uptime > 0 else 0.0
+        window = finished[-1] - finished[0] if len(finished) > 1 else 0.0
+        stats['windowThroughput'] = (len(finished) - 1)/window if window > 0 else 0.0
+        stats['latencyMs'] = {'p50': float(np.percentile(latencies, 50)) if len(latencies) else None,
+                              'p99': float(np.percentile(latencies, 99)) if len(latencies) else None,
+                              'mean': float(latencies.mean()) if len(latencies) else None}
+        stats['cache'] = SERVICE_CACHE.getStats()
+        return stats
+
+"""
+    class: ServiceHandler
+    =====================
+    class ServiceHandler maps the HTTP/JSON endpoints to the ScenarioService of its server:
+
+        POST /outcome   {"outcome": "zaraLenderAOutcome", "args": [5, 0.055]}
+        GET  /outcome?outcome=zaraLenderAOutcome&args=[5,0.055]
+        POST /sweep     {"outcome": ..., "sellYears": [...], "capRates": [...], "renterExitYears": [...]}
+        GET  /stats
+"""
+class ServiceHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/stats': return self.respond(self.server.service.getStats, timed=False)
+        self.route(url.path, lambda: dict((name, json.loads(values[-1]) if name == 'args' else values[-1])
+                                          for name, values in parse_qs(url.query).items()))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.getheader('content-length', 0)))
+        self.route(urlparse(self.path).path, lambda: json.loads(body or '{}'))
+
+    """
+        class function: route
+        =====================
+        Answer the endpoint of path with the request returned by getRequest, which parses it.
+    """
+    def route(self, path, getRequest):
+        service = self.server.service
+        routes = {'/outcome': service.getOutcome, '/sweep': service.getSweep}
+        if path not in routes: return self.sendJson(404, {'error': 'unknown endpoint %s' % path})
+        self.respond(lambda: routes[path](getRequest()))
+
+    def respond(self, handle, timed=True):
+        start = default_timer()
+        try:
+            status, body = 200, handle()
+        except Exception as e:
+            status, body = 400, {'error': str(e)}
+        self.sendJson(status, body)
+        if timed: self.server.service.recordRequest(default_timer() - start, status != 200)
+
+    def sendJson(self, status, body):
+        text = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+
+    def log_message(self, format, *args): pass
+
+class ServiceServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        HTTPServer.__init__(self, address, ServiceHandler)
+        self.service = service
+
+"""
+    function: serve
+    ===============
+    Start the service on localhost and serve until interrupted.
+"""
+def serve(port=SERVICE_PORT, processes=None):
+    service = ScenarioService(processes)
+    server = ServiceServer((SERVICE_HOST, port), service)
+    print "Serving on http://%s:%d" % (SERVICE_HOST, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+"""
+    Usage:
+
+        python service.py [-p 8765] [-j 4]
+"""
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local scenario query service')
+    parser.add_argument('-p', '--port', type=int, default=SERVICE_PORT)
+    parser.add_argument('-j', '--processes', type=int, default=None, help='worker processes for large sweeps')
+    args = parser.parse_args()
+    serve(args.port, args.processes)
@@ -0,0 +1,195 @@
+from collections import namedtuple
+from timeit import default_timer
+import numpy as np
+import aggregate
+import cashflow
+import loan
+import renter
+import sweep
+import tenantbook
+from data import renterData
+
+PATH_CHUNK_SIZE = 4096 # paths held in memory at once
+PATH_FACTORS = ('capRate', 'rentGrowth', 'opexGrowth') # order of the rows and columns of the correlation
+
+# Path Assumption on the market
+CAP_RATE_VOLATILITY = 0.004 # annual standard deviation of the cap rate (decimal)
+CAP_RATE_REVERSION = 0.25 # share of the gap to the scenario cap rate closed every year
+CAP_RATE_FLOOR = 0.01 # lowest exit cap rate a path can reach
+RENT_GROWTH_VOLATILITY = 0.01 # annual standard deviation of the rent escalation around the lease's annualIncrease
+OPEX_GROWTH_VOLATILITY = 0.01 # annual standard deviation of the operating expense growth around OPERATING_EXPENSE_INCREASE_RATE
+PATH_CORRELATION = ((1.0, -0.4, 0.0),
+                    (-0.4, 1.0, 0.5),
+                    (0.0, 0.5, 1.0))
+
+"""
+    class: PathModel
+    ================
+    class PathModel holds the parameters of the joint yearly paths of the exit cap rate, the
+    rent escalation and the operating expense growth.
+    This class requires 5 inputs
+
+    1. capRateVolatility           Annual standard deviation of the cap rate (decimal)
+    2. capRateReversion            Share of the gap to the scenario cap rate closed every year
+    3. rentGrowthVolatility        Annual standard deviation of the rent escalation (decimal)
+    4. opexGrowthVolatility        Annual standard deviation of the operating expense growth (decimal)
+    5. correlation                 Correlation of the yearly shocks, in the order of PATH_FACTORS
+"""
+class PathModel(namedtuple('PathModel', ['capRateVolatility', 'capRateReversion', 'rentGrowthVolatility',
+                                         'opexGrowthVolatility', 'correlation'])):
+    __slots__ = ()
+
+DEFAULT_PATH_MODEL = PathModel(CAP_RATE_VOLATILITY, CAP_RATE_REVERSION, RENT_GROWTH_VOLATILITY,
+                               OPEX_GROWTH_VOLATILITY, PATH_CORRELATION)
+
+"""
+    function: generatePaths
+    =======================
+    Draw n joint paths over horizon years. The shocks of a year are correlated standard normals
+    (Cholesky factor of model.correlation), independent across years. Return a dict of
+
+    capRate = cap rate at the start of every year (n, horizon + 1), starting at capRate and
+              reverting to it, floored at CAP_RATE_FLOOR
+    rentGrowth = change of the rent escalation of every lease anniversary (n, horizon),
+                 added to the annualIncrease of the lease
+    opexGrowth = growth of the operating expense of every year (n, horizon)
+
+    The normals are drawn path after path, so the same randomState and horizon give the same
+    paths whatever the chunk size.
+"""
+def generatePaths(randomState, n, horizon, capRate, model=DEFAULT_PATH_MODEL):
+    shocks = np.dot(randomState.standard_normal((n, horizon, len(PATH_FACTORS))), np.linalg.cholesky(model.correlation).T)
+    capRates = np.empty((n, horizon + 1))
+    capRates[:, 0] = capRate
+    for year in xrange(horizon):
+        capRates[:, year + 1] = np.maximum(capRates[:, year] + model.capRateReversion*(capRate - capRates[:, year])
+                                           + model.capRateVolatility*shocks[:, year, 0], CAP_RATE_FLOOR)
+    return {'capRate': capRates,
+            'rentGrowth': model.rentGrowthVolatility*shocks[:, :, 1],
+            'opexGrowth': renter.OPERATING_EXPENSE_INCREASE_RATE + model.opexGrowthVolatility*shocks[:, :, 2]}
+
+"""
+    function: computePathSchedules
+    ==============================
+    renter.computeScheduleArrays for one tenant along n paths: the rent and the leasing
+    commission grow by annualIncrease + rentGrowth at every anniversary, the operating expense
+    by opexGrowth every year. As a named tenant reimburses the operating expense, its growth
+    only reaches the NOI of a Renter named None.
+    Return the cashFlowBeforeDebtService and netOperatingIncome arrays of shape (n, term).
+"""
+def computePathSchedules(tenant, rentGrowth, opexGrowth):
+    name, initialRentPerSqm, term, annualIncrease, isGuarantee, abatement, ti, capRate = tenant.getInputs()
+    n = len(rentGrowth)
+    rentIndex, expenseIndex = np.ones((n, term)), np.ones((n, term))
+    rentIndex[:, 1:] = np.cumprod(1 + annualIncrease + rentGrowth[:, :term - 1], axis=1)
+    expenseIndex[:, 1:] = np.cumprod(1 + opexGrowth[:, :term - 1], axis=1)
+    initialAnnualRent = initialRentPerSqm*renter.TOTAL_AREA
+    baseRentalRevenue = initialAnnualRent*rentIndex
+    scheduleBaseRentalRevenue = baseRentalRevenue.copy()
+    scheduleBaseRentalRevenue[:, 0] -= abatement/12.0*initialAnnualRent
+    operatingExpense = renter.INITIAL_OPERATING_EXPENSE*expenseIndex
+    expenseReimburseRevenue = operatingExpense if name is not None else 0.0
+    netOperatingIncome = scheduleBaseRentalRevenue + expenseReimburseRevenue - operatingExpense
+    totalLeasingAndCapitalCost = renter.TOTAL_AREA*renter.CAPITAL_RESERVE_RATE + renter.LEASING_COMMISSION_RATE*baseRentalRevenue
+    totalLeasingAndCapitalCost[:, 0] += ti*renter.TOTAL_AREA
+    return netOperatingIncome - totalLeasingAndCapitalCost, netOperatingIncome
+
+"""
+    function: getPathTenants
+    ========================
+    Return (tenantName, Renter) pairs of private copies of the module renters, with Topshop
+    leaving after renterExitYear, the term of its data.renterData record by default (the outcome
+    functions change the term of the module instance). Topshop sold after it leaves goes through the
+    vacancy branch, which montecarlo.simulate covers, so it is rejected here.
+"""
+def getPathTenants(tenants, sellYear, renterExitYear=None):
+    pathTenants = []
+    for tenantName in tenants:
+        tenant = renter.Renter(*getattr(cashflow, tenantName).getInputs())
+        if tenantName == 'topshop':
+            tenant.setTerm(renterData['Topshop']['term']//12 if renterExitYear is None else renterExitYear)
+            if sellYear > tenant.getTerm():
+                raise ValueError("topshop must be sold by its exit year, see montecarlo.simulate for the vacancy branch")
+        pathTenants.append((tenantName, tenant))
+    return pathTenants
+
+"""
+    function: evaluatePaths
+    =======================
+    Evaluate every tenant and financing structure on the same draws of generatePaths, each path
+    sold at sellYear at its own cap rate. Return a dict from (tenantName, structure) to an array
+    with one row of sweep.METRICS per path, nan when the structure cannot exit in sellYear.
+"""
+def evaluatePaths(draws, pathTenants, structures, sellYear):
+    n = len(draws['capRate'])
+    exitCapRate = draws['capRate'][:, sellYear]
+    values = {}
+    for tenantName, tenant in pathTenants:
+        term = tenant.getTerm()
+        width = max(sellYear, term) + 1
+        cashFlowBeforeDebtService, netOperatingIncome = np.zeros((n, width)), np.zeros((n, width))
+        cashFlowBeforeDebtService[:, :term], netOperatingIncome[:, :term] = computePathSchedules(tenant, draws['rentGrowth'], draws['opexGrowth'])
+        years = renter.getYearFractions(renter.getTransactionDates(renter.FIRST_TRANSACTION_DATE, width))
+        lead = (renter.FIRST_TRANSACTION_DATE - renter.SUNK_COST_DATES[0]).days / 365.0
+        for structure in structures:
+            try:
+                flows = tenantbook.getHeldCashFlows(cashFlowBeforeDebtService, netOperatingIncome, term, structure, sellYear, exitCapRate)
+            except loan.ExitLockoutError:
+                values[(tenantName, structure)] = np.full((n, len(sweep.METRICS)), np.nan)
+                continue
+            values[(tenantName, structure)] = renter.computeMetrics(flows, years, lead)
+    return values
+
+"""
+    function: simulatePathChunks
+    ============================
+    Generator behind simulatePaths, yielding one (draws, values) pair per chunk of at most
+    chunkSize paths (see generatePaths and evaluatePaths), so that any number of paths runs in
+    bounded memory.
+"""
+def simulatePathChunks(sellYear, paths, seed=None, capRate=cashflow.CAP_RATE, renterExitYear=None,
+                       tenants=('topshop', 'zara', 'decathlon'), structures=cashflow.STRUCTURES,
+                       model=DEFAULT_PATH_MODEL, chunkSize=PATH_CHUNK_SIZE):
+    pathTenants = getPathTenants(tenants, sellYear, renterExitYear)
+    horizon = max([sellYear] + [tenant.getTerm() for _, tenant in pathTenants])
+    randomState = np.random.RandomState(seed)
+    for start in xrange(0, paths, chunkSize):
+        draws = generatePaths(randomState, min(chunkSize, paths - start), horizon, capRate, model)
+        yield draws, evaluatePaths(draws, pathTenants, structures, sellYear)
+
+"""
+    function: simulatePaths
+    =======================
+    Evaluate every tenant and financing structure under joint random paths of the exit cap
+    rate, the rent escalation and the operating expense growth (see generatePaths). This
+    function requires two input variables.
+
+    sellYear = the year the building is sold
+    paths = number of paths
+    seed = seed of the random generator, the same seed gives the same paths
+    capRate = scenario cap rate, the start and the mean of the cap rate paths
+    renterExitYear = the year Topshop leaves, after sellYear (default: its lease term in data.renterData)
+    tenants = tenants of cashflow.TENANT_CASH_FLOWS
+    structures = financing structures of cashflow.STRUCTURES
+    model = PathModel
+    chunkSize = paths held in memory at once
+    stats = dict updated with paths, seconds and pathsPerSecond
+
+    With every volatility at 0, every path gives the outcome functions of cashflow.py at
+    (sellYear, capRate). Return a dict from (tenantName, structure) to the
+    aggregate.StreamingSummary of its sweep.METRICS.
+"""
+def simulatePaths(sellYear, paths, seed=None, capRate=cashflow.CAP_RATE, renterExitYear=None,
+                  tenants=('topshop', 'zara', 'decathlon'), structures=cashflow.STRUCTURES,
+                  model=DEFAULT_PATH_MODEL, chunkSize=PATH_CHUNK_SIZE, stats=None):
+    start = default_timer()
+    summaries = {}
+    for _, values in simulatePathChunks(sellYear, paths, seed, capRate, renterExitYear, tenants, structures, model, chunkSize):
+        for combination, combinationValues in values.items():
+            summaries.setdefault(combination, aggregate.StreamingSummary()).add(combinationValues)
+    if stats is not None:
+        seconds = default_timer() - start
+        stats['paths'] = stats.get('paths', 0) + paths
+        stats['seconds'] = stats.get('seconds', 0.0) + seconds
+        stats['pathsPerSecond'] = stats['paths']/stats['seconds'] if stats['seconds'] > 0 else 0.0
+    return summaries
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import sqlite3
+import numpy as np
+import cashflow
+
+# File names inside a store directory
+STORE_INDEX_FILE = 'index.sqlite'
+STORE_BLOCK_FILE = 'block-%06d.npy'
+STORE_QUERY_SIZE = 500 # keys per index query, SQLite limits the parameters of a query
+
+"""
+    function: getScenarioKey
+    ========================
+    Return the hex digest identifying one scenario: the cash flow builder, the inputs of the
+    renter it runs on, the module assumptions it depends on (see cashflow.getScenarioAssumptions)
+    and the scenario arguments. Changing any of them gives a new key, so a stored result is
+    never stale.
+"""
+def getScenarioKey(buildCashFlows, tenantInputs, assumptions, args):
+    return hashlib.sha1(repr((buildCashFlows.__name__, tenantInputs, assumptions, tuple(args)))).hexdigest()
+
+"""
+    class: ResultStore
+    ==================
+    class ResultStore is a persistent table of scenario metrics on disk. Results are appended
+    as .npy blocks, one per put, and an SQLite index maps every scenario key to its block and
+    row. Blocks are read through memory mapping, so loading a large grid parses nothing.
+    This class requires 1 input
+
+    1. directory                   Directory of the store, created if it does not exist
+"""
+class ResultStore(object):
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory): os.makedirs(directory)
+        self.connection = sqlite3.connect(os.path.join(directory, STORE_INDEX_FILE))
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, block INTEGER, row INTEGER)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS blocks (block INTEGER PRIMARY KEY, rows INTEGER)')
+        self.connection.commit()
+        self.blocks = {}
+        self.hits = 0
+        self.misses = 0
+
+    """ GET FUNCTIONS """
+    def getDirectory(self): return self.directory
+    def getStats(self):
+        size = self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        blocks = self.connection.execute('SELECT COUNT(*) FROM blocks').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'size': size, 'blocks': blocks}
+
+    """
+        class function: getBlock
+        ========================
+        Return the memory-mapped array of a block, opened once per store.
+    """
+    def getBlock(self, block):
+        if block not in self.blocks:
+            self.blocks[block] = np.load(os.path.join(self.directory, STORE_BLOCK_FILE % block), mmap_mode='r')
+        return self.blocks[block]
+
+    """
+        class function: get
+        ===================
+        Look up a list of scenario keys. Return the array of their values (nan rows where
+        missing, width columns) and the boolean array of the keys found.
+    """
+    def get(self, keys, width):
+        values = np.full((len(keys), width), np.nan)
+        found = np.zeros(len(keys), dtype=bool)
+        positions = {}
+        for cell, key in enumerate(keys): positions.setdefault(key, []).append(cell)
+        located = {}
+        uniqueKeys = list(positions)
+        for start in xrange(0, len(uniqueKeys), STORE_QUERY_SIZE):
+            chunk = uniqueKeys[start:start + STORE_QUERY_SIZE]
+            query = 'SELECT key, block, row FROM results WHERE key IN (%s)' % ','.join('?'*len(chunk))
+            for key, block, row in self.connection.execute(query, chunk):
+                cells, rows = located.setdefault(block, ([], []))
+                cells += positions[key]
+                rows += [row]*len(positions[key])
+        for block, (cells, rows) in located.items():
+            values[cells] = self.getBlock(block)[rows]
+            found[cells] = True
+        self.hits += int(found.sum())
+        self.misses += int((~found).sum())
+        return values, found
+
+    """
+        class function: put
+        ===================
+        Append the values of a list of scenario keys as a new block. Keys already in the store
+        point to the new block afterwards.
+    """
+    def put(self, keys, values):
+        if len(keys) == 0: return
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        block = (self.connection.execute('SELECT MAX(block) FROM blocks').fetchone()[0] or 0) + 1
+        path = os.path.join(self.directory, STORE_BLOCK_FILE % block)
+        # the block is complete on disk before the index points to it
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, values)
+        os.rename(path + '.tmp', path)
+        with self.connection:
+            self.connection.execute('INSERT INTO blocks VALUES (?, ?)', (block, len(keys)))
+            self.connection.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                                        [(key, block, row) for row, key in enumerate(keys)])
+
+    def close(self):
+        self.blocks.clear()
+        self.connection.close()
+
+"""
+    function: getCellKeys
+    =====================
+    Return the scenario keys of a list of argument tuples of a cash flow builder, on tenant or
+    on the module instance the builder uses by default. The inputs of the tenant are those of
+    each scenario (see cashflow.getScenarioTenantInputs), not those it holds when called.
+"""
+def getCellKeys(buildCashFlows, cellArgs, tenant=None):
+    if tenant is None: tenant = cashflow.getBuilderTenant(buildCashFlows)
+    return [getScenarioKey(buildCashFlows, cashflow.getScenarioTenantInputs(buildCashFlows, args, tenant),
+                           cashflow.getScenarioAssumptions(buildCashFlows, args), args)
+            for args in cellArgs]
@@ -0,0 +1,207 @@
+from itertools import product
+import numpy as np
+import cashflow
+import loan
+import renter
+
+METRICS = ('irr', 'irrWithNoSunkCost', 'equityMultiple', 'equityMultipleWithNoSunkCost')
+
+"""
+    class: SweepResult
+    ==================
+    class SweepResult is a labeled N-D array of outcome metrics returned by sweep.
+    This class requires 2 inputs and 1 optional
+
+    1. axes                        List of (axis name, axis values), e.g. [('sell_year', [4, 5]), ('capRate', [0.05, 0.06])]
+    2. values                      Array of shape (len(axis 1), len(axis 2), ..., len(METRICS))
+    3. solverStats                 IRR solver statistics of the sweep (see renter.computeMetrics), None when not collected
+
+    Cells that cannot be evaluated (e.g. Lender B with a sell year below 4, see buildCells) are nan.
+"""
+class SweepResult(object):
+
+    def __init__(self, axes, values, solverStats=None):
+        self.axes = axes
+        self.values = values
+        self.solverStats = solverStats
+
+    """ GET FUNCTIONS """
+    def getAxes(self): return self.axes
+    def getAxisNames(self): return [name for name, _ in self.axes]
+    def getValues(self): return self.values
+    def getMetric(self, metric): return self.values[..., METRICS.index(metric)]
+    def getSolverStats(self): return self.solverStats
+
+    """
+        class function: getOutcome
+        ==========================
+        Return the (irr, irrWithNoSunkCost, equityMultiple, equityMultipleWithNoSunkCost)
+        tuple of a single cell given its coordinates by axis name, e.g. getOutcome(sell_year=5, capRate=0.055)
+    """
+    def getOutcome(self, **coords):
+        index = tuple(list(values).index(coords[name]) for name, values in self.axes)
+        return tuple(self.values[index])
+
+"""
+    function: buildCells
+    ====================
+    Call a cash flow builder of cashflow.py (see cashflow.OUTCOME_CASH_FLOWS) on a list of
+    argument tuples. tenant is passed on to the builder when given.
+    Return the weighted cash flow rows of every cell, None for the cells the loan cannot exit
+    (see loan.ExitLockoutError) and the Topshop cells sold after the lease of the future tenant
+    ends (see cashflow.FutureTermError).
+"""
+def buildCells(buildCashFlows, cellArgs, tenant=None):
+    cellRows = []
+    for args in cellArgs:
+        try:
+            if tenant is None: cellRows.append(buildCashFlows(*args))
+            else: cellRows.append(buildCashFlows(*args, tenant=tenant))
+        except (loan.ExitLockoutError, cashflow.FutureTermError):
+            cellRows.append(None)
+    return cellRows
+
+"""
+    function: solveCells
+    ====================
+    Compute the probability-weighted metrics of cells given their weighted cash flow rows (see
+    buildCells). Identical rows are shared between cells (the cap rate often does not reach the
+    cash flow) and all IRRs are solved in a single batch.
+
+    With continuation, the IRRs are solved by renter.xirrContinuation along the cap rate: one
+    chain per line of cells sharing all their arguments but the last one, the cap rate of
+    cellArgs, and per row position within the cells (e.g. per vacancy length), by increasing
+    cap rate, so that each solve can start from the roots at the previous cap rates, extrapolated.
+    Without cellArgs, no two cells are chained. It pays on dense cap rate axes, a handful of
+    cap rates leaves too few previous roots. solverStats is passed on to renter.computeMetrics.
+
+    Return an array of shape (len(cellRows), len(METRICS)), nan for the cells that are None.
+"""
+def solveCells(cellRows, continuation=False, solverStats=None, cellArgs=None):
+    rowIndex = {}
+    cashFlows, transactionDates = [], []
+    cells, rows, probs = [], [], []
+    chains = {}
+    values = np.full((len(cellRows), len(METRICS)), np.nan)
+    failed = np.array([weightedCashFlows is None for weightedCashFlows in cellRows], dtype=bool)
+    for cell, weightedCashFlows in enumerate(cellRows):
+        if weightedCashFlows is None: continue
+        for position, (prob, cashFlow, transactionDate) in enumerate(weightedCashFlows):
+            key = (tuple(cashFlow), None if transactionDate is None else tuple(transactionDate))
+            if key not in rowIndex:
+                rowIndex[key] = len(cashFlows)
+                line = (cell,) if cellArgs is None else tuple(cellArgs[cell][:-1])
+                chains.setdefault((line, position), []).append((0.0 if cellArgs is None else cellArgs[cell][-1], len(cashFlows)))
+                cashFlows.append(cashFlow)
+                transactionDates.append(transactionDate)
+            cells.append(cell)
+            rows.append(rowIndex[key])
+            probs.append(prob)
+
+    if cashFlows:
+        chains = [sorted(chain) for chain in chains.values()] if continuation else None
+        metrics = renter.computeMetricsBatch(cashFlows, transactionDates, chains, solverStats)
+        probs = np.asarray(probs)
+        for m in xrange(len(METRICS)):
+            values[:, m] = np.bincount(cells, weights=probs*metrics[rows, m], minlength=len(cellRows))
+        values[failed] = np.nan
+    return values
+
+"""
+    function: evaluateCells
+    =======================
+    Evaluate a cash flow builder of cashflow.py on a list of argument tuples with buildCells
+    and solveCells. tenant is passed on to the builder when given, continuation and solverStats
+    to solveCells, which chains the cells along their last argument, the cap rate.
+
+    When a store.ResultStore is given, the cells it holds are read from it and only the others
+    are computed and then added to it.
+
+    Return an array of shape (len(cellArgs), len(METRICS)), nan for the cells buildCells leaves out.
+"""
+def evaluateCells(buildCashFlows, cellArgs, tenant=None, continuation=False, solverStats=None, store=None):
+    if store is None:
+        return solveCells(buildCells(buildCashFlows, cellArgs, tenant), continuation, solverStats, cellArgs)
+    from store import getCellKeys
+    keys = getCellKeys(buildCashFlows, cellArgs, tenant)
+    values, found = store.get(keys, len(METRICS))
+    missing = np.flatnonzero(~found)
+    if missing.size:
+        missingArgs = [cellArgs[cell] for cell in missing]
+        values[missing] = solveCells(buildCells(buildCashFlows, missingArgs, tenant), continuation, solverStats, missingArgs)
+        store.put([keys[cell] for cell in missing], values[missing])
+    return values
+
+"""
+    function: getParameterCount
+    ===========================
+    Return the number of scenario parameters of a cash flow builder, not counting its optional tenant.
+"""
+def getParameterCount(buildCashFlows):
+    return buildCashFlows.__code__.co_argcount - len(buildCashFlows.__defaults__ or ())
+
+"""
+    function: sweep
+    ===============
+    Evaluate an outcome function of cashflow.py over a whole grid with evaluateCells. This function
+    requires three input variables and four optional.
+
+    outcome = any *Outcome function of cashflow.py, e.g. cashflow.zaraLenderAOutcome
+    sellYears = values of sell_year
+    capRates = values of capRate
+    renterExitYears = values of renter_exit_year (only for the Topshop outcome functions)
+    continuation = True to solve the IRRs by continuation along the cap rate (see solveCells)
+    store = store.ResultStore the cells are read from and added to, so that a re-run only
+            computes the cells whose inputs changed
+    solverStats = dict updated with the IRR solver statistics (see renter.computeMetrics), also
+                  available from SweepResult.getSolverStats. None collects nothing, which
+                  spares the cold solves behind the saved estimate of a continuation sweep
+
+    Unlike the outcome functions, sweep does not call setCapRate on the shared renter instances.
+"""
+def sweep(outcome, sellYears, capRates, renterExitYears=None, continuation=False, store=None, solverStats=None):
+    buildCashFlows = cashflow.OUTCOME_CASH_FLOWS[outcome]
+    axes = [('sell_year', list(sellYears)), ('capRate', list(capRates))]
+    if renterExitYears is not None:
+        axes = [('renter_exit_year', list(renterExitYears))] + axes
+    if getParameterCount(buildCashFlows) != len(axes):
+        raise ValueError("%s expects %d parameters" % (outcome.__name__, getParameterCount(buildCashFlows)))
+
+    shape = tuple(len(values) for _, values in axes)
+    values = evaluateCells(buildCashFlows, list(product(*[values for _, values in axes])), continuation=continuation,
+                           solverStats=solverStats, store=store)
+    return SweepResult(axes, values.reshape(shape + (len(METRICS),)), solverStats)
+
+"""
+    function: evaluateStructures
+    ============================
+    Evaluate every financing structure of a tenant (see cashflow.TENANT_CASH_FLOWS) on a list of
+    argument tuples at once. The renter schedules are computed once, the vacancy and re-leasing
+    branch of Topshop is shared through cashflow.FUTURE_TENANT_CASH_FLOW_CACHE and the IRRs of
+    all structures are solved in a single batch, with rows shared between structures.
+
+    tenantName = 'topshop', 'zara' or 'decathlon'
+    cellArgs = argument tuples of the tenant's outcome functions, e.g. [(sell_year, capRate), ...]
+    tenant = Renter used instead of the module instance
+
+    Return a dict of arrays of shape (len(cellArgs), len(METRICS)) by structure, nan for the cells
+    buildCells leaves out (e.g. Lender B with a sell year below 4).
+"""
+def evaluateStructures(tenantName, cellArgs, tenant=None):
+    builders = cashflow.TENANT_CASH_FLOWS[tenantName]
+    cellRows = []
+    for structure in cashflow.STRUCTURES:
+        cellRows += buildCells(builders[structure], cellArgs, tenant)
+    values = solveCells(cellRows)
+    return dict((structure, values[i*len(cellArgs):(i + 1)*len(cellArgs)]) for i, structure in enumerate(cashflow.STRUCTURES))
+
+"""
+    function: getStructureOutcomes
+    ==============================
+    Single scenario version of evaluateStructures, e.g. getStructureOutcomes('zara', 5, 0.055).
+    Return a dict of (irr, irrWithNoSunkCost, equityMultiple, equityMultipleWithNoSunkCost)
+    tuples by structure, as the outcome functions return them.
+"""
+def getStructureOutcomes(tenantName, *args):
+    values = evaluateStructures(tenantName, [args])
+    return dict((structure, tuple(values[structure][0])) for structure in cashflow.STRUCTURES)
@@ -0,0 +1,238 @@
+import csv
+import json
+import numpy as np
+import loan
+import renter
+from data import renterData
+
+# Columns of a tenant book, with the keys and units of data.renterData records
+TENANT_BOOK_FIELDS = (
+    ('totalSqm', np.float64),          # leased area (in sqm)
+    ('initialRentPerSqm', np.float64), # initial rent (in euro per sqm)
+    ('term', np.int64),                # lease term (in month, a whole number of years)
+    ('annualIncrease', np.float64),    # annual rent escalation (decimal)
+    ('abatement', np.int64),           # free rent at the start of the lease (in month)
+    ('TI', np.float64),                # tenant improvement (in euro per sqm)
+    ('isGuaranteed', np.bool_)         # True if the tenant guarantees to complete the term
+)
+
+CSV_TRUE_VALUES = ('1', 'true', 'yes', 'y', 't')
+CSV_FALSE_VALUES = ('0', 'false', 'no', 'n', 'f', '')
+
+"""
+    class: TenantBook
+    =================
+    class TenantBook holds many candidate tenants as a struct of arrays, one contiguous array
+    per field of TENANT_BOOK_FIELDS, so batch engines read whole columns instead of building
+    one Renter per tenant. Use loadTenantBook to build one.
+    This class requires 2 inputs
+
+    1. names                       Tenant names, one per tenant
+    2. columns                     Dict of arrays by field of TENANT_BOOK_FIELDS, one value per tenant
+"""
+class TenantBook(object):
+
+    def __init__(self, names, columns):
+        self.names = list(names)
+        self.columns = dict((field, np.ascontiguousarray(columns[field], dtype=dtype)) for field, dtype in TENANT_BOOK_FIELDS)
+        for array in self.columns.values(): array.flags.writeable = False
+        self.positions = dict((name, i) for i, name in enumerate(self.names))
+
+    def __len__(self): return len(self.names)
+
+    """ GET FUNCTIONS """
+    def getNames(self): return self.names
+    def getColumn(self, field): return self.columns[field]
+    def getTermYears(self): return self.columns['term']//12
+    def getIndex(self, name): return self.positions[name]
+
+    """
+        class function: getRecord
+        =========================
+        Return the tenant at a position (or of a name) as a data.renterData-shaped record.
+    """
+    def getRecord(self, tenant):
+        i = self.positions[tenant] if isinstance(tenant, basestring) else tenant
+        return dict((field, self.columns[field][i].item()) for field, _ in TENANT_BOOK_FIELDS)
+
+    """
+        class function: getRenter
+        =========================
+        Build the Renter of a single tenant, by position or name, for the scalar code paths.
+    """
+    def getRenter(self, tenant, capRate, renterClass=renter.Renter):
+        i = self.positions[tenant] if isinstance(tenant, basestring) else tenant
+        return renter.getRecordRenter(self.names[i], self.getRecord(i), capRate, renterClass)
+
+    """
+        class function: select
+        ======================
+        Return a new TenantBook of the tenants at the given positions or boolean mask.
+    """
+    def select(self, indices):
+        indices = np.flatnonzero(indices) if np.asarray(indices).dtype == np.bool_ else np.asarray(indices, dtype=np.int64)
+        return TenantBook([self.names[i] for i in indices], dict((field, array[indices]) for field, array in self.columns.items()))
+
+"""
+    function: validateRecord
+    ========================
+    Check a data.renterData-shaped record and return its values converted to the types of
+    TENANT_BOOK_FIELDS. Raise ValueError naming the tenant and the field on a missing or
+    invalid value.
+"""
+def validateRecord(name, record):
+    values = {}
+    for field, dtype in TENANT_BOOK_FIELDS:
+        if field not in record: raise ValueError("tenant %s: missing %s" % (name, field))
+        value = record[field]
+        try:
+            if dtype is np.bool_:
+                if isinstance(value, basestring):
+                    if value.strip().lower() not in CSV_TRUE_VALUES + CSV_FALSE_VALUES: raise ValueError()
+                    value = value.strip().lower() in CSV_TRUE_VALUES
+                value = bool(value)
+            else:
+                value = float(value)
+                if not np.isfinite(value): raise ValueError()
+                if dtype is np.int64:
+                    if value != int(value): raise ValueError()
+                    value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError("tenant %s: invalid %s %r" % (name, field, record[field]))
+        values[field] = value
+    if values['totalSqm'] <= 0: raise ValueError("tenant %s: totalSqm must be positive" % name)
+    if values['initialRentPerSqm'] < 0: raise ValueError("tenant %s: initialRentPerSqm must not be negative" % name)
+    if values['term'] < 12 or values['term'] % 12: raise ValueError("tenant %s: term must be a whole number of years (in month)" % name)
+    if values['annualIncrease'] <= -1: raise ValueError("tenant %s: annualIncrease must be above -1" % name)
+    if not 0 <= values['abatement'] <= values['term']: raise ValueError("tenant %s: abatement must be within the term" % name)
+    if values['TI'] < 0: raise ValueError("tenant %s: TI must not be negative" % name)
+    return values
+
+"""
+    function: loadRecords
+    =====================
+    Build a TenantBook from records shaped like data.renterData: either a dict of records by
+    tenant name, or a list of records that carry their name under 'name'. Extra keys (e.g. the
+    reference IRR and equityMultiple of renterData) are ignored.
+"""
+def loadRecords(records):
+    if isinstance(records, dict): records = [dict(record, name=name) for name, record in sorted(records.items())]
+    names = []
+    columns = dict((field, []) for field, _ in TENANT_BOOK_FIELDS)
+    for i, record in enumerate(records):
+        name = record.get('name', 'tenant %d' % i)
+        values = validateRecord(name, record)
+        names.append(name)
+        for field, _ in TENANT_BOOK_FIELDS: columns[field].append(values[field])
+    return TenantBook(names, columns)
+
+def loadCsv(path):
+    with open(path, 'rb') as f:
+        return loadRecords(list(csv.DictReader(f)))
+
+def loadJson(path):
+    with open(path) as f:
+        return loadRecords(json.load(f))
+
+"""
+    function: loadTenantBook
+    ========================
+    Load a TenantBook from a dict or list of records, or from a .csv or .json file of records
+    (see loadRecords). A CSV file has a header with the fields of TENANT_BOOK_FIELDS and a
+    name column. The three tenants of data.renterData are loaded by default.
+"""
+def loadTenantBook(source=None):
+    if source is None: source = renterData
+    if not isinstance(source, basestring): return loadRecords(source)
+    if source.lower().endswith('.csv'): return loadCsv(source)
+    if source.lower().endswith('.json'): return loadJson(source)
+    raise ValueError("unknown tenant book format: %s" % source)
+
+"""
+    function: computeBookSchedules
+    ==============================
+    Compute the schedules of every tenant of a book with renter.computeScheduleArrays, one call
+    per distinct lease term. Return a list of (positions, schedules) by term, in increasing term.
+"""
+def computeBookSchedules(book):
+    termYears = book.getTermYears()
+    groups = []
+    for term in np.unique(termYears):
+        positions = np.flatnonzero(termYears == term)
+        groups.append((positions, renter.computeScheduleArrays(book.getColumn('initialRentPerSqm')[positions], int(term),
+                                                               book.getColumn('annualIncrease')[positions],
+                                                               book.getColumn('abatement')[positions],
+                                                               book.getColumn('TI')[positions],
+                                                               totalSqm=book.getColumn('totalSqm')[positions])))
+    return groups
+
+"""
+    function: getBookCashFlows
+    ==========================
+    Build the yearly cash flow of every tenant of a book held to its lease, as the Zara and
+    Decathlon cash flow builders of cashflow.py do on a single Renter. This function requires
+    four input variables.
+
+    book = TenantBook
+    structure = 'unleveraged', 'lenderA' or 'lenderB' (see cashflow.STRUCTURES)
+    sellYear = The beginning of the year that sells the building
+    capRate = capital rate at the exit
+
+    Return an array with one zero-padded row per tenant, from July 2015.
+"""
+def getBookCashFlows(book, structure, sellYear, capRate):
+    width = max(sellYear, book.getTermYears().max()) + 1
+    cashFlowBeforeDebtService = np.zeros((len(book), width))
+    netOperatingIncome = np.zeros((len(book), width))
+    for positions, schedules in computeBookSchedules(book):
+        term = schedules['cashFlowBeforeDebtService'].shape[1]
+        cashFlowBeforeDebtService[positions, :term] = schedules['cashFlowBeforeDebtService']
+        netOperatingIncome[positions, :term] = schedules['netOperatingIncome']
+    return getHeldCashFlows(cashFlowBeforeDebtService, netOperatingIncome, book.getTermYears(), structure, sellYear, capRate)
+
+"""
+    function: getHeldCashFlows
+    ==========================
+    Build the cash flows of getBookCashFlows from schedules already laid out as zero-padded
+    rows, with termYears the lease term of every row. capRate is a number or one per row.
+"""
+def getHeldCashFlows(cashFlowBeforeDebtService, netOperatingIncome, termYears, structure, sellYear, capRate):
+    n, width = cashFlowBeforeDebtService.shape
+    termYears = np.broadcast_to(termYears, (n,))
+    rows = np.arange(n)
+    salePrice = netOperatingIncome[rows, np.minimum(sellYear, termYears - 1)]/capRate
+
+    if structure == 'unleveraged':
+        # renter.getCashFlowUnleveraged: no sale when the building is held past the lease
+        flows = np.zeros((n, width))
+        sold = sellYear <= termYears
+        flows[sold, :sellYear] = cashFlowBeforeDebtService[sold, :sellYear]
+        flows[sold, sellYear] = salePrice[sold]
+        flows[~sold] = cashFlowBeforeDebtService[~sold]
+        flows[:, 0] -= renter.PURCHASE_PRICE
+        return flows
+    spec = renter.getLenderSpec({'lenderA': 'A', 'lenderB': 'B'}[structure])
+    flows = np.zeros((n, width))
+    flows[:, :sellYear + 1] = loan.getFinancingFlows(spec, sellYear)
+    flows[:, :sellYear] += cashFlowBeforeDebtService[:, :sellYear]
+    flows[:, sellYear] += salePrice
+    return flows
+
+"""
+    function: evaluateBook
+    ======================
+    Compute the (irr, irrWithNoSunkCost, equityMultiple, equityMultipleWithNoSunkCost) of every
+    tenant of a book for one financing structure and exit with renter.computeMetrics, without
+    building a Renter per tenant (see getBookCashFlows for the inputs).
+
+    Return an array of shape (len(book), 4), nan when the structure cannot exit in sellYear
+    (e.g. Lender B with a sell year below 4).
+"""
+def evaluateBook(book, structure, sellYear, capRate):
+    try:
+        flows = getBookCashFlows(book, structure, sellYear, capRate)
+    except loan.ExitLockoutError:
+        return np.full((len(book), 4), np.nan)
+    years = renter.getYearFractions(renter.getTransactionDates(renter.FIRST_TRANSACTION_DATE, flows.shape[1]))
+    lead = (renter.FIRST_TRANSACTION_DATE - renter.SUNK_COST_DATES[0]).days / 365.0
+    return renter.computeMetrics(flows, years, lead)